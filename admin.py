@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from schedule_store import decode_schedule
+from server_keys import KeyRing
+from server_lock import StoreLock
+
+# Verwaltung des Token-Speichers (user_data/) auf dem Server.
+#
+# Entschlüsselt wird wie in server.py (decrypt_data), aber parallel in einem
+# Prozess-Pool; Ergebnisse werden ausgegeben, sobald ein Block fertig ist.
+#
+#   python admin.py list [--json]
+#   python admin.py count
+#   python admin.py validate
+#   python admin.py purge [--dry-run] [--invalid]
+#   python admin.py stats [--json]
+
+DATA_DIR = "user_data"
+KEYS_DIR = "keys"
+SECRET_KEY_FILE = "secret.key"
+DEFAULT_EXPIRY_DAYS = 30  # wie ICAL_EXPIRY_DAYS in server.py
+FEED_SUFFIX = ".feed"
+BATCH_SIZE = 256
+
+STATUS_OK = "ok"
+STATUS_EXPIRED = "expired"
+STATUS_INVALID = "invalid"
+
+_keyring = None
+
+def _init_worker(keys_dir, legacy_key_file):
+    global _keyring
+    _keyring = KeyRing.load(keys_dir, legacy_key_file, create=False)
+
+def inspect_file(path, now):
+    """Entschlüsselt und prüft eine .dat-Datei, liefert ein Dict mit den Kennzahlen"""
+    token = os.path.basename(path)[:-len(".dat")]
+    info = {"token": token, "path": path, "status": STATUS_INVALID, "size": 0, "mtime": None,
+            "format": None, "entries": 0, "created_at": None, "expires_at": None,
+            "first": None, "last": None, "error": None}
+    try:
+        stat = os.stat(path)
+        info["size"], info["mtime"] = stat.st_size, stat.st_mtime
+        with open(path, "rb") as f:
+            schedule = decode_schedule(_keyring.decrypt(f.read()))
+        dienste = schedule["dienste"]
+        if not isinstance(dienste, list):
+            raise ValueError(f"Dienste sind keine Liste ({type(dienste).__name__})")
+        created_at = schedule["created_at"] if schedule["created_at"] is not None else stat.st_mtime
+        expiry_days = schedule["expiry_days"] if schedule["expiry_days"] is not None else DEFAULT_EXPIRY_DAYS
+        dates = [d.get("datum") for d in dienste if isinstance(d, dict) and d.get("datum")]
+        info.update(
+            format=schedule["format"], entries=len(dienste), created_at=created_at,
+            expires_at=created_at + expiry_days * 24 * 60 * 60,
+            first=min(dates) if dates else None, last=max(dates) if dates else None,
+        )
+        info["status"] = STATUS_EXPIRED if now > info["expires_at"] else STATUS_OK
+    except Exception as e:
+        info["error"] = f"{type(e).__name__}: {e}"
+    return info
+
+def inspect_batch(paths, now):
+    return [inspect_file(path, now) for path in paths]
+
+def iter_batches(data_dir, batch_size=BATCH_SIZE):
+    """Pfade aller .dat-Dateien in Blöcken, ohne das Verzeichnis vorher komplett zu lesen"""
+    batch = []
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(".dat") and entry.is_file():
+                batch.append(entry.path)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+def scan(args):
+    """
+    Prüft alle Einträge parallel
+
+    Yields:
+        Info-Dicts (siehe inspect_file), blockweise sobald fertig
+    """
+    now = time.time()
+    batches = iter_batches(args.data_dir)
+    with ProcessPoolExecutor(
+        max_workers=args.workers, initializer=_init_worker, initargs=(args.keys_dir, args.legacy_key)
+    ) as executor:
+        # Nur begrenzt viele Blöcke gleichzeitig einreichen, damit der Speicher konstant bleibt
+        pending = []
+        for batch in batches:
+            pending.append(executor.submit(inspect_batch, batch, now))
+            if len(pending) >= args.workers * 4:
+                yield from pending.pop(0).result()
+        for future in pending:
+            yield from future.result()
+
+def format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp)) if timestamp else "-"
+
+def cmd_list(args, out):
+    if not args.json:
+        out.write("token\tstatus\tformat\teintraege\tbytes\terstellt\tlaeuft_ab\tvon\tbis\n")
+    for info in scan(args):
+        if args.json:
+            out.write(json.dumps({k: v for k, v in info.items() if k != "path"}) + "\n")
+        else:
+            out.write("\t".join(str(v) for v in (
+                info["token"], info["status"], info["format"] if info["format"] is not None else "-",
+                info["entries"], info["size"], format_time(info["created_at"]), format_time(info["expires_at"]),
+                info["first"] or "-", info["last"] or "-"
+            )) + "\n")
+        out.flush()
+    return 0
+
+def cmd_count(args, out):
+    counts = {STATUS_OK: 0, STATUS_EXPIRED: 0, STATUS_INVALID: 0}
+    for info in scan(args):
+        counts[info["status"]] += 1
+    out.write(f"gesamt\t{sum(counts.values())}\n")
+    for status, count in counts.items():
+        out.write(f"{status}\t{count}\n")
+    return 0
+
+def cmd_validate(args, out):
+    checked = failed = 0
+    for info in scan(args):
+        checked += 1
+        if info["status"] == STATUS_INVALID:
+            failed += 1
+            out.write(f"{info['token']}\t{info['error']}\n")
+            out.flush()
+    out.write(f"{checked} geprüft, {failed} fehlerhaft\n")
+    return 1 if failed else 0
+
+def cmd_purge(args, out):
+    statuses = {STATUS_EXPIRED, STATUS_INVALID} if args.invalid else {STATUS_EXPIRED}
+    removed = freed = 0
+    # Gleiche Sperre wie der Server, damit kein gerade hochgeladener Eintrag gelöscht wird
+    store_lock = StoreLock(args.data_dir)
+    for info in scan(args):
+        if info["status"] not in statuses:
+            continue
+        try:
+            with store_lock:
+                # Nicht löschen, wenn der Eintrag seit der Prüfung neu geschrieben wurde
+                if os.stat(info["path"]).st_mtime != info["mtime"]:
+                    out.write(f"{info['token']}\tübersprungen (geändert)\n")
+                    continue
+                if not args.dry_run:
+                    os.remove(info["path"])
+                    feed = info["path"][:-len(".dat")] + FEED_SUFFIX
+                    if os.path.exists(feed):
+                        os.remove(feed)
+        except OSError as e:
+            out.write(f"{info['token']}\tFehler: {e}\n")
+            continue
+        removed += 1
+        freed += info["size"]
+        out.write(f"{info['token']}\t{info['status']}\t{'würde gelöscht' if args.dry_run else 'gelöscht'}\n")
+        out.flush()
+    out.write(f"{removed} Einträge {'würden gelöscht' if args.dry_run else 'gelöscht'}, {freed} Bytes\n")
+    return 0
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def cmd_stats(args, out):
+    now = time.time()
+    statuses = {}
+    formats = {}
+    entries, sizes, ages = [], [], []
+    for info in scan(args):
+        statuses[info["status"]] = statuses.get(info["status"], 0) + 1
+        sizes.append(info["size"])
+        if info["status"] == STATUS_INVALID:
+            continue
+        fmt = str(info["format"])
+        formats[fmt] = formats.get(fmt, 0) + 1
+        entries.append(info["entries"])
+        ages.append((now - info["created_at"]) / 86400)
+    entries.sort()
+    sizes.sort()
+    ages.sort()
+
+    def summary(values):
+        return {
+            "min": values[0] if values else None, "p50": percentile(values, 0.5),
+            "p90": percentile(values, 0.9), "p99": percentile(values, 0.99),
+            "max": values[-1] if values else None,
+        }
+
+    stats = {
+        "tokens": len(sizes), "bytes": sum(sizes), "status": statuses, "formats": formats,
+        "entries_per_token": summary(entries), "bytes_per_token": summary(sizes), "age_days": summary(ages),
+    }
+    if args.json:
+        out.write(json.dumps(stats, indent=2) + "\n")
+        return 0
+    out.write(f"Tokens: {stats['tokens']}, Bytes: {stats['bytes']}\n")
+    out.write("Status: " + ", ".join(f"{k}={v}" for k, v in statuses.items()) + "\n")
+    out.write("Formate: " + ", ".join(f"v{k}={v}" for k, v in formats.items()) + "\n")
+    for label, key in (("Einträge/Token", "entries_per_token"), ("Bytes/Token", "bytes_per_token"), ("Alter (Tage)", "age_days")):
+        values = stats[key]
+        out.write(f"{label}: " + ", ".join(
+            f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}" for k, v in values.items()
+        ) + "\n")
+    return 0
+
+COMMANDS = {"list": cmd_list, "count": cmd_count, "validate": cmd_validate, "purge": cmd_purge, "stats": cmd_stats}
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="VivSync Verwaltung des Token-Speichers")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--keys-dir", default=KEYS_DIR)
+    parser.add_argument("--legacy-key", default=SECRET_KEY_FILE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Anzahl Prozesse")
+    parser.add_argument("--json", action="store_true", help="Ausgabe als JSON (list, stats)")
+    parser.add_argument("--dry-run", action="store_true", help="purge: nur anzeigen")
+    parser.add_argument("--invalid", action="store_true", help="purge: auch unlesbare Einträge löschen")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        # Schlüssel vorab prüfen, damit Fehler nicht erst in jedem Prozess auftreten
+        KeyRing.load(args.keys_dir, args.legacy_key, create=False)
+    except (OSError, ValueError) as e:
+        print(f"FEHLER: Schlüssel nicht lesbar: {e}", file=sys.stderr)
+        return 2
+    try:
+        return COMMANDS[args.command](args, sys.stdout)
+    except BrokenPipeError:
+        # z.B. bei "admin.py list | head"
+        return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+import config
+
+# HTTP-Status, bei denen ein erneuter Versuch sinnvoll ist (429 mit Retry-After vom Server)
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+_connect_time = threading.local()  # Dauer von Verbindungsaufbau und TLS der laufenden Anfrage
+
+class _TimedConnectionMixin:
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            _connect_time.seconds = getattr(_connect_time, "seconds", 0.0) + time.perf_counter() - started
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter, der die Zeit für neue Verbindungen (TCP und TLS) misst"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool, "https": _TimedHTTPSConnectionPool
+        }
+
+def get_session():
+    """Liefert die gemeinsame Session mit Connection-Pool (Keep-Alive, TLS-Wiederverwendung)"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = TimedHTTPAdapter(pool_connections=2, pool_maxsize=4)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["User-Agent"] = "VivSync-Client"
+            _session = session
+        return _session
+
+def request_with_retries(method, url, session=None, **kwargs):
+    """
+    Führt eine HTTP-Anfrage mit Timeouts und begrenzten Wiederholungen aus
+    
+    Returns:
+        Tuple (response, timing) mit Zeiten pro Phase in Sekunden:
+        connect (Verbindungsaufbau inkl. TLS, 0 bei wiederverwendeter Verbindung),
+        wait (Senden bis Header der Antwort),
+        download (Body), backoff (Wartezeit zwischen Versuchen), total, attempts
+    """
+    session = session or get_session()
+    kwargs.setdefault("timeout", (config.API_CONNECT_TIMEOUT, config.API_READ_TIMEOUT))
+    timing = {"connect": 0.0, "wait": 0.0, "download": 0.0, "backoff": 0.0, "total": 0.0, "attempts": 0}
+    started = time.perf_counter()
+    
+    for attempt in range(config.API_MAX_RETRIES + 1):
+        timing["attempts"] = attempt + 1
+        _connect_time.seconds = 0.0
+        try:
+            response = session.request(method, url, stream=True, **kwargs)
+            headers_received = time.perf_counter()
+            response.content  # Body vollständig laden, um die Download-Zeit zu messen
+            finished = time.perf_counter()
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == config.API_MAX_RETRIES:
+                timing["total"] = time.perf_counter() - started
+                raise
+        else:
+            # elapsed reicht vom Senden bis zu den Headern und enthält einen neuen Verbindungsaufbau
+            timing["connect"] = _connect_time.seconds
+            timing["wait"] = max(0.0, response.elapsed.total_seconds() - _connect_time.seconds)
+            timing["download"] = finished - headers_received
+            retry_after = parse_retry_after(response)
+            if (response.status_code not in RETRY_STATUS_CODES or attempt == config.API_MAX_RETRIES
+                    or (retry_after or 0) > config.API_MAX_RETRY_AFTER):
+                timing["total"] = time.perf_counter() - started
+                return response, timing
+            response.close()
+            if retry_after is not None:
+                timing["backoff"] += retry_after
+                time.sleep(retry_after)
+                continue
+        
+        delay = config.API_BACKOFF_SECONDS * (2 ** attempt)
+        delay = random.uniform(delay / 2, delay * 1.5)
+        timing["backoff"] += delay
+        time.sleep(delay)
+
+def parse_retry_after(response):
+    """Wartezeit aus dem Retry-After-Header in Sekunden (nur Sekundenangabe), sonst None"""
+    try:
+        return max(0.0, float(response.headers["Retry-After"]))
+    except (KeyError, ValueError):
+        return None
+
+def format_timing(timing):
+    """Formatiert die Zeitmessung einer Anfrage für die Statusanzeige"""
+    return (f"{timing['total']:.2f}s gesamt (Verbindung {timing['connect']:.2f}s, "
+            f"Server {timing['wait']:.2f}s, Download {timing['download']:.2f}s, "
+            f"Wartezeit {timing['backoff']:.2f}s, Versuche {timing['attempts']})")
+
+def post_schedule(payload, username):
+    """Sendet die Dienste an den Sync-Server"""
+    return request_with_retries(
+        "POST",
+        config.API_URL,
+        json=payload,
+        headers={
+            "Content-Type": "application/json",
+            "X-Username": username
+        }
+    )
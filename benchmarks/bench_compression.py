@@ -0,0 +1,88 @@
+"""
+Benchmark für komprimierte Feed-Antworten
+
+Misst pro Anfrage die übertragenen Bytes und die CPU-Zeit für
+/calendar/<token> ohne Komprimierung sowie mit gzip und (falls installiert)
+brotli, jeweils mit zwischengespeicherten Varianten und mit Komprimierung bei
+jeder Anfrage. Der Server läuft über den Flask-Testclient in einem
+temporären Verzeichnis, Dienstpläne werden synthetisch erzeugt.
+
+Aufruf aus dem Projektverzeichnis:
+    python benchmarks/bench_compression.py [--shifts 60 400] [--requests 300]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+def synthetic_schedule(count, username):
+    today = date.today()
+    return [{
+        "datum": (today + timedelta(days=offset - count // 2)).isoformat(),
+        "dienst": ("F1", "S2", "N1")[offset % 3],
+        "position": "Station A" if offset % 4 else "",
+        "dienstzeit": ("06:00 - 14:00", "13:30 - 21:30", "21:30 - 06:30")[offset % 3],
+        "username": username,
+    } for offset in range(count)]
+
+def measure(client, url, accept_encoding, requests_count):
+    headers = {"Accept-Encoding": accept_encoding} if accept_encoding else {}
+    sizes = 0
+    cpu_started = time.process_time()
+    for _ in range(requests_count):
+        sizes += len(client.get(url, headers=headers).data)
+    cpu = time.process_time() - cpu_started
+    return sizes / requests_count, cpu / requests_count * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shifts", type=int, nargs="+", default=[60, 400])
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    # server.py legt user_data/, keys/ und logs/ im Arbeitsverzeichnis an
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="vivsync-bench-", ignore_cleanup_errors=True) as workdir:
+        os.chdir(workdir)
+        try:
+            run(args)
+        finally:
+            os.chdir(previous)
+
+def run(args):
+    import server
+    from server_cache import SignatureCache
+    from rate_limit import KeyedRateLimiter
+    server.app.logger.setLevel(logging.ERROR)
+    server.calendar_ip_limiter = KeyedRateLimiter(1e6, 1e6)
+    server.calendar_token_limiter = KeyedRateLimiter(1e6, 1e6)
+    server.sync_ip_limiter = KeyedRateLimiter(1e6, 1e6)
+    server.sync_token_limiter = KeyedRateLimiter(1e6, 1e6)
+    server.PRERENDER_ON_WRITE = False  # nur den dynamischen Pfad messen
+    client = server.app.test_client()
+    cached_encoded = server.encoded_cache
+
+    encodings = [("identity", "")] + [(e, e) for e in server.AVAILABLE_ENCODINGS if e != "identity"]
+    print(f"{'Dienste':>7} {'Kodierung':>9} {'Variante':>10} {'Bytes/Anfrage':>14} {'CPU ms/Anfrage':>15}")
+    for shifts in args.shifts:
+        username = f"bench{shifts}"
+        response = client.post("/api/sync", json={"dienste": synthetic_schedule(shifts, username), "expiry_days": 30})
+        token = response.get_json()["ical_url"].rsplit("/", 1)[1]
+        url = f"/calendar/{token}?past_days=all"
+        for name, accept in encodings:
+            for variant in ("cached", "uncached"):
+                # Ohne Cache wird der Feed bei jeder Anfrage kodiert (Render-Cache bleibt aktiv)
+                server.encoded_cache = cached_encoded if variant == "cached" else SignatureCache(0, "encoded")
+                client.get(url, headers={"Accept-Encoding": accept} if accept else {})
+                size, cpu_ms = measure(client, url, accept, args.requests)
+                print(f"{shifts:>7} {name:>9} {variant:>10} {size:>14.0f} {cpu_ms:>15.3f}")
+        server.encoded_cache = cached_encoded
+
+if __name__ == "__main__":
+    main()
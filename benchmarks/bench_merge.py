@@ -0,0 +1,100 @@
+"""
+Benchmark für das Zusammenführen hochgeladener Dienste mit der Historie (mode=merge)
+
+Vergleicht merge_schedules (sortierte Läufe, Binärsuche) mit einem naiven
+Neuaufbau über ein Dict und misst den gesamten Schreibpfad eines Uploads
+(entschlüsseln, dekodieren, zusammenführen, kodieren, verschlüsseln).
+
+Aufruf aus dem Projektverzeichnis:
+    python benchmarks/bench_merge.py [--years 1 3 10] [--repeat 200]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from schedule_store import encode_schedule, decode_schedule, merge_schedules
+
+CODES = ["F1", "F2", "S1", "S2", "N1", "N2", "FR", "U"]
+TIMES = ["06:00 - 14:00", "06:30 - 14:30", "13:30 - 21:30", "21:30 - 06:30", ""]
+POSITIONS = ["", "", "", "Station A", "Station B", "Praxisanleitung"]
+
+def synthetic_history(days, start, rng):
+    dienste = []
+    for offset in range(days):
+        if rng.random() < 0.75:
+            dienste.append({
+                "datum": (start + timedelta(days=offset)).isoformat(),
+                "dienst": rng.choice(CODES),
+                "position": rng.choice(POSITIONS),
+                "dienstzeit": rng.choice(TIMES),
+                "version": 0,
+            })
+    return dienste
+
+def upload_for(history, today, rng, change_rate=0.1):
+    """Aktueller und nächster Monat, ein Teil der Einträge geändert"""
+    month_start = today.replace(day=1)
+    end = (month_start + timedelta(days=62)).replace(day=1) - timedelta(days=1)
+    upload = []
+    for dienst in history:
+        if month_start.isoformat() <= dienst["datum"] <= end.isoformat():
+            entry = {k: v for k, v in dienst.items() if k != "version"}
+            if rng.random() < change_rate:
+                entry["dienst"] = rng.choice(CODES)
+            upload.append(entry)
+    return upload
+
+def naive_merge(stored, incoming):
+    by_date = {d["datum"]: d for d in stored}
+    if incoming:
+        first, last = min(d["datum"] for d in incoming), max(d["datum"] for d in incoming)
+        by_date = {k: v for k, v in by_date.items() if not first <= k <= last}
+    for d in incoming:
+        by_date[d["datum"]] = d
+    return sorted(by_date.values(), key=lambda d: d["datum"])
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 3, 10])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    fernet = Fernet(Fernet.generate_key())
+    today = date.today()
+    print(f"{'Jahre':>5} {'Dienste':>8} {'Upload':>6} {'merge ms':>9} {'naiv ms':>8} "
+          f"{'Schreibpfad ms':>15} {'Bytes':>8}")
+    for years in args.years:
+        days = years * 365
+        history = synthetic_history(days, today - timedelta(days=days - 45), rng)
+        upload = upload_for(history, today, rng)
+        blob = fernet.encrypt(encode_schedule(history, "bench", 30, time.time()))
+
+        merge_ms = timed(lambda: merge_schedules(history, upload), args.repeat)
+        naive_ms = timed(lambda: naive_merge(history, upload), args.repeat)
+
+        def write_path():
+            stored = decode_schedule(fernet.decrypt(blob))["dienste"]
+            merged, _ = merge_schedules(stored, upload)
+            return fernet.encrypt(encode_schedule(merged, "bench", 30, time.time()))
+
+        write_ms = timed(write_path, max(1, args.repeat // 10))
+        print(f"{years:>5} {len(history):>8} {len(upload):>6} {merge_ms:>9.3f} {naive_ms:>8.3f} "
+              f"{write_ms:>15.3f} {len(blob):>8}")
+
+if __name__ == "__main__":
+    main()
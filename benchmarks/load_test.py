@@ -0,0 +1,337 @@
+"""
+Lasttest für den Synchronisationsserver
+
+Erzeugt synthetische Benutzer und Dienstpläne in einem temporären
+Datenverzeichnis und treibt gemischte Lasten gegen die Flask-App, einmal über
+den Testclient (ohne Netzwerk) und einmal über einen echten lokalen Socket:
+
+    poll     Abrufe von /calendar/<token> bestehender Benutzer
+    sync     Uploads auf /api/sync
+    expired  Abrufe abgelaufener Tokens (410)
+    unknown  Abrufe unbekannter Tokens (404)
+    mixed    gewichtete Mischung der obigen
+
+Pro Konfiguration (Transport, Szenario, Servervariante) werden Durchsatz,
+Latenz-Perzentile, Statuscodes und Speicherverbrauch ausgegeben. Jede
+Konfiguration läuft auf einer frischen Kopie der Testdaten und mit leeren
+Caches, die vor der Messung einmal gefüllt werden (außer mit --no-warmup).
+
+Aufruf aus dem Projektverzeichnis:
+    python benchmarks/load_test.py [--users 2000] [--requests 3000] [--concurrency 8]
+        [--transport client socket] [--scenario poll sync expired unknown mixed]
+        [--variant default no-prerender no-cache] [--no-warmup] [--json]
+"""
+import argparse
+import gc
+import http.client
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+CODES = ["F1", "F2", "S1", "S2", "N1", "FR", "U"]
+TIMES = ["06:00 - 14:00", "13:30 - 21:30", "21:30 - 06:30", ""]
+MIXED_WEIGHTS = {"poll": 0.90, "sync": 0.02, "expired": 0.04, "unknown": 0.04}
+EXPIRED_SHARE = 0.1
+
+def synthetic_schedule(rng, username, days, start):
+    return [{
+        "datum": (start + timedelta(days=offset)).isoformat(),
+        "dienst": rng.choice(CODES),
+        "position": rng.choice(["", "", "Station A", "Station B"]),
+        "dienstzeit": rng.choice(TIMES),
+        "username": username,
+    } for offset in range(days) if rng.random() < 0.8]
+
+def populate(server, users, history_days, rng):
+    """
+    Legt Benutzer direkt im Datenverzeichnis an (schneller als über /api/sync)
+
+    Returns:
+        Tuple (aktive Tokens, abgelaufene Tokens, Benutzernamen)
+    """
+    from schedule_store import encode_schedule
+    start = date.today() - timedelta(days=history_days - 60)
+    active, expired, usernames = [], [], []
+    for i in range(users):
+        username = f"user{i:06d}"
+        token = server.generate_user_token(username)
+        is_expired = rng.random() < EXPIRED_SHARE
+        created_at = time.time() - (60 if is_expired else 1) * 86400
+        dienste = synthetic_schedule(rng, username, history_days, start)
+        with open(os.path.join(server.DATA_DIR, f"{token}.dat"), "wb") as f:
+            f.write(server.encrypt_bytes(encode_schedule(dienste, username, 30, created_at)))
+        (expired if is_expired else active).append(token)
+        if not is_expired:
+            usernames.append(username)
+            # Wie nach einem Upload über /api/sync
+            if server.PRERENDER_ON_WRITE:
+                server.prerender_feed(token)
+    return active, expired, usernames
+
+CACHE_LIMITS = {
+    "schedule_cache": "SCHEDULE_CACHE_BYTES",
+    "render_cache": "RENDER_CACHE_ENTRIES",
+    "prerender_cache": "PRERENDER_CACHE_ENTRIES",
+    "encoded_cache": "ENCODED_CACHE_ENTRIES",
+}
+
+def configure_run(server, variant, data_dir):
+    """Frische Caches, Datenverzeichnis und Vorrendern für eine Konfiguration"""
+    from server_cache import NegativeCache
+    from server_lock import StoreLock
+    server.DATA_DIR = data_dir
+    server.storage_stats.data_dir = data_dir
+    server.store_lock = StoreLock(data_dir)
+    server.missing_tokens = NegativeCache()
+    # Die Gauges in /metrics lesen die Caches über die Modulvariablen, sehen also die neuen Objekte
+    for name, limit in CACHE_LIMITS.items():
+        cache = getattr(server, name)
+        # Beide Cache-Arten nehmen (Obergrenze, Name); 0 schaltet den Cache ab
+        setattr(server, name, type(cache)(0 if variant == "no-cache" else getattr(server, limit), cache.name))
+    server.PRERENDER_ON_WRITE = variant != "no-prerender"
+
+class RequestPlan:
+    """Erzeugt die Anfragen eines Szenarios (Methode, Pfad, JSON-Body)"""
+
+    def __init__(self, rng, active, expired, usernames, history_days):
+        self.rng = rng
+        self.active = active
+        self.expired = expired
+        self.usernames = usernames
+        self.history_days = history_days
+        self._lock = threading.Lock()
+
+    def request(self, scenario):
+        with self._lock:
+            if scenario == "mixed":
+                scenario = self.rng.choices(list(MIXED_WEIGHTS), weights=list(MIXED_WEIGHTS.values()))[0]
+            if scenario == "poll":
+                return "GET", f"/calendar/{self.rng.choice(self.active)}", None
+            if scenario == "expired":
+                return "GET", f"/calendar/{self.rng.choice(self.expired)}", None
+            if scenario == "unknown":
+                return "GET", f"/calendar/{self.rng.getrandbits(64):016x}", None
+            username = self.rng.choice(self.usernames)
+            month_start = date.today().replace(day=1)
+            dienste = synthetic_schedule(self.rng, username, 62, month_start)
+        return "POST", "/api/sync", {"dienste": dienste, "expiry_days": 30, "mode": "merge"}
+
+class ClientTransport:
+    """Anfragen über den Flask-Testclient (ein Client pro Thread)"""
+
+    name = "client"
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def send(self, method, path, body):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body, headers={"Accept-Encoding": "gzip"})
+        response.get_data()
+        return response.status_code
+
+    def close(self):
+        pass
+
+class SocketTransport:
+    """Anfragen über einen echten lokalen HTTP-Server (werkzeug, threaded)"""
+
+    name = "socket"
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def send(self, method, path, body):
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+        try:
+            headers = {"Accept-Encoding": "gzip"}
+            data = None
+            if body is not None:
+                data = json.dumps(body).encode()
+                headers["Content-Type"] = "application/json"
+            connection.request(method, path, body=data, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    def close(self):
+        self.server.shutdown()
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def current_rss_mb():
+    """Aktueller (nicht maximaler) RSS des Prozesses, None ohne /proc"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+def run_load(transport, plan, scenario, requests_count, concurrency, trace_memory):
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker(count):
+        local_latencies = []
+        local_statuses = {}
+        for _ in range(count):
+            method, path, body = plan.request(scenario)
+            started = time.perf_counter()
+            try:
+                status = transport.send(method, path, body)
+            except Exception as e:
+                status = type(e).__name__
+            local_latencies.append(time.perf_counter() - started)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    per_worker = [requests_count // concurrency + (1 if i < requests_count % concurrency else 0)
+                  for i in range(concurrency)]
+    gc.collect()
+    rss_before = current_rss_mb()
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, per_worker))
+    elapsed = time.perf_counter() - started
+    peak_mb = None
+    if trace_memory:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    gc.collect()
+    rss_after = current_rss_mb()
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        "status": {str(k): v for k, v in sorted(statuses.items(), key=lambda item: str(item[0]))},
+        "traced_peak_mb": round(peak_mb, 1) if peak_mb is not None else None,
+        "rss_mb": round(rss_after, 1) if rss_after is not None else None,
+        "rss_delta_mb": round(rss_after - rss_before, 1) if rss_after is not None else None,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--history-days", type=int, default=180)
+    parser.add_argument("--requests", type=int, default=3000, help="Anfragen pro Konfiguration")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--transport", nargs="+", default=["client", "socket"], choices=["client", "socket"])
+    parser.add_argument("--scenario", nargs="+", default=["poll", "sync", "expired", "unknown", "mixed"],
+                        choices=["poll", "sync", "expired", "unknown", "mixed"])
+    parser.add_argument("--variant", nargs="+", default=["default"], choices=["default", "no-prerender", "no-cache"])
+    parser.add_argument("--no-warmup", action="store_true",
+                        help="Caches nicht vorab füllen (misst den Kaltstart mit)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Spitzenwert pro Konfiguration über tracemalloc (langsamer)")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="Ratenbegrenzung des Servers aktiv lassen")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Ergebnisse als JSON-Zeilen ausgeben")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    # server.py legt user_data/, keys/ und logs/ im Arbeitsverzeichnis an
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="vivsync-load-", ignore_cleanup_errors=True) as workdir:
+        os.chdir(workdir)
+        try:
+            run(args, workdir)
+        finally:
+            os.chdir(previous)
+
+def run(args, workdir):
+    rng = random.Random(args.seed)
+    import server
+    from rate_limit import KeyedRateLimiter
+    server.app.logger.setLevel(logging.ERROR)
+    if not args.keep_rate_limits:
+        unlimited = (1e9, 1e9)
+        server.calendar_ip_limiter = KeyedRateLimiter(*unlimited)
+        server.calendar_token_limiter = KeyedRateLimiter(*unlimited)
+        server.sync_ip_limiter = KeyedRateLimiter(*unlimited)
+        server.sync_token_limiter = KeyedRateLimiter(*unlimited)
+
+    # Testdaten einmal anlegen; jede Konfiguration arbeitet auf einer Kopie, da sync sie verändert
+    fixture_dir = os.path.join(workdir, "fixture")
+    os.makedirs(fixture_dir)
+    server.DATA_DIR = fixture_dir
+    started = time.perf_counter()
+    active, expired, usernames = populate(server, args.users, args.history_days, rng)
+    if not args.json:
+        print(f"{len(active)} aktive und {len(expired)} abgelaufene Benutzer in {workdir} "
+              f"angelegt ({time.perf_counter() - started:.1f}s)")
+
+    plan = RequestPlan(rng, active, expired, usernames, args.history_days)
+
+    if not args.json:
+        print(f"{'Transport':<9} {'Variante':<13} {'Szenario':<8} {'Anfr./s':>8} {'p50 ms':>7} "
+              f"{'p90 ms':>7} {'p99 ms':>7} {'max ms':>8} {'RSS MB':>7} {'Δ MB':>6}  Status")
+    for variant in args.variant:
+        for transport_name in args.transport:
+            transport = ClientTransport(server.app) if transport_name == "client" else SocketTransport(server.app)
+            try:
+                for scenario in args.scenario:
+                    run_dir = os.path.join(workdir, "run")
+                    shutil.copytree(fixture_dir, run_dir)
+                    configure_run(server, variant, run_dir)
+                    try:
+                        if not args.no_warmup:
+                            for token in active:
+                                transport.send("GET", f"/calendar/{token}", None)
+                        result = run_load(transport, plan, scenario, args.requests, args.concurrency,
+                                          args.trace_memory)
+                    finally:
+                        shutil.rmtree(run_dir)
+                    result.update(transport=transport_name, variant=variant, scenario=scenario)
+                    if args.json:
+                        print(json.dumps(result), flush=True)
+                        continue
+                    status = " ".join(f"{k}:{v}" for k, v in result["status"].items())
+                    if result["traced_peak_mb"] is not None:
+                        status += f" (Peak {result['traced_peak_mb']} MB)"
+                    print(f"{transport_name:<9} {variant:<13} {scenario:<8} {result['throughput']:>8.1f} "
+                          f"{result['p50_ms']:>7.2f} {result['p90_ms']:>7.2f} {result['p99_ms']:>7.2f} "
+                          f"{result['max_ms']:>8.2f} {result['rss_mb'] or 0:>7.1f} "
+                          f"{result['rss_delta_mb'] or 0:>+6.1f}  {status}", flush=True)
+            finally:
+                transport.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,73 +1,123 @@
 from googleapiclient.discovery import build
-from google.oauth2 import service_account
+from googleapiclient.errors import HttpError
 from oauth2client.service_account import ServiceAccountCredentials
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-import os
+import hashlib
+import json
+import random
+import time
+
+from rate_limit import TokenBucket
+from shift_events import shift_times
 
 # Konfiguration für Service Account
 P12_FILE = r"C:\Users\mrhal\Documents\Projekt Pep\viv-pep-key.p12"
 SERVICE_ACCOUNT_EMAIL = "viv-pep-syc@dienstplan-halbautomatisch.iam.gserviceaccount.com"
 
-def sync_to_calendar(dienste, calendar_id):
+# Parallele Synchronisation und Rate-Limits der Calendar API
+MAX_SYNC_WORKERS = 4
+API_REQUESTS_PER_SECOND = 5
+MAX_API_RETRIES = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 64.0
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
+# Felder, die synchronisiert und per Fingerabdruck verglichen werden
+FINGERPRINT_FIELDS = ('summary', 'description', 'start', 'end', 'transparency')
+FINGERPRINT_PROPERTY = 'vivsyncFingerprint'
+EVENT_TIMEZONE = 'Europe/Berlin'
+
+# Änderungsplan und Batch-Ausführung
+BATCH_SIZE = 50  # Google erlaubt bis zu 1000, kleinere Batches verteilen Rate-Limits besser
+PLAN_COUNTERS = {"create": "created", "update": "updated", "delete": "deleted"}
+
+def build_service():
+    """Erstellt einen Google Calendar API Client mit den Service-Account-Daten"""
+    credentials = ServiceAccountCredentials.from_p12_keyfile(
+        SERVICE_ACCOUNT_EMAIL,
+        P12_FILE,
+        scopes=['https://www.googleapis.com/auth/calendar'],
+        private_key_password='notasecret'
+    )
+    return build('calendar', 'v3', credentials=credentials)
+
+def is_rate_limit_error(error):
+    """Prüft, ob ein HttpError ein Rate-Limit (429 oder 403 rateLimitExceeded) meldet"""
+    status = getattr(error.resp, 'status', None)
+    if status == 429:
+        return True
+    if status != 403:
+        return False
+    try:
+        content = error.content.decode() if isinstance(error.content, bytes) else error.content
+        reasons = [e.get('reason') for e in json.loads(content).get('error', {}).get('errors', [])]
+    except (ValueError, AttributeError):
+        return False
+    return any(reason in RATE_LIMIT_REASONS for reason in reasons)
+
+def execute_request(request, rate_limiter=None):
+    """
+    Führt eine API-Anfrage aus, berücksichtigt das gemeinsame Rate-Limit und
+    wiederholt sie bei Rate-Limit-Fehlern mit exponentiellem Backoff
+    """
+    for attempt in range(MAX_API_RETRIES + 1):
+        if rate_limiter:
+            rate_limiter.acquire()
+        try:
+            return request.execute()
+        except HttpError as e:
+            if not is_rate_limit_error(e) or attempt == MAX_API_RETRIES:
+                raise
+            delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt))
+            delay += random.uniform(0, delay / 2)
+            print(f"Rate-Limit erreicht (HTTP {e.resp.status}), neuer Versuch in {delay:.1f}s")
+            if rate_limiter:
+                # Alle Worker bremsen, nicht nur den betroffenen
+                rate_limiter.pause(delay)
+            time.sleep(delay)
+
+def sync_to_calendar(dienste, calendar_id, service=None, rate_limiter=None, dry_run=False, batch_size=BATCH_SIZE):
     """
     Synchronisiert die extrahierten Dienste mit dem Google Kalender
     
     Args:
         dienste: Liste von Dienst-Dictionaries mit Datum, Dienst, Position und Dienstzeit
         calendar_id: ID des Google Kalenders
+        service: Optional bereits erstellter API Client
+        rate_limiter: Optional gemeinsamer TokenBucket für alle API-Aufrufe
+        dry_run: Nur den Änderungsplan berechnen, nichts schreiben
+        batch_size: Anzahl Änderungen pro Batch-Anfrage (1 = einzeln senden)
     
     Returns:
-        Dictionary mit Ergebnissen (erstellt, aktualisiert, gelöscht)
+        Dictionary mit Ergebnissen (erstellt, aktualisiert, gelöscht) bzw. dem Plan bei dry_run
     """
     print(f"Starte Synchronisation mit Kalender: {calendar_id}")
     
     try:
         # Google Calendar API initialisieren
-        credentials = ServiceAccountCredentials.from_p12_keyfile(
-            SERVICE_ACCOUNT_EMAIL,
-            P12_FILE,
-            scopes=['https://www.googleapis.com/auth/calendar'],
-            private_key_password='notasecret'
-        )
-        
-        service = build('calendar', 'v3', credentials=credentials)
+        if service is None:
+            service = build_service()
         
         # Bestehende Einträge mit [AutoSync] Tag abrufen
-        existing_events = get_existing_events(service, calendar_id)
+        existing_events = get_existing_events(service, calendar_id, rate_limiter)
         print(f"Gefundene bestehende Einträge: {len(existing_events)}")
         
-        # Zähler für Statistik
-        created = 0
-        updated = 0
-        deleted = 0
-        
-        # Dienste synchronisieren
-        for dienst in dienste:
-            event_id = find_matching_event(existing_events, dienst)
-            
-            if event_id:
-                # Eintrag existiert bereits, prüfen ob Update nötig
-                if update_needed(existing_events[event_id], dienst):
-                    update_event(service, calendar_id, event_id, dienst)
-                    updated += 1
-                # Eintrag aus der Liste entfernen, da er bearbeitet wurde
-                existing_events.pop(event_id, None)
-            else:
-                # Neuen Eintrag erstellen
-                create_event(service, calendar_id, dienst)
-                created += 1
+        plan = plan_changes(dienste, existing_events)
+        summary = summarize_plan(plan)
+        print(f"Geplante Änderungen: {summary}")
         
-        # Verbleibende Einträge löschen (nicht mehr im Dienstplan)
-        for event_id in existing_events:
-            delete_event(service, calendar_id, event_id)
-            deleted += 1
+        if dry_run:
+            return {
+                "status": "success",
+                "dry_run": True,
+                "plan": plan,
+                **summary
+            }
         
-        return {
-            "status": "success",
-            "created": created,
-            "updated": updated,
-            "deleted": deleted
-        }
+        result = apply_changes(service, calendar_id, plan, rate_limiter, batch_size)
+        result["status"] = "success" if not result["errors"] else "partial"
+        return result
     
     except Exception as e:
         print(f"Fehler bei der Kalendersynchronisation: {str(e)}")
@@ -76,7 +126,207 @@ def sync_to_calendar(dienste, calendar_id):
             "message": str(e)
         }
 
-def get_existing_events(service, calendar_id):
+def plan_changes(dienste, existing_events):
+    """
+    Berechnet ohne API-Zugriff, welche Einträge erstellt, aktualisiert oder gelöscht werden müssen
+    
+    Args:
+        dienste: Liste von Dienst-Dictionaries
+        existing_events: Dictionary event_id -> bestehender Eintrag
+    
+    Returns:
+        Liste von Änderungen mit action, datum, event_id, body und reason
+    """
+    # Bestehende Einträge einmal nach Datum indizieren statt pro Dienst zu suchen
+    events_by_date = {}
+    for event_id, event in existing_events.items():
+        events_by_date.setdefault(event_date(event), []).append(event_id)
+    
+    plan = []
+    matched = set()
+    for dienst in dienste:
+        candidates = events_by_date.get(dienst['datum'])
+        if candidates:
+            event_id = candidates.pop(0)
+            matched.add(event_id)
+            # Eintrag existiert bereits, nur geänderte Felder senden
+            patch = build_patch(existing_events[event_id], dienst)
+            if patch:
+                fields = [field for field in patch if field != 'extendedProperties']
+                reason = f"Geänderte Felder: {', '.join(fields)}" if fields else "Fingerabdruck fehlt"
+                plan.append({
+                    "action": "update",
+                    "datum": dienst['datum'],
+                    "event_id": event_id,
+                    "dienst": dienst,
+                    "body": patch,
+                    "reason": reason
+                })
+        else:
+            plan.append({
+                "action": "create",
+                "datum": dienst['datum'],
+                "event_id": None,
+                "dienst": dienst,
+                "body": build_insert_body(dienst),
+                "reason": "Kein Eintrag für dieses Datum vorhanden"
+            })
+    
+    # Verbleibende Einträge löschen (nicht mehr im Dienstplan oder doppelt)
+    dates = {dienst['datum'] for dienst in dienste}
+    for event_id, event in existing_events.items():
+        if event_id in matched:
+            continue
+        datum = event_date(event)
+        plan.append({
+            "action": "delete",
+            "datum": datum,
+            "event_id": event_id,
+            "dienst": None,
+            "body": None,
+            "reason": "Doppelter Eintrag für dieses Datum" if datum in dates else "Nicht mehr im Dienstplan"
+        })
+    
+    return plan
+
+def summarize_plan(plan):
+    """Zählt die geplanten Änderungen pro Aktion"""
+    summary = {"created": 0, "updated": 0, "deleted": 0}
+    for change in plan:
+        summary[PLAN_COUNTERS[change["action"]]] += 1
+    return summary
+
+def apply_changes(service, calendar_id, plan, rate_limiter=None, batch_size=BATCH_SIZE):
+    """
+    Wendet einen Änderungsplan an, bei batch_size > 1 gebündelt als Batch-Anfragen
+    
+    Returns:
+        Dictionary mit Zählern der erfolgreichen Änderungen und einer Fehlerliste
+    """
+    result = {"created": 0, "updated": 0, "deleted": 0, "errors": []}
+    
+    if batch_size <= 1:
+        for change in plan:
+            try:
+                if change["action"] == "create":
+                    create_event(service, calendar_id, change["dienst"], rate_limiter)
+                elif change["action"] == "update":
+                    update_event(service, calendar_id, change["event_id"], change["dienst"], change["body"], rate_limiter)
+                else:
+                    delete_event(service, calendar_id, change["event_id"], rate_limiter)
+                result[PLAN_COUNTERS[change["action"]]] += 1
+            except HttpError as e:
+                result["errors"].append({"change": change, "message": str(e)})
+        return result
+    
+    pending = list(plan)
+    for attempt in range(MAX_API_RETRIES + 1):
+        retry = []
+        for i in range(0, len(pending), batch_size):
+            for change, error in execute_batch(service, calendar_id, pending[i:i + batch_size], rate_limiter):
+                if error is None:
+                    result[PLAN_COUNTERS[change["action"]]] += 1
+                elif isinstance(error, HttpError) and is_rate_limit_error(error) and attempt < MAX_API_RETRIES:
+                    retry.append(change)
+                else:
+                    result["errors"].append({"change": change, "message": str(error)})
+        if not retry:
+            break
+        delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt))
+        delay += random.uniform(0, delay / 2)
+        print(f"{len(retry)} Änderungen durch Rate-Limit abgelehnt, neuer Versuch in {delay:.1f}s")
+        if rate_limiter:
+            rate_limiter.pause(delay)
+        time.sleep(delay)
+        pending = retry
+    
+    return result
+
+def execute_batch(service, calendar_id, changes, rate_limiter=None):
+    """Sendet mehrere Änderungen in einer Batch-Anfrage und liefert (change, fehler) Paare"""
+    outcomes = {}
+    
+    def callback(request_id, response, exception):
+        outcomes[int(request_id)] = exception
+    
+    batch = service.new_batch_http_request(callback=callback)
+    for index, change in enumerate(changes):
+        batch.add(change_request(service, calendar_id, change), request_id=str(index))
+        # Jede Teilanfrage zählt einzeln gegen das Kontingent
+        if rate_limiter:
+            rate_limiter.acquire()
+    
+    try:
+        batch.execute()
+    except HttpError as e:
+        return [(change, e) for change in changes]
+    
+    for index, change in enumerate(changes):
+        if outcomes.get(index) is None:
+            print(f"{change['action']} ausgeführt: {change['datum']} ({change['reason']})")
+    return [(change, outcomes.get(index)) for index, change in enumerate(changes)]
+
+def change_request(service, calendar_id, change):
+    """Erstellt die API-Anfrage für eine geplante Änderung"""
+    events = service.events()
+    if change["action"] == "create":
+        return events.insert(calendarId=calendar_id, body=change["body"])
+    if change["action"] == "update":
+        return events.patch(calendarId=calendar_id, eventId=change["event_id"], body=change["body"])
+    return events.delete(calendarId=calendar_id, eventId=change["event_id"])
+
+def sync_many_calendars(jobs, max_workers=MAX_SYNC_WORKERS, requests_per_second=API_REQUESTS_PER_SECOND):
+    """
+    Synchronisiert mehrere Kalender parallel über einen begrenzten Worker-Pool
+    
+    Args:
+        jobs: Liste von (dienste, calendar_id) Paaren
+        max_workers: Maximale Anzahl gleichzeitiger Synchronisationen
+        requests_per_second: Gemeinsames Limit für alle API-Aufrufe
+    
+    Returns:
+        Dictionary mit Ergebnissen pro Kalender und aufsummierten Zählern
+    """
+    rate_limiter = TokenBucket(requests_per_second)
+    
+    def run_job(dienste, calendar_id):
+        started = time.monotonic()
+        # Eigener API Client pro Job, da httplib2 nicht thread-sicher ist
+        try:
+            service = build_service()
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+        else:
+            result = sync_to_calendar(dienste, calendar_id, service=service, rate_limiter=rate_limiter)
+        result["duration"] = round(time.monotonic() - started, 3)
+        return result
+    
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(run_job, dienste, calendar_id): calendar_id
+            for dienste, calendar_id in jobs
+        }
+        for future in as_completed(futures):
+            calendar_id = futures[future]
+            results[calendar_id] = future.result()
+            print(f"Kalender {calendar_id} abgeschlossen: {results[calendar_id]['status']}")
+    
+    totals = {"created": 0, "updated": 0, "deleted": 0, "failed": 0}
+    for result in results.values():
+        if result["status"] in ("success", "partial"):
+            for key in ("created", "updated", "deleted"):
+                totals[key] += result[key]
+        else:
+            totals["failed"] += 1
+    
+    return {
+        "status": "success" if totals["failed"] == 0 else "partial",
+        "calendars": results,
+        "totals": totals
+    }
+
+def get_existing_events(service, calendar_id, rate_limiter=None):
     """Ruft alle bestehenden Einträge mit [AutoSync] Tag ab"""
     events = {}
     page_token = None
@@ -90,13 +340,13 @@ def get_existing_events(service, calendar_id):
         time_max = datetime(now.year, now.month + 1, 31).isoformat() + 'Z'
     
     while True:
-        events_result = service.events().list(
+        events_result = execute_request(service.events().list(
             calendarId=calendar_id,
             timeMin=time_min,
             timeMax=time_max,
             pageToken=page_token,
             q="[AutoSync]"  # Suche nach Tag im Titel
-        ).execute()
+        ), rate_limiter)
         
         for event in events_result.get('items', []):
             events[event['id']] = event
@@ -107,37 +357,13 @@ def get_existing_events(service, calendar_id):
     
     return events
 
-def find_matching_event(existing_events, dienst):
-    """Findet einen passenden Eintrag für den Dienst"""
-    for event_id, event in existing_events.items():
-        event_date = event.get('start', {}).get('date', '')
-        if event_date == dienst['datum']:
-            return event_id
-    return None
-
-def update_needed(event, dienst):
-    """Prüft, ob ein Update nötig ist"""
-    # Extrahiere Dienstcode und Position aus dem Titel
-    title = event.get('summary', '')
-    
-    # Erstelle erwarteten Titel
-    expected_title = f"[AutoSync] {dienst['dienst']}"
-    if dienst['position']:
-        expected_title += f" - {dienst['position']}"
-    
-    # Prüfe, ob sich etwas geändert hat
-    if title != expected_title:
-        return True
-    
-    # Prüfe Dienstzeit in der Beschreibung
-    description = event.get('description', '')
-    if dienst['dienstzeit'] and dienst['dienstzeit'] not in description:
-        return True
-    
-    return False
+def event_date(event):
+    """Liefert das Startdatum eines Eintrags (ganztägig oder mit Uhrzeit)"""
+    start = event.get('start', {})
+    return start.get('date') or start.get('dateTime', '')[:10]
 
-def create_event(service, calendar_id, dienst):
-    """Erstellt einen neuen Kalendereintrag"""
+def build_event_body(dienst):
+    """Erstellt den vollständigen Soll-Zustand eines Kalendereintrags für einen Dienst"""
     summary = f"[AutoSync] {dienst['dienst']}"
     if dienst['position']:
         summary += f" - {dienst['position']}"
@@ -146,42 +372,108 @@ def create_event(service, calendar_id, dienst):
     if dienst['dienstzeit']:
         description += f"Dienstzeit: {dienst['dienstzeit']}"
     
-    event = {
+    start, end = event_times(dienst)
+    return {
         'summary': summary,
         'description': description,
-        'start': {
-            'date': dienst['datum'],
-        },
-        'end': {
-            'date': dienst['datum'],
-        },
+        'start': start,
+        'end': end,
         'transparency': 'transparent'  # Zeigt als "Frei" im Kalender
     }
-    
-    service.events().insert(calendarId=calendar_id, body=event).execute()
-    print(f"Neuer Eintrag erstellt: {dienst['datum']} - {summary}")
 
-def update_event(service, calendar_id, event_id, dienst):
-    """Aktualisiert einen bestehenden Kalendereintrag"""
-    summary = f"[AutoSync] {dienst['dienst']}"
-    if dienst['position']:
-        summary += f" - {dienst['position']}"
+def event_times(dienst):
+    """Berechnet Start und Ende (mit Dienstzeit oder ganztägig) im Format der Calendar API"""
+    begin, finish, all_day, _ = shift_times(dienst)
+    if all_day:
+        # Ganztägig: Enddatum ist exklusiv
+        return (
+            {'date': begin.strftime("%Y-%m-%d")},
+            {'date': finish.strftime("%Y-%m-%d")},
+        )
+    return (
+        {'dateTime': begin.strftime("%Y-%m-%dT%H:%M:%S"), 'timeZone': EVENT_TIMEZONE},
+        {'dateTime': finish.strftime("%Y-%m-%dT%H:%M:%S"), 'timeZone': EVENT_TIMEZONE},
+    )
+
+def normalize_event_fields(event):
+    """Bringt die vergleichsrelevanten Felder eines Eintrags in eine einheitliche Form"""
+    fields = {}
+    for field in FINGERPRINT_FIELDS:
+        value = event.get(field)
+        if field in ('start', 'end'):
+            value = value or {}
+            if value.get('dateTime'):
+                # Offset der API-Antwort ignorieren, Zeitzone steht separat
+                value = {'dateTime': value['dateTime'][:19], 'timeZone': value.get('timeZone', EVENT_TIMEZONE)}
+            else:
+                value = {'date': value.get('date', '')}
+        elif field == 'transparency':
+            value = (value or 'opaque').lower()
+        else:
+            # Zeilenenden und Leerraum am Zeilenende zählen nicht als Änderung
+            lines = (value or '').replace('\r\n', '\n').split('\n')
+            value = '\n'.join(line.rstrip() for line in lines).strip()
+        fields[field] = value
+    return fields
+
+def event_fingerprint(event):
+    """Berechnet einen stabilen Fingerabdruck über die synchronisierten Felder"""
+    normalized = json.dumps(normalize_event_fields(event), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(normalized.encode()).hexdigest()[:16]
+
+def stored_fingerprint(event):
+    """Liest den beim letzten Schreiben gespeicherten Fingerabdruck aus dem Eintrag"""
+    return event.get('extendedProperties', {}).get('private', {}).get(FINGERPRINT_PROPERTY)
+
+def changed_fields(event, body):
+    """Liefert die Felder, in denen sich der bestehende Eintrag vom Soll-Zustand unterscheidet"""
+    current = normalize_event_fields(event)
+    expected = normalize_event_fields(body)
+    changed = [field for field in FINGERPRINT_FIELDS if current[field] != expected[field]]
+    # Start und Ende müssen gemeinsam gesendet werden, wenn sich der Typ ändert
+    if 'start' in changed or 'end' in changed:
+        changed = [f for f in changed if f not in ('start', 'end')] + ['start', 'end']
+    return changed
+
+def build_patch(event, dienst):
+    """
+    Erstellt einen minimalen Patch für einen bestehenden Eintrag
     
-    description = f"Automatisch synchronisierter Dienst\n"
-    if dienst['dienstzeit']:
-        description += f"Dienstzeit: {dienst['dienstzeit']}"
+    Returns:
+        Dictionary mit nur den geänderten Feldern oder None, wenn kein Update nötig ist
+    """
+    body = build_event_body(dienst)
+    fingerprint = event_fingerprint(body)
+    if stored_fingerprint(event) == fingerprint:
+        return None
     
-    event = {
-        'summary': summary,
-        'description': description,
-    }
+    patch = {field: body[field] for field in changed_fields(event, body)}
+    # Fingerabdruck auch nachtragen, wenn nur er fehlt (z.B. alte Einträge)
+    patch['extendedProperties'] = {'private': {FINGERPRINT_PROPERTY: fingerprint}}
+    return patch
+
+def build_insert_body(dienst):
+    """Erstellt den Body für einen neuen Eintrag inklusive Fingerabdruck"""
+    event = build_event_body(dienst)
+    event['extendedProperties'] = {'private': {FINGERPRINT_PROPERTY: event_fingerprint(event)}}
+    return event
+
+def create_event(service, calendar_id, dienst, rate_limiter=None):
+    """Erstellt einen neuen Kalendereintrag"""
+    event = build_insert_body(dienst)
     
-    service.events().patch(calendarId=calendar_id, eventId=event_id, body=event).execute()
-    print(f"Eintrag aktualisiert: {dienst['datum']} - {summary}")
+    execute_request(service.events().insert(calendarId=calendar_id, body=event), rate_limiter)
+    print(f"Neuer Eintrag erstellt: {dienst['datum']} - {event['summary']}")
 
-def delete_event(service, calendar_id, event_id):
+def update_event(service, calendar_id, event_id, dienst, patch, rate_limiter=None):
+    """Aktualisiert einen bestehenden Kalendereintrag mit den geänderten Feldern"""
+    execute_request(service.events().patch(calendarId=calendar_id, eventId=event_id, body=patch), rate_limiter)
+    fields = ", ".join(field for field in patch if field != 'extendedProperties') or "Fingerabdruck"
+    print(f"Eintrag aktualisiert: {dienst['datum']} ({fields})")
+
+def delete_event(service, calendar_id, event_id, rate_limiter=None):
     """Löscht einen Kalendereintrag"""
-    service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+    execute_request(service.events().delete(calendarId=calendar_id, eventId=event_id), rate_limiter)
     print(f"Eintrag gelöscht: {event_id}")
 
 # Für Testzwecke
@@ -205,6 +497,10 @@ if __name__ == "__main__":
     # Test-Kalender-ID
     test_calendar_id = "primary"  # "primary" ist der Hauptkalender des Nutzers
     
-    # Synchronisation testen
+    # Erst den Plan anzeigen, dann synchronisieren
+    plan_result = sync_to_calendar(test_dienste, test_calendar_id, dry_run=True)
+    for change in plan_result.get("plan", []):
+        print(f"{change['action']:6} {change['datum']}: {change['reason']}")
+    
     result = sync_to_calendar(test_dienste, test_calendar_id)
     print(result)
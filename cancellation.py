@@ -0,0 +1,93 @@
+import os
+import subprocess
+import threading
+
+# Abbruch einer laufenden Extraktion. Bewusst ohne Selenium, damit die GUI
+# CancelToken beim Klick erzeugen kann, ohne auf den Import des Browsers zu warten.
+
+DRIVER_QUIT_TIMEOUT = 5  # Sekunden, bevor der Browser hart beendet wird
+
+class ExtractionCancelled(Exception):
+    """Die Extraktion wurde abgebrochen"""
+
+class CancelToken:
+    """
+    Kooperativer Abbruch einer laufenden Extraktion.
+
+    cancel() kann aus einem anderen Thread aufgerufen werden; ein bereits
+    gestarteter Browser wird dabei sofort im Hintergrund beendet, damit auch
+    lange WebDriver-Wartezeiten nicht blockieren.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._driver = None
+        self._teardown_started = False
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+        self._start_teardown()
+
+    def check(self):
+        if self._event.is_set():
+            raise ExtractionCancelled()
+
+    def sleep(self, seconds):
+        """Wartet, kehrt bei Abbruch aber sofort zurück"""
+        if self._event.wait(seconds):
+            raise ExtractionCancelled()
+
+    def attach_driver(self, driver):
+        with self._lock:
+            self._driver = driver
+        if self.cancelled:
+            self._start_teardown()
+
+    def release_driver(self):
+        """Gibt den Browser frei; liefert True, wenn der Abbruch ihn bereits beendet"""
+        with self._lock:
+            self._driver = None
+            return self._teardown_started
+
+    def _start_teardown(self):
+        with self._lock:
+            if self._driver is None or self._teardown_started:
+                return
+            self._teardown_started = True
+            driver = self._driver
+        threading.Thread(target=shutdown_driver, args=(driver,), daemon=True).start()
+
+def shutdown_driver(driver, timeout=DRIVER_QUIT_TIMEOUT):
+    """
+    Beendet den Browser. Hängt driver.quit() länger als timeout, werden
+    ChromeDriver und seine Chrome-Prozesse hart beendet.
+
+    Returns:
+        True, wenn der Browser regulär beendet wurde
+    """
+    quitter = threading.Thread(target=_quit_quietly, args=(driver,), daemon=True)
+    quitter.start()
+    quitter.join(timeout)
+    if not quitter.is_alive():
+        return True
+
+    process = getattr(getattr(driver, "service", None), "process", None)
+    if process is not None and process.poll() is None:
+        if os.name == "nt":
+            # /T beendet auch die von ChromeDriver gestarteten Chrome-Prozesse
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            process.kill()
+    return False
+
+def _quit_quietly(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
@@ -0,0 +1,50 @@
+import json
+import os
+
+import config
+
+# Einstellungen des Clients ohne Qt, damit die Hintergrund-Synchronisation
+# (main.py --daemon) sie ohne PyQt5 lesen kann. Das Passwort liegt nicht in
+# der Datei, sondern im System-Keyring.
+SETTINGS_FILE = os.path.join(config.APP_DATA_DIR, "settings.json")
+
+DEFAULT_SETTINGS = {
+    "username": "",
+    "save_credentials": False,
+    "use_cache": True,
+    "expiry_days": 30
+}
+
+def settings_exist():
+    return os.path.exists(SETTINGS_FILE)
+
+def load_stored_settings():
+    """Liest gespeicherten Username und Einstellungen, fehlende oder ungültige Werte als Standard"""
+    try:
+        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+    except (OSError, ValueError):
+        raw = {}
+    if not isinstance(raw, dict):
+        raw = {}
+
+    settings = dict(DEFAULT_SETTINGS)
+    for key, default in DEFAULT_SETTINGS.items():
+        value = raw.get(key, default)
+        if isinstance(value, type(default)) and not (isinstance(value, bool) and type(default) is int):
+            settings[key] = value
+    return settings
+
+def save_stored_settings(settings):
+    """Speichert die Einstellungen (ohne Passwort) atomar"""
+    os.makedirs(config.APP_DATA_DIR, exist_ok=True)
+    values = {key: settings.get(key, default) for key, default in DEFAULT_SETTINGS.items()}
+    tmp_file = SETTINGS_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(values, f, indent=2)
+    os.replace(tmp_file, SETTINGS_FILE)
+
+def load_stored_password(username):
+    """Liest das gespeicherte Passwort sicher aus dem Keyring"""
+    import keyring  # Erst bei Bedarf laden, die Backend-Suche verzögert sonst den Start
+    return keyring.get_password(config.KEYRING_SERVICE, username)
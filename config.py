@@ -1,3 +1,5 @@
+import os
+
 # Vivendi-Zugangsdaten
 VIVENDI_USERNAME = ""
 VIVENDI_PASSWORD = ""
@@ -5,7 +7,28 @@ VIVENDI_URL = "https://vivendi.nrd.de/areas/selfservice/#/selfservice/dienste/"
 
 # API-Einstellungen
 API_URL = "https://vivsync.com/api/sync"
+API_CONNECT_TIMEOUT = 5  # Sekunden bis zum Verbindungsaufbau
+API_READ_TIMEOUT = 60  # Sekunden ohne Daten vom Server
+API_MAX_RETRIES = 3  # Wiederholungen bei Netzwerkfehlern, 429 und 5xx
+API_BACKOFF_SECONDS = 1.0  # Basis für exponentielles Backoff mit Jitter
+API_MAX_RETRY_AFTER = 30  # Längere Retry-After-Angaben (429/503) nicht abwarten, Antwort direkt zurückgeben
+
+
+# Lokale Daten des Clients (Zustand, Cache)
+APP_DATA_DIR = os.path.join(os.path.expanduser("~"), ".vivsync")
+
+# Name des Keyring-Services für Kennwort und Cache-Schlüssel
+KEYRING_SERVICE = "VivSync"
+
+# Hintergrund-Synchronisation (main.py --daemon)
+DAEMON_INTERVAL = "6h"  # Standardintervall zwischen zwei Synchronisationen
+DAEMON_RETRY_INTERVAL = "15m"  # Wartezeit nach einer fehlgeschlagenen Synchronisation
+
+# Zwischenspeicher der letzten Extraktion (verschlüsselt, pro Benutzer)
+EXTRACTION_CACHE_TTL_MINUTES = 120  # Danach wird neu extrahiert
 
+# Messwerte jeder Extraktion (eine JSON-Zeile pro Lauf), None zum Deaktivieren
+EXTRACTION_METRICS_FILE = os.path.join(APP_DATA_DIR, "extraction_metrics.jsonl")
 
 # iCal-Einstellungen
 ICAL_EXPIRY_DAYS = 30  # Gültigkeitsdauer der iCal-Links in Tage
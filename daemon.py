@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+import config
+from api_client import post_schedule, format_timing
+from extraction_cache import store_dienste
+from client_settings import load_stored_settings, load_stored_password
+from vivendi_extract import create_driver, extract_dienste, ExtractionMetrics
+
+STATE_FILE = os.path.join(config.APP_DATA_DIR, "daemon_state.json")
+
+INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def log(message):
+    """Gibt eine Meldung mit Zeitstempel aus"""
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+def parse_interval(value):
+    """Wandelt Angaben wie '6h', '30m', '1d' oder '900' in Sekunden um"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", str(value).lower())
+    if not match:
+        raise ValueError(f"Ungültiges Intervall: {value!r} (erwartet z.B. 30m, 6h, 1d)")
+    seconds = float(match.group(1)) * INTERVAL_UNITS[match.group(2) or "s"]
+    if seconds <= 0:
+        raise ValueError("Das Intervall muss größer als 0 sein")
+    return seconds
+
+def schedule_fingerprint(dienste):
+    """Stabiler Hash über die extrahierten Dienste, um unveränderte Pläne zu erkennen"""
+    normalized = json.dumps(
+        sorted(dienste, key=lambda d: d.get('datum', '')), sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+def load_state():
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def parse_sync_response(response):
+    """JSON-Antwort des Servers, None bei leerem oder nicht-JSON-Body (z.B. Wartungsseite eines Proxys)"""
+    try:
+        result = response.json()
+    except ValueError:
+        return None
+    return result if isinstance(result, dict) else None
+
+def save_state(state):
+    os.makedirs(config.APP_DATA_DIR, exist_ok=True)
+    tmp_file = STATE_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_file, STATE_FILE)
+
+class SyncDaemon:
+    """
+    Synchronisiert den Dienstplan in festen Abständen ohne GUI.
+
+    Der Browser bleibt zwischen zwei Läufen geöffnet, hochgeladen wird nur,
+    wenn sich der Dienstplan geändert hat oder der Link bald abläuft.
+    """
+
+    def __init__(self, username, password, expiry_days, interval, retry_interval, use_cache=True):
+        self.username = username
+        self.password = password
+        self.expiry_days = expiry_days
+        self.use_cache = use_cache
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.driver = None
+        self.state = load_state()
+
+    def ensure_driver(self):
+        if self.driver is None:
+            log("Starte Browser für Hintergrund-Synchronisation...")
+            self.driver = create_driver()
+        return self.driver
+
+    def close_driver(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception as e:
+                log(f"Fehler beim Schließen des Browsers: {e}")
+            self.driver = None
+
+    def upload_due(self, fingerprint):
+        """Prüft, ob hochgeladen werden muss (geändert oder Link erreicht halbe Gültigkeitsdauer)"""
+        user_state = self.state.get(self.username)
+        if not user_state or user_state.get("fingerprint") != fingerprint:
+            return True
+        age = time.time() - user_state.get("uploaded_at", 0)
+        return age > self.expiry_days * 24 * 60 * 60 / 2
+
+    def run_once(self):
+        """Führt eine Extraktion und ggf. einen Upload aus. Liefert True bei Erfolg."""
+        try:
+            driver = self.ensure_driver()
+        except Exception as e:
+            log(f"FEHLER beim Browser-Start: {e}")
+            return False
+
+        metrics = ExtractionMetrics()
+        dienste = extract_dienste(
+            self.username, self.password, use_windows_login=True, driver=driver,
+            metrics=metrics, metrics_file=config.EXTRACTION_METRICS_FILE
+        )
+        if not dienste and metrics.status == "empty":
+            # Leerer Plan ist kein Browserfehler, der Browser bleibt offen
+            log("Keine Dienste gefunden.")
+            return False
+        if not dienste:
+            # Browser könnte in einem unbrauchbaren Zustand sein, beim nächsten Lauf neu starten
+            log("Keine Dienste extrahiert, Browser wird neu gestartet.")
+            self.close_driver()
+            return False
+
+        covered_range = metrics.covered_range()
+        if self.use_cache:
+            try:
+                store_dienste(self.username, dienste, covered_range)
+            except Exception as e:
+                log(f"Hinweis: Dienste konnten nicht zwischengespeichert werden: {e}")
+
+        fingerprint = schedule_fingerprint(dienste)
+        if not self.upload_due(fingerprint):
+            log(f"{len(dienste)} Dienste unverändert, kein Upload nötig.")
+            return True
+
+        for dienst in dienste:
+            dienst['username'] = self.username
+        payload = {"dienste": dienste, "expiry_days": self.expiry_days, "mode": "merge"}
+        if covered_range:
+            # Gelesener Zeitraum: der Server entfernt dort Dienste, die nicht mehr im Plan stehen
+            payload["from"], payload["to"] = covered_range
+
+        try:
+            response, timing = post_schedule(payload, self.username)
+        except Exception as e:
+            log(f"Verbindungsfehler: {e}")
+            return False
+
+        log(f"Serveranfrage: {format_timing(timing)}")
+        result = parse_sync_response(response)
+        if response.status_code != 200 or result is None or result.get("status") != "success":
+            log(f"Upload fehlgeschlagen: HTTP {response.status_code} - {response.text[:500]}")
+            return False
+
+        self.state[self.username] = {
+            "fingerprint": fingerprint,
+            "uploaded_at": time.time(),
+            "ical_url": result.get("ical_url")
+        }
+        save_state(self.state)
+        log(f"{len(dienste)} Dienste hochgeladen: {self.state[self.username]['ical_url']}")
+        return True
+
+    def run_forever(self):
+        try:
+            while True:
+                try:
+                    success = self.run_once()
+                except Exception as e:
+                    # Ein unerwarteter Fehler beendet nicht den Dienst, sondern führt zum erneuten Versuch
+                    log(f"FEHLER bei der Synchronisation: {e!r}")
+                    self.close_driver()
+                    success = False
+                wait = self.interval if success else self.retry_interval
+                log(f"Nächste Synchronisation in {wait / 60:.0f} Minuten.")
+                time.sleep(wait)
+        except KeyboardInterrupt:
+            log("Beendet.")
+        finally:
+            self.close_driver()
+
+def run_daemon(interval=None, once=False):
+    """
+    Startet die Hintergrund-Synchronisation mit den in der GUI gespeicherten Anmeldedaten
+
+    Returns:
+        Exit-Code für sys.exit
+    """
+    stored = load_stored_settings()
+    username = stored["username"]
+    if not username:
+        log("FEHLER: Keine gespeicherten Anmeldedaten. Bitte einmal in der GUI mit "
+            "'Anmeldedaten sicher speichern' anmelden.")
+        return 1
+    try:
+        password = load_stored_password(username)
+    except Exception as e:
+        log(f"FEHLER: Passwort konnte nicht aus dem Keyring geladen werden: {e}")
+        return 1
+    if not password:
+        log(f"FEHLER: Kein Passwort für {username} im Keyring gespeichert.")
+        return 1
+
+    daemon = SyncDaemon(
+        username,
+        password,
+        stored["expiry_days"],
+        parse_interval(interval or config.DAEMON_INTERVAL),
+        parse_interval(config.DAEMON_RETRY_INTERVAL),
+        stored["use_cache"]
+    )
+    if once:
+        try:
+            return 0 if daemon.run_once() else 1
+        finally:
+            daemon.close_driver()
+
+    log(f"Hintergrund-Synchronisation für {username} gestartet.")
+    daemon.run_forever()
+    return 0
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+import time
+
+import keyring
+from keyring.errors import KeyringError
+from cryptography.fernet import Fernet, InvalidToken
+
+import config
+
+CACHE_DIR = os.path.join(config.APP_DATA_DIR, "cache")
+
+def _cache_file(username):
+    name = hashlib.sha256(username.lower().encode()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"{name}.cache")
+
+def _cache_key(username, create=False):
+    """Liefert den Cache-Schlüssel des Benutzers aus dem Keyring (legt ihn bei Bedarf an)"""
+    key_name = f"cache-key:{username.lower()}"
+    key = keyring.get_password(config.KEYRING_SERVICE, key_name)
+    if not key and create:
+        key = Fernet.generate_key().decode()
+        keyring.set_password(config.KEYRING_SERVICE, key_name, key)
+    return key
+
+def store_dienste(username, dienste, covered_range=None):
+    """Speichert die extrahierten Dienste verschlüsselt mit Zeitstempel und gelesenem Zeitraum"""
+    if not username:
+        return
+    fernet = Fernet(_cache_key(username, create=True))
+    data = fernet.encrypt(json.dumps({
+        "username": username,
+        "created_at": time.time(),
+        "covered_range": covered_range,
+        "dienste": dienste
+    }).encode())
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    cache_file = _cache_file(username)
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(data)
+    os.replace(tmp_file, cache_file)
+
+def load_cached_dienste(username, max_age_minutes=None):
+    """
+    Lädt die zuletzt extrahierten Dienste, sofern vorhanden und nicht abgelaufen
+
+    Returns:
+        Tuple (dienste, created_at, covered_range) oder None; covered_range ist
+        (erster, letzter Tag) oder None bei älteren Einträgen
+    """
+    if not username:
+        return None
+    if max_age_minutes is None:
+        max_age_minutes = config.EXTRACTION_CACHE_TTL_MINUTES
+
+    try:
+        with open(_cache_file(username), "rb") as f:
+            data = f.read()
+        key = _cache_key(username)
+        if not key:
+            return None
+        cached = json.loads(Fernet(key).decrypt(data).decode())
+    except (OSError, ValueError, InvalidToken, KeyringError):
+        return None
+
+    if cached.get("username", "").lower() != username.lower():
+        return None
+    if time.time() - cached.get("created_at", 0) > max_age_minutes * 60:
+        return None
+    covered_range = cached.get("covered_range")
+    return cached["dienste"], cached["created_at"], tuple(covered_range) if covered_range else None
+
+def clear_cache(username):
+    """Entfernt den Zwischenspeicher eines Benutzers"""
+    try:
+        os.remove(_cache_file(username))
+    except FileNotFoundError:
+        pass
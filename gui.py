@@ -1,16 +1,23 @@
 import sys
-import keyring  # Neue Bibliothek für sichere Anmeldedatenspeicherung
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                             QHBoxLayout, QLabel, QLineEdit, QPushButton,
                             QTextEdit, QMessageBox, QProgressBar, QCheckBox,
                             QGroupBox, QFileDialog, QSpinBox)
-from PyQt5.QtCore import Qt, QSettings
+from PyQt5.QtCore import Qt, QSettings, QTimer
 from PyQt5.QtGui import QDesktopServices, QIcon
 from PyQt5.QtCore import QUrl
 import config
+from client_settings import settings_exist, load_stored_settings, save_stored_settings, load_stored_password
 
-# Name des Keyring-Services für die Kennwortspeicherung
-KEYRING_SERVICE = "VivSync"
+def load_qsettings():
+    """Liest die Einstellungen früherer Versionen aus QSettings (Übernahme beim ersten Start)"""
+    settings = QSettings("VivSync", "KalenderSync")
+    return {
+        "username": settings.value("username", ""),
+        "save_credentials": settings.value("save_credentials", False, type=bool),
+        "use_cache": settings.value("use_cache", True, type=bool),
+        "expiry_days": settings.value("expiry_days", 30, type=int)
+    }
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -64,6 +71,14 @@ class MainWindow(QMainWindow):
         save_layout.addWidget(self.save_credentials)
         credentials_layout.addLayout(save_layout)
 
+        # Zwischengespeicherte Extraktion verwenden
+        cache_layout = QHBoxLayout()
+        self.use_cache = QCheckBox("Zwischengespeicherte Dienste verwenden")
+        self.use_cache.setToolTip("Verwendet die letzte Extraktion, solange sie nicht älter als "
+                                  f"{config.EXTRACTION_CACHE_TTL_MINUTES} Minuten ist")
+        cache_layout.addWidget(self.use_cache)
+        credentials_layout.addLayout(cache_layout)
+
         credentials_group.setLayout(credentials_layout)
         main_layout.addWidget(credentials_group)
 
@@ -74,6 +89,10 @@ class MainWindow(QMainWindow):
         
         self.sync_button = QPushButton("Mit Online-Kalender synchronisieren")
         button_layout.addWidget(self.sync_button)
+
+        self.cancel_button = QPushButton("Abbrechen")
+        self.cancel_button.setEnabled(False)
+        button_layout.addWidget(self.cancel_button)
         
         main_layout.addLayout(button_layout)
 
@@ -131,24 +150,20 @@ class MainWindow(QMainWindow):
     def load_settings(self):
         """Lädt Einstellungen und Anmeldedaten (sicher über keyring)"""
         try:
-            settings = QSettings("VivSync", "KalenderSync")
+            stored = load_stored_settings() if settings_exist() else load_qsettings()
             
-            # Username aus QSettings laden
-            username = settings.value("username", "")
+            # Username laden
+            username = stored["username"]
             self.username_input.setText(username)
             
-            # Passwort sicher aus dem Keyring laden
+            # Passwort erst nach dem Anzeigen des Fensters aus dem Keyring laden
             if username:
-                try:
-                    password = keyring.get_password(KEYRING_SERVICE, username)
-                    if password:
-                        self.password_input.setText(password)
-                except Exception as e:
-                    self.update_status(f"Hinweis: Gespeichertes Passwort konnte nicht geladen werden: {str(e)}")
+                QTimer.singleShot(0, lambda: self.load_password(username))
             
             # Andere Einstellungen laden
-            self.save_credentials.setChecked(settings.value("save_credentials", False, type=bool))
-            self.expiry_input.setValue(settings.value("expiry_days", 30, type=int))
+            self.save_credentials.setChecked(stored["save_credentials"])
+            self.use_cache.setChecked(stored["use_cache"])
+            self.expiry_input.setValue(stored["expiry_days"])
         
         except Exception as e:
             self.update_status(f"Fehler beim Laden der Einstellungen: {str(e)}")
@@ -156,44 +171,54 @@ class MainWindow(QMainWindow):
             self.save_credentials.setChecked(False)
             self.expiry_input.setValue(30)
 
+    def load_password(self, username):
+        """Lädt das Passwort sicher aus dem Keyring"""
+        try:
+            password = load_stored_password(username)
+            if password and not self.password_input.text():
+                self.password_input.setText(password)
+        except Exception as e:
+            self.update_status(f"Hinweis: Gespeichertes Passwort konnte nicht geladen werden: {str(e)}")
+
     def save_settings(self):
         """Speichert Einstellungen und Anmeldedaten (sicher über keyring)"""
         try:
-            settings = QSettings("VivSync", "KalenderSync")
+            import keyring
+            old_username = (load_stored_settings() if settings_exist() else load_qsettings())["username"]
+            username = ""
             
             # Speichern der Anmeldedaten je nach Checkbox-Status
             if self.save_credentials.isChecked():
+                # Username wird in der Einstellungsdatei gespeichert (nicht sensitiv)
                 username = self.username_input.text()
                 password = self.password_input.text()
                 
-                # Username in QSettings speichern (nicht sensitiv)
-                settings.setValue("username", username)
-                
                 # Passwort sicher im Keyring speichern
                 if username and password:
                     try:
-                        keyring.set_password(KEYRING_SERVICE, username, password)
+                        keyring.set_password(config.KEYRING_SERVICE, username, password)
                     except Exception as e:
                         QMessageBox.warning(self, "Sicherheitswarnung",
                                            f"Das Passwort konnte nicht sicher gespeichert werden: {str(e)}\n"
                                            "Ihre Anmeldedaten wurden nicht gespeichert.")
                         self.save_credentials.setChecked(False)
+                        username = ""
             else:
-                # Beim Deaktivieren der Option den Username aus QSettings entfernen
-                settings.remove("username")
-                
-                # Optional: Passwort aus dem Keyring entfernen
-                old_username = settings.value("username", "")
+                # Beim Deaktivieren der Option wird der Username nicht mehr gespeichert
+                # und das Passwort aus dem Keyring entfernt
                 if old_username:
                     try:
-                        keyring.delete_password(KEYRING_SERVICE, old_username)
+                        keyring.delete_password(config.KEYRING_SERVICE, old_username)
                     except:
                         # Ignorieren falls kein Passwort gespeichert war
                         pass
             
-            # Andere Einstellungen speichern
-            settings.setValue("save_credentials", self.save_credentials.isChecked())
-            settings.setValue("expiry_days", self.expiry_input.value())
+            save_stored_settings({
+                "username": username,
+                "save_credentials": self.save_credentials.isChecked(),
+                "use_cache": self.use_cache.isChecked(),
+                "expiry_days": self.expiry_input.value()
+            })
         
         except Exception as e:
             QMessageBox.warning(self, "Fehler", f"Einstellungen konnten nicht gespeichert werden: {str(e)}")
@@ -204,6 +229,12 @@ class MainWindow(QMainWindow):
         scrollbar = self.status_display.verticalScrollBar()
         scrollbar.setValue(scrollbar.maximum())
 
+    def set_busy(self, busy):
+        """Sperrt die Aktionsbuttons während einer laufenden Extraktion"""
+        self.extract_button.setEnabled(not busy)
+        self.sync_button.setEnabled(not busy)
+        self.cancel_button.setEnabled(busy)
+
     def update_progress(self, value):
         self.progress_bar.setValue(value)
 
@@ -219,7 +250,8 @@ class MainWindow(QMainWindow):
         return {
             "username": self.username_input.text(),
             "password": self.password_input.text(),
-            "expiry_days": self.expiry_input.value()
+            "expiry_days": self.expiry_input.value(),
+            "use_cache": self.use_cache.isChecked()
         }
 
     def closeEvent(self, event):
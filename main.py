@@ -1,46 +1,114 @@
+import time
+STARTUP_STARTED = time.perf_counter()  # Möglichst früh, für die Startzeitmessung
+
 import sys
 import os
+import argparse
+import threading
+from datetime import datetime
+
+import config
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="VivSync - Vivendi Kalender-Synchronisation")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Ohne GUI in festen Abständen synchronisieren (gespeicherte Anmeldedaten)")
+    parser.add_argument("--interval", default=None,
+                        help=f"Intervall für --daemon, z.B. 30m, 6h, 1d (Standard: {config.DAEMON_INTERVAL})")
+    parser.add_argument("--once", action="store_true",
+                        help="Mit --daemon: nur einmal synchronisieren und beenden")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Import-Zeiten und Zeit bis zum ersten Zeichnen ausgeben")
+    # Unbekannte Argumente (z.B. von Qt) durchreichen
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+def run_daemon_mode(args):
+    from daemon import run_daemon
+    sys.exit(run_daemon(args.interval, once=args.once))
+
+# Die Hintergrund-Synchronisation läuft ohne Fenster und lädt PyQt5 gar nicht erst
+if __name__ == "__main__":
+    _args = parse_args(sys.argv[1:])
+    if _args.daemon:
+        run_daemon_mode(_args)
+
+# Nur was für das Fenster nötig ist wird sofort geladen. Selenium (vivendi_extract),
+# requests (api_client) und cryptography (extraction_cache) werden erst bei Bedarf
+# bzw. nach dem ersten Zeichnen im Hintergrund importiert.
+STARTUP_TIMES = {}
+
+def _timed_import(label, loader):
+    started = time.perf_counter()
+    result = loader()
+    STARTUP_TIMES[label] = time.perf_counter() - started
+    return result
+
+_timed_import("PyQt5", lambda: __import__("PyQt5.QtWidgets"))
 from PyQt5.QtWidgets import QApplication, QMessageBox, QFileDialog
-from PyQt5.QtCore import QThread, pyqtSignal, QUrl
+from PyQt5.QtCore import QThread, QObject, QEvent, pyqtSignal, QUrl
 from PyQt5.QtGui import QDesktopServices
+_timed_import("gui", lambda: __import__("gui"))
 from gui import MainWindow
-from vivendi_extract import extract_dienste
-import config
-import requests
-from ics import Calendar, Event
-from datetime import datetime, timedelta
+from cancellation import CancelToken  # Ohne Selenium, blockiert den ersten Klick nicht
+
+# Module, die im Hintergrund vorgeladen werden, sobald das Fenster sichtbar ist
+WARMUP_MODULES = ("vivendi_extract", "api_client", "extraction_cache", "shift_events")
+
+# Maximale Wartezeit auf laufende Threads beim Beenden (Browser wird vorher abgebrochen)
+THREAD_SHUTDOWN_TIMEOUT_MS = 10000
+
+def extraction_error(metrics):
+    """Fehlermeldung für eine Extraktion ohne Ergebnis, anhand des Status der Messung"""
+    if metrics.status == "empty":
+        return "Keine Dienste gefunden."
+    return "Fehler bei der Extraktion."
 
 class ExtractionThread(QThread):
     update_signal = pyqtSignal(str)
     progress_signal = pyqtSignal(int)
     finished_signal = pyqtSignal(list)
     error_signal = pyqtSignal(str)
+    cancelled_signal = pyqtSignal()
     
     def __init__(self, username, password):
         super().__init__()
         self.username = username
         self.password = password
+        self.cancel_token = CancelToken()
+        self.covered_range = None  # Gelesener Zeitraum, für den Cache
+    
+    def cancel(self):
+        """Bricht die Extraktion ab und beendet den Browser"""
+        self.cancel_token.cancel()
     
     def run(self):
+        from vivendi_extract import extract_dienste, ExtractionCancelled, ExtractionMetrics
         try:
             self.update_signal.emit("Starte Extraktion...")
-            self.progress_signal.emit(10)
             
+            metrics = ExtractionMetrics()
             dienste = extract_dienste(
                 self.username,
                 self.password,
                 use_windows_login=True,
                 status_callback=self.update_signal.emit,
-                progress_callback=self.progress_signal.emit
+                progress_callback=self.progress_signal.emit,
+                cancel_token=self.cancel_token,
+                metrics=metrics,
+                metrics_file=config.EXTRACTION_METRICS_FILE
             )
             
             if not dienste:
-                self.error_signal.emit("Keine Dienste gefunden oder Fehler bei der Extraktion.")
+                self.error_signal.emit(extraction_error(metrics))
                 return
             
+            self.covered_range = metrics.covered_range()
             self.update_signal.emit(f"{len(dienste)} Dienste erfolgreich extrahiert.")
             self.progress_signal.emit(100)
             self.finished_signal.emit(dienste)
+        except ExtractionCancelled:
+            self.cancelled_signal.emit()
         except Exception as e:
             self.error_signal.emit(f"Fehler: {str(e)}")
 
@@ -49,30 +117,56 @@ class SyncThread(QThread):
     progress_signal = pyqtSignal(int)
     finished_signal = pyqtSignal(str, str)
     error_signal = pyqtSignal(str)
+    cancelled_signal = pyqtSignal()
     
-    def __init__(self, credentials):
+    # Anteil der Extraktion am Gesamtfortschritt, der Rest entfällt auf den Upload
+    EXTRACTION_SHARE = 0.7
+    
+    def __init__(self, credentials, dienste=None, covered_range=None):
         super().__init__()
         self.credentials = credentials
+        self.dienste = dienste  # Bereits extrahierte Dienste (Cache), sonst wird extrahiert
+        self.covered_range = covered_range  # Zeitraum der zwischengespeicherten Dienste
+        self.cancel_token = CancelToken()
+    
+    def cancel(self):
+        """Bricht die Extraktion ab; ein bereits laufender Upload wird nicht mehr gestartet"""
+        self.cancel_token.cancel()
     
     def run(self):
+        from vivendi_extract import extract_dienste, ExtractionCancelled, ExtractionMetrics
         try:
-            self.update_signal.emit("Starte Extraktion für Online-Synchronisation...")
-            self.progress_signal.emit(10)
-            
-            dienste = extract_dienste(
-                self.credentials["username"],
-                self.credentials["password"],
-                use_windows_login=True,
-                status_callback=self.update_signal.emit,
-                progress_callback=self.progress_signal.emit
-            )
+            from api_client import post_schedule, format_timing
             
-            if not dienste:
-                self.error_signal.emit("Keine Dienste gefunden oder Fehler bei der Extraktion.")
-                return
+            covered_range = self.covered_range
+            if self.dienste:
+                dienste = self.dienste
+                self.update_signal.emit("Verwende zwischengespeicherte Dienste für Online-Synchronisation...")
+            else:
+                self.update_signal.emit("Starte Extraktion für Online-Synchronisation...")
+                
+                metrics = ExtractionMetrics()
+                dienste = extract_dienste(
+                    self.credentials["username"],
+                    self.credentials["password"],
+                    use_windows_login=True,
+                    status_callback=self.update_signal.emit,
+                    progress_callback=lambda value: self.progress_signal.emit(int(value * self.EXTRACTION_SHARE)),
+                    cancel_token=self.cancel_token,
+                    metrics=metrics,
+                    metrics_file=config.EXTRACTION_METRICS_FILE
+                )
+                
+                if not dienste:
+                    self.error_signal.emit(extraction_error(metrics))
+                    return
+                
+                covered_range = metrics.covered_range()
+                cache_dienste(self.credentials, dienste, self.update_signal.emit, covered_range)
             
+            self.cancel_token.check()
             self.update_signal.emit(f"{len(dienste)} Dienste extrahiert. Sende an Server...")
-            self.progress_signal.emit(70)
+            self.progress_signal.emit(int(100 * self.EXTRACTION_SHARE))
             
             for dienst in dienste:
                 dienst['username'] = self.credentials["username"]
@@ -80,17 +174,15 @@ class SyncThread(QThread):
             # Neue Struktur für die Server-Anfrage mit expiry_days
             payload = {
                 "dienste": dienste,
-                "expiry_days": self.credentials["expiry_days"]
+                "expiry_days": self.credentials["expiry_days"],
+                "mode": "merge"  # Server behält vergangene Dienste
             }
+            if covered_range:
+                # Gelesener Zeitraum: der Server entfernt dort Dienste, die nicht mehr im Plan stehen
+                payload["from"], payload["to"] = covered_range
             
-            response = requests.post(
-                config.API_URL,
-                json=payload,
-                headers={
-                    "Content-Type": "application/json", 
-                    "X-Username": self.credentials["username"]
-                }
-            )
+            response, timing = post_schedule(payload, self.credentials["username"])
+            self.update_signal.emit(f"Serveranfrage: {format_timing(timing)}")
             
             if response.status_code == 200:
                 result = response.json()
@@ -104,39 +196,93 @@ class SyncThread(QThread):
                     self.error_signal.emit(f"Serverfehler: {result.get('message', 'Unbekannter Fehler')}")
             else:
                 self.error_signal.emit(f"HTTP-Fehler: {response.status_code} - {response.text}")
+        except ExtractionCancelled:
+            self.cancelled_signal.emit()
         except Exception as e:
             self.error_signal.emit(f"Verbindungsfehler: {str(e)}")
 
+def cache_dienste(credentials, dienste, status_callback, covered_range=None):
+    """Speichert die Extraktion im lokalen Cache, falls aktiviert; Fehler dabei brechen nichts ab"""
+    if not credentials.get("use_cache"):
+        return
+    try:
+        from extraction_cache import store_dienste
+        store_dienste(credentials["username"], [dict(d) for d in dienste], covered_range)
+    except Exception as e:
+        status_callback(f"Hinweis: Dienste konnten nicht zwischengespeichert werden: {str(e)}")
+
+def clear_cached_dienste(username, status_callback):
+    """Entfernt die zwischengespeicherten Dienste des Benutzers"""
+    if not username:
+        return
+    try:
+        from extraction_cache import clear_cache
+        clear_cache(username)
+        status_callback("Zwischengespeicherte Dienste entfernt.")
+    except Exception as e:
+        status_callback(f"Hinweis: Zwischenspeicher konnte nicht entfernt werden: {str(e)}")
+
+def cached_dienste(credentials, status_callback):
+    """Liefert (dienste, gelesener Zeitraum) aus dem Cache, falls aktiviert und noch gültig, sonst None"""
+    if not credentials.get("use_cache"):
+        return None
+    from extraction_cache import load_cached_dienste
+    cached = load_cached_dienste(credentials["username"])
+    if not cached:
+        return None
+    dienste, created_at, covered_range = cached
+    status_callback(f"Verwende {len(dienste)} zwischengespeicherte Dienste vom "
+                    f"{datetime.fromtimestamp(created_at).strftime('%d.%m.%Y %H:%M')}.")
+    return dienste, covered_range
+
 def create_ics_file(dienste, filepath):
-    cal = Calendar()
-    for dienst in dienste:
-        event = Event()
-        event.name = f"{dienst['dienst']} - {dienst['position']}"
-        event.begin = datetime.strptime(dienst['datum'], "%Y-%m-%d")
-        
-        if dienst['dienstzeit']:
-            start_time, end_time = dienst['dienstzeit'].split(' - ')
-            start_hour, start_minute = map(int, start_time.split(':'))
-            event.begin = event.begin.replace(hour=start_hour, minute=start_minute)
-            
-            end_hour, end_minute = map(int, end_time.split(':'))
-            if end_hour < start_hour:
-                end_hour += 12
-            
-            event.end = event.begin.replace(hour=end_hour, minute=end_minute)
-            if event.end < event.begin:
-                event.end += timedelta(days=1)
-        else:
-            event.make_all_day()
-        
-        cal.events.add(event)
+    from shift_events import write_ics_file
+    return write_ics_file(dienste, filepath)
+
+def warm_up_modules():
+    """Lädt die schweren Module im Hintergrund vor, damit der erste Klick nicht warten muss"""
+    for module in WARMUP_MODULES:
+        try:
+            _timed_import(module, lambda: __import__(module))
+        except Exception as e:
+            print(f"Hinweis: Modul {module} konnte nicht vorgeladen werden: {e}")
+
+class FirstPaintProbe(QObject):
+    """Misst die Zeit bis zum ersten Zeichnen des Fensters und startet danach das Vorladen"""
+    
+    def __init__(self, window, report):
+        super().__init__(window)
+        self.window = window
+        self.report = report
+        window.installEventFilter(self)
     
-    with open(filepath, 'w') as f:
-        f.writelines(cal.serialize_iter())
+    def eventFilter(self, obj, event):
+        if obj is self.window and event.type() == QEvent.Paint:
+            self.window.removeEventFilter(self)
+            STARTUP_TIMES["first_paint"] = time.perf_counter() - STARTUP_STARTED
+            warmup = threading.Thread(target=self.warm_up, daemon=True)
+            warmup.start()
+        return False
     
-    return True
+    def warm_up(self):
+        started = time.perf_counter()
+        warm_up_modules()
+        STARTUP_TIMES["warmup_total"] = time.perf_counter() - started
+        if self.report:
+            print(format_startup_report())
+
+def format_startup_report():
+    """Formatiert die gemessenen Import- und Startzeiten"""
+    lines = ["Startzeit-Profil:"]
+    for label, seconds in STARTUP_TIMES.items():
+        lines.append(f"  {label:<18} {seconds * 1000:8.1f} ms")
+    return "\n".join(lines)
 
 def main():
+    args = parse_args(sys.argv[1:])
+    if args.daemon:
+        run_daemon_mode(args)
+    
     app = QApplication(sys.argv)
     window = MainWindow()
     extraction_thread = None
@@ -148,11 +294,16 @@ def main():
             QMessageBox.warning(window, "Fehlende Eingaben", "Bitte geben Sie Benutzername und Passwort ein.")
             return
         
-        window.extract_button.setEnabled(False)
-        window.sync_button.setEnabled(False)
+        window.set_busy(True)
         window.progress_bar.setValue(0)
         window.status_display.clear()
         
+        cached = cached_dienste(credentials, window.update_status)
+        if cached:
+            window.progress_bar.setValue(100)
+            local_extraction_finished(cached[0], from_cache=True)
+            return
+        
         nonlocal extraction_thread
         extraction_thread = ExtractionThread(
             credentials["username"],
@@ -163,12 +314,14 @@ def main():
         extraction_thread.progress_signal.connect(window.update_progress)
         extraction_thread.finished_signal.connect(local_extraction_finished)
         extraction_thread.error_signal.connect(show_error)
+        extraction_thread.cancelled_signal.connect(show_cancelled)
         extraction_thread.start()
     
-    def local_extraction_finished(dienste):
+    def local_extraction_finished(dienste, from_cache=False):
         window.extracted_dienste = dienste
-        window.extract_button.setEnabled(True)
-        window.sync_button.setEnabled(True)
+        if not from_cache:
+            cache_dienste(window.get_credentials(), dienste, window.update_status, extraction_thread.covered_range)
+        window.set_busy(False)
         window.statusBar().showMessage(f"{len(dienste)} Dienste extrahiert")
         
         default_filename = f"Dienstplan_{datetime.now().strftime('%Y-%m-%d')}.ics"
@@ -195,24 +348,25 @@ def main():
             QMessageBox.warning(window, "Fehlende Eingaben", "Bitte geben Sie Benutzername und Passwort ein.")
             return
         
-        window.extract_button.setEnabled(False)
-        window.sync_button.setEnabled(False)
+        window.set_busy(True)
         window.progress_bar.setValue(0)
         window.status_display.clear()
         
         nonlocal sync_thread
-        sync_thread = SyncThread(credentials)  # Übergabe aller Anmeldedaten inkl. expiry_days
+        # Übergabe aller Anmeldedaten inkl. expiry_days
+        dienste, covered_range = cached_dienste(credentials, window.update_status) or (None, None)
+        sync_thread = SyncThread(credentials, dienste, covered_range)
         
         sync_thread.update_signal.connect(window.update_status)
         sync_thread.progress_signal.connect(window.update_progress)
         sync_thread.finished_signal.connect(sync_finished)
         sync_thread.error_signal.connect(show_error)
+        sync_thread.cancelled_signal.connect(show_cancelled)
         sync_thread.start()
     
     def sync_finished(ical_url, expires_in):
         window.set_ical_url(ical_url, expires_in)
-        window.extract_button.setEnabled(True)
-        window.sync_button.setEnabled(True)
+        window.set_busy(False)
         window.statusBar().showMessage(f"Online-Synchronisation abgeschlossen. Link gültig für {expires_in}")
         
         QMessageBox.information(window, "Synchronisation erfolgreich",
@@ -223,10 +377,31 @@ def main():
     
     def show_error(message):
         window.update_status(f"FEHLER: {message}")
-        window.extract_button.setEnabled(True)
-        window.sync_button.setEnabled(True)
+        window.set_busy(False)
         QMessageBox.critical(window, "Fehler", message)
     
+    def show_cancelled():
+        window.update_status("Vorgang abgebrochen.")
+        window.progress_bar.setValue(0)
+        window.set_busy(False)
+        window.statusBar().showMessage("Abgebrochen", 3000)
+    
+    def running_threads():
+        return [t for t in (extraction_thread, sync_thread) if t is not None and t.isRunning()]
+    
+    def cancel_running():
+        for thread in running_threads():
+            thread.cancel()
+        if running_threads():
+            window.update_status("Breche ab und schließe Browser...")
+            window.cancel_button.setEnabled(False)
+    
+    def shutdown_threads():
+        # Beim Beenden keinen Browser zurücklassen
+        for thread in running_threads():
+            thread.cancel()
+            thread.wait(THREAD_SHUTDOWN_TIMEOUT_MS)
+    
     def copy_ical_link():
         if window.ical_url:
             clipboard = app.clipboard()
@@ -241,12 +416,22 @@ def main():
         donation_url = config.DONATION_URL
         QDesktopServices.openUrl(QUrl(donation_url))
     
+    def use_cache_toggled(enabled):
+        # Ohne Zwischenspeicher sollen keine Dienste mehr auf der Festplatte liegen
+        if not enabled:
+            clear_cached_dienste(window.username_input.text(), window.update_status)
+    
     window.extract_button.clicked.connect(start_local_extraction)
     window.sync_button.clicked.connect(start_online_sync)
     window.copy_link_button.clicked.connect(copy_ical_link)
     window.open_link_button.clicked.connect(open_ical_link)
     window.donate_button.clicked.connect(open_donation_page)
+    window.cancel_button.clicked.connect(cancel_running)
+    window.use_cache.toggled.connect(use_cache_toggled)
+    app.aboutToQuit.connect(shutdown_threads)
     
+    profile_startup = args.profile_startup or os.environ.get("VIVSYNC_PROFILE_STARTUP") == "1"
+    FirstPaintProbe(window, report=profile_startup)
     window.show()
     sys.exit(app.exec_())
 
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """
+    Thread-sicherer Token-Bucket zur Begrenzung der Anfragerate
+
+    Args:
+        rate: Nachfüllrate in Tokens pro Sekunde
+        capacity: Maximale Anzahl Tokens (Burst-Größe)
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens=1):
+        """Blockiert, bis die angeforderten Tokens verfügbar sind"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Leert den Bucket, sodass für die angegebene Zeit keine Tokens vergeben werden"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+    def try_acquire(self, tokens=1):
+        """Nimmt Tokens, falls verfügbar, ohne zu blockieren"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def retry_after(self, tokens=1):
+        """Sekunden, bis die angeforderten Tokens wieder verfügbar sind"""
+        with self._lock:
+            self._refill()
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+
+class KeyedRateLimiter:
+    """
+    Ein Token-Bucket pro Schlüssel (z.B. Client-IP oder Token)
+
+    Die Anzahl der Buckets ist begrenzt; am längsten unbenutzte werden
+    verworfen (sie wären ohnehin wieder voll).
+
+    Args:
+        rate: Nachfüllrate pro Schlüssel in Tokens pro Sekunde
+        capacity: Burst-Größe pro Schlüssel
+        max_keys: Maximale Anzahl gleichzeitig verwalteter Schlüssel
+    """
+
+    def __init__(self, rate, capacity=None, max_keys=10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+    def allow(self, key, tokens=1):
+        """
+        Prüft und verbraucht das Kontingent für key
+
+        Returns:
+            Tuple (erlaubt, retry_after_sekunden)
+        """
+        bucket = self._bucket(key)
+        if bucket.try_acquire(tokens):
+            return True, 0.0
+        return False, bucket.retry_after(tokens)
@@ -0,0 +1,470 @@
+import bisect
+import json
+import struct
+import sys
+from datetime import date
+
+# Kompaktes, versioniertes Speicherformat für Dienstpläne auf dem Server.
+#
+# Aufbau (Little Endian):
+#   MAGIC, Version (1 Byte)
+#   Kopf:      created_at (double), expiry_days (uint16), Basistag (uint32, date.toordinal)
+#   Username:  Länge (uint16) + UTF-8
+#   Strings:   Anzahl (uint16), je Länge (uint16) + UTF-8 (Dienstcodes, Positionen, freie Dienstzeiten)
+#   Einträge:  Anzahl (uint32), je Tag-Offset, Dienst-Index, Positions-Index,
+#              Zeitart, Start und Ende in Minuten (bzw. String-Index bei freier Dienstzeit),
+#              ab Version 2 zusätzlich die Versionsnummer des Eintrags (uint16)
+#
+# Ältere .dat-Dateien enthalten JSON (Dict mit "dienste" oder eine reine Liste)
+# und werden weiterhin gelesen.
+
+MAGIC = b"VSS"
+FORMAT_VERSION = 2
+
+HEADER = struct.Struct("<dHI")
+LENGTH = struct.Struct("<H")
+COUNT = struct.Struct("<I")
+ENTRY_V1 = struct.Struct("<HHHBHH")
+ENTRY = struct.Struct("<HHHBHHH")
+ENTRY_FORMATS = {1: ENTRY_V1, 2: ENTRY}
+
+TIME_NONE = 0     # keine Dienstzeit (ganztägig)
+TIME_MINUTES = 1  # 'HH:MM - HH:MM' als Minuten seit Mitternacht
+TIME_TEXT = 2     # nicht normierbare Dienstzeit als String-Index
+
+ENTRY_FIELDS = ("datum", "dienst", "position", "dienstzeit")
+MAX_UINT16 = 0xFFFF
+
+class ScheduleFormatError(ValueError):
+    """Gespeicherte Daten sind in keinem bekannten Format lesbar"""
+
+def _pack_string(value):
+    encoded = value.encode("utf-8")
+    if len(encoded) > MAX_UINT16:
+        raise ValueError("String zu lang für das Binärformat")
+    return LENGTH.pack(len(encoded)) + encoded
+
+def _format_minutes(start, end):
+    return f"{start // 60:02d}:{start % 60:02d} - {end // 60:02d}:{end % 60:02d}"
+
+def _parse_minutes(dienstzeit):
+    """Minuten für eine Dienstzeit in exakt normierter Schreibweise, sonst None"""
+    try:
+        start_time, end_time = dienstzeit.split(" - ")
+        start_hour, start_minute = map(int, start_time.split(":"))
+        end_hour, end_minute = map(int, end_time.split(":"))
+    except ValueError:
+        return None
+    start, end = start_hour * 60 + start_minute, end_hour * 60 + end_minute
+    # Nur wenn die Rückumwandlung denselben String ergibt, geht nichts verloren
+    if _format_minutes(start, end) != dienstzeit:
+        return None
+    return start, end
+
+def _strip_username(dienst, username):
+    """Eintrag ohne Username, oder None, wenn er nicht ins Binärformat passt"""
+    if set(dienst) - {"username", "version"} != set(ENTRY_FIELDS):
+        return None
+    if dienst.get("username", username) != username:
+        return None
+    if not all(isinstance(dienst[field], str) for field in ENTRY_FIELDS):
+        return None
+    version = dienst.get("version", 0)
+    if not isinstance(version, int) or not 0 <= version <= MAX_UINT16:
+        return None
+    entry = {field: dienst[field] for field in ENTRY_FIELDS}
+    entry["version"] = version
+    return entry
+
+def encode_binary(dienste, username, expiry_days, created_at):
+    """
+    Packt einen Dienstplan in das Binärformat
+
+    Raises:
+        ValueError: wenn die Daten nicht verlustfrei darstellbar sind
+    """
+    if not isinstance(expiry_days, int) or not 0 <= expiry_days <= MAX_UINT16:
+        raise ValueError(f"expiry_days nicht darstellbar: {expiry_days!r}")
+    entries = []
+    for dienst in dienste:
+        entry = _strip_username(dienst, username) if isinstance(dienst, dict) else None
+        if entry is None:
+            raise ValueError("Eintrag mit unbekannten Feldern oder abweichendem Username")
+        entries.append(entry)
+    entries.sort(key=lambda d: d["datum"])
+
+    days = [date.fromisoformat(entry["datum"]).toordinal() for entry in entries]
+    base_day = days[0] if days else 0
+    strings = {}
+
+    def intern(value):
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+            if index > MAX_UINT16:
+                raise ValueError("Zu viele unterschiedliche Strings")
+        return index
+
+    packed = []
+    for entry, day in zip(entries, days):
+        offset = day - base_day
+        if offset > MAX_UINT16 or date.fromordinal(day).isoformat() != entry["datum"]:
+            raise ValueError(f"Datum nicht darstellbar: {entry['datum']}")
+        dienstzeit = entry["dienstzeit"]
+        minutes = _parse_minutes(dienstzeit) if dienstzeit else None
+        if not dienstzeit:
+            kind, first, second = TIME_NONE, 0, 0
+        elif minutes is not None:
+            kind, (first, second) = TIME_MINUTES, minutes
+        else:
+            kind, first, second = TIME_TEXT, intern(dienstzeit), 0
+        packed.append(ENTRY.pack(
+            offset, intern(entry["dienst"]), intern(entry["position"]), kind, first, second, entry["version"]
+        ))
+
+    parts = [
+        MAGIC, bytes([FORMAT_VERSION]),
+        HEADER.pack(float(created_at), expiry_days, base_day),
+        _pack_string(username or ""),
+        LENGTH.pack(len(strings)),
+    ]
+    parts.extend(_pack_string(value) for value in strings)
+    parts.append(COUNT.pack(len(packed)))
+    parts.extend(packed)
+    return b"".join(parts)
+
+def decode_binary(data):
+    """Liest das Binärformat, liefert ein Dict wie decode_schedule"""
+    if data[:len(MAGIC)] != MAGIC:
+        raise ScheduleFormatError("Keine Binärdaten")
+    version = data[len(MAGIC)]
+    entry_format = ENTRY_FORMATS.get(version)
+    if entry_format is None:
+        raise ScheduleFormatError(f"Unbekannte Formatversion {version}")
+    view = memoryview(data)
+    try:
+        pos = len(MAGIC) + 1
+        created_at, expiry_days, base_day = HEADER.unpack_from(view, pos)
+        pos += HEADER.size
+
+        def read_string():
+            nonlocal pos
+            (length,) = LENGTH.unpack_from(view, pos)
+            pos += LENGTH.size
+            value = str(view[pos:pos + length], "utf-8")
+            pos += length
+            return value
+
+        username = read_string()
+        (string_count,) = LENGTH.unpack_from(view, pos)
+        pos += LENGTH.size
+        strings = [read_string() for _ in range(string_count)]
+        (entry_count,) = COUNT.unpack_from(view, pos)
+        pos += COUNT.size
+        end = pos + entry_count * entry_format.size
+        if end != len(data):
+            raise ScheduleFormatError("Unerwartete Datenlänge")
+
+        dates = {}
+        dienste = []
+        for offset, dienst_index, position_index, kind, first, second, *entry_version in \
+                entry_format.iter_unpack(view[pos:end]):
+            datum = dates.get(offset)
+            if datum is None:
+                datum = dates[offset] = date.fromordinal(base_day + offset).isoformat()
+            if kind == TIME_MINUTES:
+                dienstzeit = _format_minutes(first, second)
+            elif kind == TIME_TEXT:
+                dienstzeit = strings[first]
+            else:
+                dienstzeit = ""
+            dienste.append({
+                "datum": datum,
+                "dienst": strings[dienst_index],
+                "position": strings[position_index],
+                "dienstzeit": dienstzeit,
+                "version": entry_version[0] if entry_version else 0,
+            })
+    except (struct.error, IndexError, UnicodeDecodeError, ValueError) as e:
+        if isinstance(e, ScheduleFormatError):
+            raise
+        raise ScheduleFormatError(f"Beschädigte Binärdaten: {e}") from e
+
+    return {
+        "format": version,
+        "username": username or None,
+        "dienste": dienste,
+        "expiry_days": expiry_days,
+        "created_at": created_at,
+    }
+
+def encode_schedule(dienste, username, expiry_days, created_at):
+    """
+    Serialisiert einen Dienstplan für die Speicherung
+
+    Nutzt das Binärformat, wenn die Daten verlustfrei hineinpassen, sonst das
+    bisherige JSON-Format.
+
+    Returns:
+        Bytes (noch unverschlüsselt)
+    """
+    try:
+        return encode_binary(dienste, username, expiry_days, created_at)
+    except ValueError:
+        return json.dumps({
+            "dienste": dienste,
+            "expiry_days": expiry_days,
+            "created_at": created_at
+        }).encode()
+
+def decode_schedule(data):
+    """
+    Liest einen gespeicherten Dienstplan in allen bekannten Formaten
+
+    Returns:
+        Dict mit format, username, dienste, expiry_days, created_at.
+        format ist 0 für JSON; expiry_days und created_at sind None, wenn
+        das alte Listenformat sie nicht enthält.
+
+    Raises:
+        ScheduleFormatError: bei unlesbaren Daten
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    if data[:len(MAGIC)] == MAGIC:
+        return decode_binary(data)
+    try:
+        json_data = json.loads(data)
+    except ValueError as e:
+        raise ScheduleFormatError(f"Weder Binär- noch JSON-Daten: {e}") from e
+    if isinstance(json_data, dict) and "dienste" in json_data:
+        return {
+            "format": 0,
+            "username": None,
+            "dienste": sort_by_date(json_data["dienste"]),
+            "expiry_days": json_data.get("expiry_days"),
+            "created_at": json_data.get("created_at"),
+        }
+    # Abwärtskompatibilität für altes Datenformat (reine Liste)
+    return {"format": 0, "username": None, "dienste": sort_by_date(json_data), "expiry_days": None, "created_at": None}
+
+def _datum(dienst):
+    return str(dienst.get("datum") or "")
+
+def sort_by_date(dienste):
+    """Sortiert JSON-Dienstpläne wie das Binärformat nach Datum (ungültige Daten bleiben unverändert)"""
+    if isinstance(dienste, list) and all(isinstance(d, dict) for d in dienste):
+        return sorted(dienste, key=_datum)
+    return dienste
+
+def select_window(dienste, start=None, end=None):
+    """
+    Dienste mit start <= datum <= end aus einer nach Datum sortierten Liste
+
+    start und end sind ISO-Daten (YYYY-MM-DD) oder None für offen; die
+    Grenzen werden per Binärsuche bestimmt.
+    """
+    low = bisect.bisect_left(dienste, start, key=_datum) if start else 0
+    high = bisect.bisect_right(dienste, end, key=_datum) if end else len(dienste)
+    return dienste[low:high]
+
+class Shift:
+    """
+    Ein Dienst im Speicher, ohne eigenes Dict pro Eintrag
+
+    Liest sich wie das Dict aus decode_schedule (get, [], in), ist aber
+    deutlich kleiner; für Caches mit vielen Dienstplänen gedacht.
+    """
+
+    __slots__ = ENTRY_FIELDS + ("version",)
+
+    def __init__(self, datum, dienst, position, dienstzeit, version=0):
+        self.datum = datum
+        self.dienst = dienst
+        self.position = position
+        self.dienstzeit = dienstzeit
+        self.version = version
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in Shift.__slots__ else default
+
+    def __getitem__(self, key):
+        if key not in Shift.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in Shift.__slots__
+
+    def __iter__(self):
+        return iter(Shift.__slots__)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in Shift.__slots__}
+
+def compact_dienste(dienste):
+    """
+    Dienste als Shift-Objekte; gleiche Strings (Daten, Dienstcodes, Zeiten)
+    werden über alle Pläne hinweg nur einmal gehalten
+
+    Returns:
+        Liste von Shift, oder None, wenn Einträge Felder außerhalb des
+        Binärformats haben (dann bleibt die Liste von Dicts in Gebrauch)
+    """
+    if not isinstance(dienste, list):
+        return None
+    compact = []
+    for dienst in dienste:
+        if not isinstance(dienst, dict) or set(dienst) - {"version"} != set(ENTRY_FIELDS):
+            return None
+        values = [dienst[field] for field in ENTRY_FIELDS]
+        if not all(isinstance(value, str) for value in values):
+            return None
+        compact.append(Shift(*map(sys.intern, values), dienst.get("version", 0)))
+    return compact
+
+def schedule_size(schedule):
+    """
+    Geschätzter Speicherbedarf eines dekodierten Plans in Bytes
+
+    Strings werden einmal pro Plan gezählt, auch wenn andere Pläne sie
+    mitbenutzen; die Schätzung liegt also eher zu hoch.
+    """
+    size = sys.getsizeof(schedule)
+    for value in schedule.values():
+        size += sys.getsizeof(value)
+    dienste = schedule.get("dienste")
+    if not isinstance(dienste, list):
+        return size
+    seen = set()
+    for dienst in dienste:
+        size += sys.getsizeof(dienst)
+        values = (getattr(dienst, field) for field in Shift.__slots__) if isinstance(dienst, Shift) \
+            else (v for item in dienst.items() for v in item) if isinstance(dienst, dict) else ()
+        for value in values:
+            if id(value) not in seen:
+                seen.add(id(value))
+                size += sys.getsizeof(value)
+    return size
+
+def _same_content(a, b):
+    return all(a.get(field) == b.get(field) for field in ENTRY_FIELDS)
+
+def merge_schedules(stored, incoming, retention_start=None, covered=None):
+    """
+    Führt einen hochgeladenen Ausschnitt in die gespeicherte Historie ein
+
+    Der Upload ist maßgeblich für seinen Zeitraum covered (vom Client gelesen,
+    ohne Angabe erstes bis letztes hochgeladenes Datum): dort werden Einträge
+    ersetzt, hinzugefügt oder entfernt, auch wenn der Upload leer ist. Außerhalb
+    bleibt die Historie erhalten, Einträge vor retention_start werden verworfen.
+    Geänderte Einträge erhalten eine höhere Versionsnummer (SEQUENCE im Feed).
+
+    Beide Listen werden als sortierte Läufe behandelt: die unveränderten
+    Bereiche davor und danach werden per Binärsuche abgegrenzt und als
+    Ganzes übernommen, nur der überlappende Bereich wird verglichen.
+
+    Args:
+        stored: Gespeicherte Dienste, nach Datum sortiert
+        incoming: Hochgeladene Dienste (beliebige Reihenfolge, bei doppeltem Datum gilt der letzte)
+        retention_start: ISO-Datum, ab dem Historie behalten wird, oder None
+        covered: Tuple (erstes, letztes Datum) als ISO-Daten oder None; alle
+            Einträge von incoming müssen darin liegen
+
+    Returns:
+        Tuple (zusammengeführte Liste, Statistik-Dict)
+    """
+    incoming = sorted({_datum(d): d for d in incoming}.values(), key=_datum)
+    stats = {"added": 0, "changed": 0, "unchanged": 0, "removed": 0, "pruned": 0}
+
+    keep_from = bisect.bisect_left(stored, retention_start, key=_datum) if retention_start else 0
+    stats["pruned"] = keep_from
+    if covered is None:
+        if not incoming:
+            return stored[keep_from:], stats
+        covered = _datum(incoming[0]), _datum(incoming[-1])
+
+    low = max(keep_from, bisect.bisect_left(stored, covered[0], key=_datum))
+    high = max(low, bisect.bisect_right(stored, covered[1], key=_datum))
+    merged = stored[keep_from:low]
+
+    overlap = stored[low:high]
+    i = 0
+    for entry in incoming:
+        datum = _datum(entry)
+        while i < len(overlap) and _datum(overlap[i]) < datum:
+            stats["removed"] += 1
+            i += 1
+        previous = overlap[i] if i < len(overlap) and _datum(overlap[i]) == datum else None
+        if previous is None:
+            version = 0
+            stats["added"] += 1
+        else:
+            i += 1
+            version = previous.get("version", 0)
+            if _same_content(previous, entry):
+                stats["unchanged"] += 1
+            else:
+                version = min(version + 1, MAX_UINT16)
+                stats["changed"] += 1
+        item = {field: entry.get(field, "") for field in ENTRY_FIELDS}
+        item["version"] = version
+        merged.append(item)
+    stats["removed"] += len(overlap) - i
+
+    merged.extend(stored[high:])
+    return merged, stats
+
+# Vorgerenderte Feeds (<token>.feed): Kopfzeile als JSON, danach die Bodies
+# der einzelnen Kodierungen (identity, gzip, ggf. br) direkt hintereinander.
+
+FEED_MAGIC = b"VSF1\n"
+
+def encode_feed(window, source_signature, expires_at, bodies):
+    """
+    Packt vorgerenderte Feed-Bodies mit den Angaben, für die sie gültig sind
+
+    Args:
+        window: Zeitfenster (start, ende) des Feeds
+        source_signature: Signatur der .dat-Datei, aus der gerendert wurde
+        expires_at: Ablaufzeitpunkt des Links (Unix-Zeit)
+        bodies: Dict Kodierung -> Bytes
+    """
+    header = {
+        "window": list(window),
+        "source": list(source_signature),
+        "expires_at": expires_at,
+        "encodings": [[encoding, len(body)] for encoding, body in bodies.items()],
+    }
+    return b"".join([FEED_MAGIC, json.dumps(header).encode(), b"\n"] + list(bodies.values()))
+
+def decode_feed(data):
+    """
+    Liest einen vorgerenderten Feed
+
+    Returns:
+        Dict mit window, source, expires_at (wie bei encode_feed) und bodies
+
+    Raises:
+        ScheduleFormatError: bei unlesbaren Daten
+    """
+    if data[:len(FEED_MAGIC)] != FEED_MAGIC:
+        raise ScheduleFormatError("Kein vorgerenderter Feed")
+    header_end = data.find(b"\n", len(FEED_MAGIC))
+    try:
+        header = json.loads(data[len(FEED_MAGIC):header_end])
+        pos = header_end + 1
+        bodies = {}
+        for encoding, length in header["encodings"]:
+            bodies[encoding] = data[pos:pos + length]
+            pos += length
+    except (ValueError, KeyError, TypeError) as e:
+        raise ScheduleFormatError(f"Beschädigter Feed: {e}") from e
+    if pos != len(data):
+        raise ScheduleFormatError("Unerwartete Feed-Länge")
+    return {
+        "window": tuple(header["window"]),
+        "source": tuple(header["source"]),
+        "expires_at": header["expires_at"],
+        "bodies": bodies,
+    }
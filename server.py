@@ -1,39 +1,100 @@
 import os
+import re
+import math
 import time
+import queue
+import atexit
 import json
 import hashlib
-from datetime import datetime
-from flask import Flask, request, jsonify, Response
-from cryptography.fernet import Fernet
+import hmac
+import gzip
+import tempfile
+from datetime import datetime, date, timedelta, timezone
+from zoneinfo import ZoneInfo
+from contextlib import contextmanager
+from flask import Flask, request, jsonify, Response, g
+from werkzeug.middleware.proxy_fix import ProxyFix
+from cryptography.fernet import InvalidToken
 import logging
-from logging.handlers import RotatingFileHandler
-from ics import Calendar, Event
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from shift_events import format_event, calendar_header, calendar_footer, utc_stamp, render_freebusy
+from schedule_store import (
+    encode_schedule, decode_schedule, select_window, merge_schedules, encode_feed, decode_feed,
+    Shift, compact_dienste, schedule_size, ScheduleFormatError
+)
+from server_keys import KeyRing, ReencryptionJob
+from server_lock import StoreLock
+import server_metrics
+from rate_limit import KeyedRateLimiter
+from server_cache import NegativeCache, SignatureCache, SizedCache, file_signature
+from server_notify import NotificationDispatcher, load_subscribers, schedule_event
+
+try:
+    import brotli  # optional, für vorkomprimierte br-Feeds
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 
 # Konstanten und Konfiguration
 DATA_DIR = "user_data"
 ICAL_EXPIRY_DAYS = 30  # Standardwert für Gültigkeitsdauer
+METRICS_TOKEN_FILE = "metrics.token"  # Bearer-Token für /metrics; ohne Datei ist /metrics gesperrt
+TOKEN_PATTERN = re.compile(r"[0-9a-f]{16}")  # Format von generate_token/generate_user_token
+FEED_PAST_DAYS = 90  # Standardfenster: vergangene Dienste nur so weit zurück, None = alle
+MAX_PAST_DAYS = 3650
+TEAMS_FILE = "teams.json"  # {"<team_id>": {"name": "...", "members": ["<token>", {"token": "...", "name": "..."}]}}
+TEAM_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{8,64}")
+SCHEDULE_CACHE_BYTES = 32 * 1024 * 1024  # Obergrenze für dekodierte Dienstpläne im Speicher (geschätzt)
+RENDER_CACHE_ENTRIES = 4000  # gerenderte Ereignisse pro Token und Zeitfenster
+SCHEDULE_TIMEZONE = ZoneInfo("Europe/Berlin")  # Zeitzone der Dienstzeiten, für Free/Busy in UTC
+SCHEDULE_FIELDS = ("datum", "dienst", "position", "dienstzeit", "version")  # Felder der JSON-API
+PRERENDER_ON_WRITE = True  # Feed für das Standardfenster beim Speichern rendern und komprimieren
+FEED_SUFFIX = ".feed"
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+MIN_COMPRESS_BYTES = 512  # kleinere Antworten werden unkomprimiert ausgeliefert
+PRERENDER_CACHE_ENTRIES = 2000
+PRERENDER_MAX_AGE_DAYS = 7  # so lange reicht ein Feed für das Standardfenster, auch wenn es weitergewandert ist
+ENCODED_CACHE_ENTRIES = 4000  # fertig kodierte Antworten pro Feed, Zeitfenster und Kodierung
+HISTORY_RETENTION_DAYS = 730  # Bei mode=merge ältere Dienste verwerfen, None = unbegrenzt
+# Benachrichtigungen bei geänderten Dienstplänen, siehe server_notify.py:
+# {"subscribers": [{"url": "...", "secret": "...", "tokens": [...], "teams": [...]},
+#                  {"type": "websub", "url": "<hub>", "base_url": "https://vivsync.com", "publish_feed_urls": true}]}
+WEBHOOKS_FILE = "webhooks.json"
+
+# Ratenbegrenzung: (Anfragen pro Sekunde, Burst). Begrenzt wird pro Token; die
+# IP-Limits gelten nur für unbekannte Tokens bzw. Teams und für Uploads, die einen
+# neuen Token anlegen, damit viele Abonnenten hinter einer Adresse (Google
+# Kalender, Firmen-NAT) sich nicht gegenseitig ausbremsen.
+CALENDAR_IP_LIMIT = (2.0, 30)
+CALENDAR_TOKEN_LIMIT = (0.2, 10)
+SYNC_IP_LIMIT = (1 / 60, 10)
+SYNC_TOKEN_LIMIT = (1 / 60, 5)
+# Anzahl eigener Reverse-Proxys vor dem Server, deren X-Forwarded-For/-Proto/-Host
+# übernommen werden (ProxyFix). 0, wenn der Server direkt erreichbar ist, sonst
+# könnten Clients ihre Adresse per Header fälschen.
+TRUSTED_PROXY_HOPS = 1
 
 # Sicherstellen, dass das Datenverzeichnis existiert
 if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR, exist_ok=True)
 
-# Verschlüsselungsschlüssel einrichten
-SECRET_KEY_FILE = "secret.key"
-if os.path.exists(SECRET_KEY_FILE):
-    with open(SECRET_KEY_FILE, "rb") as key_file:
-        SECRET_KEY = key_file.read()
-else:
-    # Generiere einen neuen Schlüssel, falls keiner existiert
-    SECRET_KEY = Fernet.generate_key()
-    with open(SECRET_KEY_FILE, "wb") as key_file:
-        key_file.write(SECRET_KEY)
+# Verschlüsselungsschlüssel einrichten (Rotation: python server_keys.py rotate)
+SECRET_KEY_FILE = "secret.key"  # Einzelschlüssel älterer Versionen, wird beim ersten Start übernommen
+KEYS_DIR = "keys"
+REENCRYPT_ON_STARTUP = True  # Dateien mit alten Schlüsseln im Hintergrund umstellen
+
+keyring = KeyRing.load(KEYS_DIR, SECRET_KEY_FILE)
 
-fernet = Fernet(SECRET_KEY)
+LOG_LEVEL = logging.INFO  # DEBUG zeigt die einzelnen Schritte von generate_ical
 
 # Logging konfigurieren
 def configure_logging():
+    """
+    Schreibt Logs über eine Queue in einem eigenen Thread in die Datei,
+    damit Schreibzugriffe und Log-Rotation keine Anfrage blockieren
+    """
     if not os.path.exists('logs'):
         os.mkdir('logs')
     file_handler = RotatingFileHandler(
@@ -47,24 +108,560 @@ def configure_logging():
     )
     file_handler.setFormatter(formatter)
     
-    app.logger.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
+    log_queue = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
     
-    # Werkzeug-Logger konfigurieren (Flask's WSGI-Bibliothek)
+    app.logger.setLevel(LOG_LEVEL)
+    app.logger.addHandler(queue_handler)
+    
+    # Werkzeug-Logger konfigurieren (Flask's WSGI-Bibliothek); Zugriffe
+    # protokolliert log_request selbst, hier nur noch Warnungen und Fehler
     werkzeug_logger = logging.getLogger('werkzeug')
-    werkzeug_logger.setLevel(logging.INFO)
-    werkzeug_logger.addHandler(file_handler)
+    werkzeug_logger.setLevel(logging.WARNING)
+    werkzeug_logger.addHandler(queue_handler)
+    return listener
+
+log_listener = configure_logging()
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(
+        app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS, x_host=TRUSTED_PROXY_HOPS
+    )
+storage_stats = server_metrics.register_storage_gauges(DATA_DIR)
+
+calendar_ip_limiter = KeyedRateLimiter(*CALENDAR_IP_LIMIT)
+calendar_token_limiter = KeyedRateLimiter(*CALENDAR_TOKEN_LIMIT)
+sync_ip_limiter = KeyedRateLimiter(*SYNC_IP_LIMIT)
+sync_token_limiter = KeyedRateLimiter(*SYNC_TOKEN_LIMIT)
+missing_tokens = NegativeCache()
+schedule_cache = SizedCache(SCHEDULE_CACHE_BYTES, "schedule")
+render_cache = SignatureCache(RENDER_CACHE_ENTRIES, "render")
+prerender_cache = SignatureCache(PRERENDER_CACHE_ENTRIES, "prerender")
+encoded_cache = SignatureCache(ENCODED_CACHE_ENTRIES, "encoded")
+# Über den Modulnamen, damit auch ein ausgetauschter Cache gemeldet wird
+server_metrics.register_progress_gauge(
+    "vivsync_schedule_cache", "Dekodierte Dienstpläne im Speicher: Einträge, Bytes (geschätzt), Obergrenze, Verdrängungen",
+    lambda: schedule_cache.stats(), ("entries", "bytes", "max_bytes", "hits", "misses", "evictions", "rejected")
+)
+AVAILABLE_ENCODINGS = ("br", "gzip", "identity") if brotli is not None else ("gzip", "identity")
+store_lock = StoreLock(DATA_DIR)  # Lesen, Zusammenführen und Schreiben einer .dat-Datei als Einheit, auch für die CLI-Werkzeuge
+
+notifier = NotificationDispatcher(lambda: load_webhooks(), log=app.logger).start()
+atexit.register(notifier.stop, 5)
+server_metrics.register_progress_gauge(
+    "vivsync_notification_events", "Änderungsbenachrichtigungen seit Serverstart und in der Warteschlange",
+    notifier.stats, ("queued", "dropped", "delivered", "retried", "failed", "pending", "retrying")
+)
 
-configure_logging()
+reencryption_job = None
+if REENCRYPT_ON_STARTUP and len(keyring.key_ids) > 1:
+    reencryption_job = ReencryptionJob(
+        keyring, DATA_DIR, suffix=(".dat", FEED_SUFFIX), log=app.logger, lock=store_lock
+    ).start()
+    server_metrics.register_progress_gauge(
+        "vivsync_reencryption_files", "Fortschritt der Neuverschlüsselung nach Schlüsselrotation",
+        reencryption_job.progress, ("total", "checked", "reencrypted", "skipped", "failed")
+    )
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Zählt Anfragen und misst die Bearbeitungszeit pro Route"""
+    started = g.get("request_started")
+    route = request.url_rule.rule if request.url_rule else "<unmatched>"
+    server_metrics.REQUESTS.inc(route=route, method=request.method, status=str(response.status_code))
+    if started is not None:
+        duration = time.perf_counter() - started
+        server_metrics.REQUEST_LATENCY.observe(duration, route=route, method=request.method)
+        log_request(response, duration)
+    return response
+
+def log_request(response, duration):
+    """Eine Zugriffszeile pro Anfrage mit Status, Größe und Schrittzeiten"""
+    steps = g.get("step_timings")
+    step_text = ",".join(f"{name}:{seconds * 1000:.1f}" for name, seconds in steps.items()) if steps else "-"
+    app.logger.info(
+        "access remote=%s method=%s path=%s status=%s bytes=%s duration_ms=%.1f steps_ms=%s",
+        request.remote_addr, request.method, request.path, response.status_code,
+        response.calculate_content_length() or 0, duration * 1000, step_text
+    )
+
+@contextmanager
+def timed_step(step):
+    """Misst einen Schritt für /metrics und die Zugriffszeile"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        server_metrics.ICAL_STEPS.observe(elapsed, step=step)
+        timings = g.setdefault("step_timings", {})
+        timings[step] = timings.get(step, 0.0) + elapsed
 
 # Hilfsfunktionen
 def encrypt_data(data):
-    """String mit Fernet symmetrischer Verschlüsselung verschlüsseln"""
-    return fernet.encrypt(data.encode())
+    """String mit dem aktiven Schlüssel verschlüsseln"""
+    return keyring.encrypt(data.encode())
 
 def decrypt_data(data):
-    """Mit Fernet verschlüsselte Daten entschlüsseln"""
-    return fernet.decrypt(data).decode()
+    """Mit einem bekannten Schlüssel verschlüsselte Daten entschlüsseln"""
+    return keyring.decrypt(data).decode()
+
+def encrypt_bytes(data):
+    """Bytes (z.B. Binärformat aus schedule_store) verschlüsseln"""
+    return keyring.encrypt(data)
+
+def decrypt_bytes(data):
+    """Entschlüsselt zu Bytes, ohne Umweg über einen String"""
+    return keyring.decrypt(data)
+
+def client_ip():
+    """IP des Clients (hinter einem Reverse-Proxy von ProxyFix aus X-Forwarded-For gesetzt)"""
+    return request.remote_addr or "-"
+
+def is_valid_token(token):
+    return TOKEN_PATTERN.fullmatch(token) is not None
+
+def check_rate_limit(limiter, key, scope):
+    """
+    Prüft das Kontingent für key
+
+    Returns:
+        None, wenn die Anfrage erlaubt ist, sonst eine 429-Antwort
+    """
+    allowed, retry_after = limiter.allow(key)
+    if allowed:
+        return None
+    route = request.url_rule.rule if request.url_rule else "<unmatched>"
+    server_metrics.RATE_LIMITED.inc(route=route, scope=scope)
+    response = Response("Zu viele Anfragen. Bitte später erneut versuchen.", 429, mimetype='text/plain')
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def normalize_date(value):
+    """ISO-Datum in der Form YYYY-MM-DD; leere Werte bleiben unverändert"""
+    return date.fromisoformat(value).isoformat() if value else value
+
+def feed_window(args, today=None):
+    """
+    Bestimmt das Datumsfenster eines Feeds aus den Query-Parametern
+
+    Unterstützt ?from=YYYY-MM-DD&to=YYYY-MM-DD (jeweils optional) und
+    ?past_days=N bzw. ?past_days=all; ohne Angaben gilt FEED_PAST_DAYS.
+
+    Returns:
+        Tuple (start, end) als ISO-Strings oder None für offen
+
+    Raises:
+        ValueError: bei ungültigen Parametern
+    """
+    today = today or date.today()
+    # Normiert auf YYYY-MM-DD: fromisoformat akzeptiert auch z.B. 20261019, die
+    # Grenzen werden aber als String mit den gespeicherten Daten verglichen
+    start, end = (normalize_date(args.get(name)) for name in ("from", "to"))
+    if start and end and start > end:
+        raise ValueError("'from' liegt nach 'to'")
+    if start is None:
+        past_days = args.get("past_days")
+        if past_days == "all":
+            return None, end or None
+        if past_days is None:
+            past_days = FEED_PAST_DAYS
+        else:
+            past_days = int(past_days)
+            if not 0 <= past_days <= MAX_PAST_DAYS:
+                raise ValueError(f"past_days muss zwischen 0 und {MAX_PAST_DAYS} liegen")
+        if past_days is not None:
+            start = (today - timedelta(days=past_days)).isoformat()
+    return start or None, end or None
+
+def is_default_window(args):
+    """True, wenn die Anfrage kein eigenes Zeitfenster angibt"""
+    return not any(args.get(name) is not None for name in ("from", "to", "past_days"))
+
+def prerendered_window_matches(rendered, window, default_window):
+    """
+    Prüft, ob ein vorgerenderter Feed für das angefragte Zeitfenster ausgeliefert werden kann
+
+    Eigene Zeitfenster brauchen einen exakt passenden Feed. Das Standardfenster
+    wandert täglich mit; dafür genügt ein Feed, der bis zu PRERENDER_MAX_AGE_DAYS
+    Tage früher beginnt (er enthält dann nur ein paar ältere Dienste mehr).
+    """
+    rendered, window = tuple(rendered), tuple(window)
+    if rendered == window:
+        return True
+    if not default_window or rendered[1] != window[1] or not rendered[0] or not window[0]:
+        return False
+    age = (date.fromisoformat(window[0]) - date.fromisoformat(rendered[0])).days
+    return 0 <= age <= PRERENDER_MAX_AGE_DAYS
+
+def load_schedule(token):
+    """
+    Dekodierter Dienstplan eines Tokens, aus dem Cache solange die Datei unverändert ist
+
+    Fehlende Metadaten (altes Listenformat) werden durch Standardwerte ersetzt.
+    Der zurückgegebene Plan wird geteilt und darf nicht verändert werden.
+
+    Returns:
+        Tuple (plan, signatur) oder (None, None), wenn keine Datei existiert
+    """
+    token_file = os.path.join(DATA_DIR, f"{token}.dat")
+    try:
+        signature = file_signature(os.stat(token_file))
+    except FileNotFoundError:
+        missing_tokens.add(token)
+        return None, None
+    schedule = schedule_cache.get(token, signature)
+    if schedule is None:
+        with timed_step("read"):
+            with open(token_file, "rb") as f:
+                encrypted_data = f.read()
+        with timed_step("decrypt"):
+            decrypted_data = decrypt_bytes(encrypted_data)
+        with timed_step("parse"):
+            schedule = decode_schedule(decrypted_data)
+        if schedule["expiry_days"] is None:
+            schedule["expiry_days"] = ICAL_EXPIRY_DAYS
+        if schedule["created_at"] is None:
+            schedule["created_at"] = signature[0] / 1e9
+        # Im Cache als Shift-Objekte statt Dicts, etwa ein Drittel des Speichers
+        compact = compact_dienste(schedule["dienste"])
+        if compact is not None:
+            schedule["dienste"] = compact
+        schedule_cache.put(token, signature, schedule, schedule_size(schedule))
+    return schedule, signature
+
+def check_feed_request(token):
+    """
+    Gemeinsame Prüfungen der Lese-Endpunkte eines Tokens, bevor Daten gelesen werden
+
+    Returns:
+        Tuple (zeitfenster, None) oder (None, fehlerantwort)
+    """
+    # Ungültige Tokens abweisen, bevor das Dateisystem berührt wird
+    if not is_valid_token(token):
+        return None, ("Token nicht gefunden oder Zugriff verweigert", 404)
+    try:
+        window = feed_window(request.args)
+    except ValueError as e:
+        return None, (f"Ungültiger Zeitraum: {e}", 400)
+    if missing_tokens.contains(token) or not os.path.exists(os.path.join(DATA_DIR, f"{token}.dat")):
+        missing_tokens.add(token)
+        # Nur Fehlversuche zählen gegen die IP, das begrenzt das Raten von Tokens
+        limited = check_rate_limit(calendar_ip_limiter, client_ip(), "ip")
+        return None, limited or ("Token nicht gefunden oder Zugriff verweigert", 404)
+    limited = check_rate_limit(calendar_token_limiter, token, "token")
+    if limited:
+        return None, limited
+    return window, None
+
+def schedule_validators(signature, window, variant):
+    """ETag und Last-Modified für eine Sicht auf einen gespeicherten Dienstplan"""
+    raw = f"{variant}:{signature[0]}:{signature[1]}:{window[0]}:{window[1]}"
+    etag = hashlib.sha1(raw.encode()).hexdigest()[:20]
+    last_modified = datetime.fromtimestamp(signature[0] / 1e9, timezone.utc).replace(microsecond=0)
+    return etag, last_modified
+
+def set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # Zwischenspeichern erlaubt, aber vor jeder Verwendung per bedingtem GET prüfen
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def not_modified(etag, last_modified):
+    """304-Antwort, wenn der Client die aktuelle Version schon hat, sonst None"""
+    if request.if_none_match:
+        unchanged = request.if_none_match.contains(etag)
+    elif request.if_modified_since:
+        unchanged = last_modified <= request.if_modified_since
+    else:
+        unchanged = False
+    if not unchanged:
+        return None
+    return set_validators(Response(status=304), etag, last_modified)
+
+def is_expired(schedule):
+    return (time.time() - schedule["created_at"]) > (schedule["expiry_days"] * 24 * 60 * 60)
+
+def render_events(token, schedule, signature, window, label=None):
+    """VEVENT-Blöcke eines Dienstplans im Zeitfenster, zwischengespeichert bis zur nächsten Dateiänderung"""
+    key = (token, window, label)
+    events = render_cache.get(key, signature)
+    if events is None:
+        with timed_step("render"):
+            dtstamp = utc_stamp()
+            chunks = (
+                format_event(dienst, dtstamp, token, app.logger.warning, label)
+                for dienst in select_window(schedule["dienste"], *window)
+            )
+            events = "".join(chunk for chunk in chunks if chunk)
+        render_cache.put(key, signature, events)
+    return events
+
+_teams = {"signature": None, "teams": {}}
+
+def load_teams():
+    """
+    Team-Konfiguration aus TEAMS_FILE, neu gelesen nur wenn sich die Datei ändert
+
+    Returns:
+        Dict team_id -> {"name": ..., "members": [(token, name), ...]}
+    """
+    try:
+        signature = file_signature(os.stat(TEAMS_FILE))
+    except FileNotFoundError:
+        return {}
+    if _teams["signature"] == signature:
+        return _teams["teams"]
+    try:
+        with open(TEAMS_FILE, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+    except (OSError, ValueError) as e:
+        app.logger.error(f"Team-Konfiguration nicht lesbar, verwende bisherige: {e}")
+        return _teams["teams"]
+    teams = {}
+    for team_id, team in raw.items():
+        members = []
+        for member in team.get("members", []):
+            if isinstance(member, str):
+                member = {"token": member}
+            if is_valid_token(member.get("token", "")):
+                members.append((member["token"], member.get("name")))
+            else:
+                app.logger.warning(f"Team {team_id}: ungültiger Token {member.get('token')!r} ignoriert")
+        teams[team_id] = {"name": team.get("name"), "members": members}
+    _teams.update(signature=signature, teams=teams)
+    return teams
+
+_webhooks = {"signature": None, "subscribers": []}
+
+def load_webhooks():
+    """Empfänger für Benachrichtigungen aus WEBHOOKS_FILE, neu gelesen nur wenn sich die Datei ändert"""
+    try:
+        signature = file_signature(os.stat(WEBHOOKS_FILE))
+    except FileNotFoundError:
+        return []
+    if _webhooks["signature"] == signature:
+        return _webhooks["subscribers"]
+    try:
+        with open(WEBHOOKS_FILE, "r", encoding="utf-8") as f:
+            subscribers = load_subscribers(json.load(f), app.logger)
+    except (OSError, ValueError, AttributeError) as e:
+        app.logger.error(f"Webhook-Konfiguration nicht lesbar, verwende bisherige: {e}")
+        return _webhooks["subscribers"]
+    _webhooks.update(signature=signature, subscribers=subscribers)
+    return subscribers
+
+def teams_of(token):
+    return [team_id for team_id, team in load_teams().items() if any(t == token for t, _ in team["members"])]
+
+def schedule_fingerprint(dienste):
+    """Vergleichbare Form eines Dienstplans, unabhängig von Reihenfolge, Versionen und Metadaten"""
+    if not isinstance(dienste, list):
+        return dienste
+    fields = [field for field in SCHEDULE_FIELDS if field != "version"]
+    return sorted(
+        tuple(str(d.get(field) or "") for field in fields) if isinstance(d, dict) else (repr(d),)
+        for d in dienste
+    )
+
+def feed_path(token):
+    return os.path.join(DATA_DIR, f"{token}{FEED_SUFFIX}")
+
+def compress_body(body, encoding):
+    if encoding == "gzip":
+        return gzip.compress(body, GZIP_LEVEL)
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return body
+
+def compressed_bodies(body):
+    """Body in allen verfügbaren Kodierungen"""
+    return {encoding: compress_body(body, encoding) for encoding in AVAILABLE_ENCODINGS}
+
+def encoded_body(key, signature, build):
+    """
+    Antwort-Body in der vom Client bevorzugten Kodierung
+
+    Kodierte Varianten werden pro key zwischengespeichert, solange signature
+    gleich bleibt; build() wird nur bei einem Fehlzugriff aufgerufen.
+
+    Returns:
+        Tuple (kodierung, bytes)
+    """
+    encoding = preferred_encoding(AVAILABLE_ENCODINGS)
+    cached = encoded_cache.get((key, encoding), signature)
+    if cached is not None:
+        return cached
+    body = build().encode()
+    if encoding != "identity" and len(body) >= MIN_COMPRESS_BYTES:
+        with timed_step("compress"):
+            cached = (encoding, compress_body(body, encoding))
+    else:
+        cached = ("identity", body)
+    encoded_cache.put((key, encoding), signature, cached)
+    return cached
+
+def calendar_response(encoding, body, filename):
+    response = Response(body, mimetype='text/calendar')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.vary.add('Accept-Encoding')
+    if encoding != "identity":
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def prerender_feed(token):
+    """
+    Rendert den Feed für das Standardfenster und speichert ihn verschlüsselt neben der .dat-Datei
+
+    Fehler werden nur protokolliert; der Feed wird dann beim Abruf gerendert.
+    """
+    try:
+        schedule, signature = load_schedule(token)
+        if schedule is None or not isinstance(schedule["dienste"], list):
+            return
+        window = feed_window({})
+        body = (calendar_header() + render_events(token, schedule, signature, window) + calendar_footer()).encode()
+        with timed_step("prerender"):
+            expires_at = schedule["created_at"] + schedule["expiry_days"] * 24 * 60 * 60
+            blob = encrypt_bytes(encode_feed(window, signature, expires_at, compressed_bodies(body)))
+            # Eigene Temp-Datei pro Aufruf, parallele Abrufe rendern denselben Token gleichzeitig neu
+            fd, tmp_file = tempfile.mkstemp(prefix=f"{token}.", suffix=".tmp", dir=DATA_DIR)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(blob)
+                os.replace(tmp_file, feed_path(token))
+            except BaseException:
+                os.unlink(tmp_file)
+                raise
+    except Exception as e:
+        app.logger.warning(f"Feed für Token {token} konnte nicht vorgerendert werden: {e!r}")
+
+def preferred_encoding(available):
+    """Beste vom Client akzeptierte Kodierung aus available (br vor gzip vor identity)"""
+    for encoding in ("br", "gzip"):
+        if encoding in available and request.accept_encodings.quality(encoding) > 0:
+            return encoding
+    return "identity"
+
+def serve_prerendered(token, window, default_window=False):
+    """
+    Antwort aus dem vorgerenderten Feed
+
+    default_window: die Anfrage nennt kein eigenes Zeitfenster (siehe prerendered_window_matches)
+
+    Returns:
+        Response, oder None, wenn kein passender Feed vorliegt
+    """
+    try:
+        source = file_signature(os.stat(os.path.join(DATA_DIR, f"{token}.dat")))
+        feed_signature = file_signature(os.stat(feed_path(token)))
+    except FileNotFoundError:
+        return None
+    feed = prerender_cache.get(token, feed_signature)
+    if feed is None:
+        try:
+            with timed_step("read"):
+                with open(feed_path(token), "rb") as f:
+                    blob = f.read()
+            with timed_step("decrypt"):
+                feed = decode_feed(decrypt_bytes(blob))
+        except FileNotFoundError:
+            return None
+        except (ScheduleFormatError, InvalidToken) as e:
+            # Wie ein fehlender Feed behandeln, der Aufrufer rendert dynamisch und ersetzt ihn
+            app.logger.warning(f"Vorgerenderter Feed für Token {token} unlesbar: {e!r}")
+            return None
+        prerender_cache.put(token, feed_signature, feed)
+    if feed["source"] != source or not prerendered_window_matches(feed["window"], window, default_window):
+        return None
+    if time.time() > feed["expires_at"]:
+        return Response("Dieser Link ist abgelaufen. Bitte synchronisieren Sie Ihren Dienstplan erneut.", 410)
+    
+    encoding = preferred_encoding(feed["bodies"])
+    return calendar_response(encoding, feed["bodies"][encoding], f"vivsync-{token}.ics")
+
+def read_schedule(token_file):
+    """Liest, entschlüsselt und dekodiert eine gespeicherte .dat-Datei"""
+    with open(token_file, "rb") as f:
+        return decode_schedule(decrypt_bytes(f.read()))
+
+def read_stored_dienste(token_file):
+    """Gespeicherte Dienste vor einem Upload, None wenn keine Datei existiert oder sie unlesbar ist"""
+    if not os.path.exists(token_file):
+        return None
+    try:
+        return read_schedule(token_file)["dienste"]
+    except Exception as e:
+        app.logger.warning(f"Gespeicherter Stand nicht lesbar, wird ersetzt: {token_file}: {e!r}")
+        return None
+
+def merge_with_history(stored, data, covered=None):
+    """
+    Führt hochgeladene Dienste mit der gespeicherten Historie zusammen
+
+    Returns:
+        Zusammengeführte Liste, oder data unverändert, wenn keine lesbare Historie existiert
+    """
+    if not isinstance(stored, list) or not all(isinstance(d, dict) for d in stored):
+        return data
+    retention_start = None
+    if HISTORY_RETENTION_DAYS is not None:
+        retention_start = (date.today() - timedelta(days=HISTORY_RETENTION_DAYS)).isoformat()
+    merged, stats = merge_schedules(stored, data, retention_start, covered)
+    app.logger.info(
+        "Historie zusammengeführt: %d neu, %d geändert, %d unverändert, %d entfernt, %d verworfen, %d gesamt",
+        stats["added"], stats["changed"], stats["unchanged"], stats["removed"], stats["pruned"], len(merged)
+    )
+    return merged
+
+def merge_range(request_data):
+    """
+    Vom Client vollständig gelesener Zeitraum aus "from"/"to" des Uploads
+
+    Returns:
+        Tuple (erstes, letztes Datum) als ISO-Daten oder None ohne Angabe
+
+    Raises:
+        ValueError: bei unvollständigem oder ungültigem Zeitraum
+    """
+    start, end = request_data.get("from"), request_data.get("to")
+    if start is None and end is None:
+        return None
+    if not isinstance(start, str) or not isinstance(end, str) or not start or not end:
+        raise ValueError("'from' und 'to' müssen zusammen angegeben werden (YYYY-MM-DD)")
+    start, end = normalize_date(start), normalize_date(end)
+    if start > end:
+        raise ValueError("'from' liegt nach 'to'")
+    return start, end
+
+def invalid_merge_entries(data, covered=None):
+    """Fehlermeldung, wenn sich ein Upload nicht zusammenführen lässt, sonst None"""
+    if not isinstance(data, list):
+        return "Für mode=merge müssen die Dienste eine Liste sein"
+    for index, dienst in enumerate(data):
+        if not isinstance(dienst, dict):
+            return f"Dienst {index} ist kein Objekt"
+        datum = dienst.get("datum")
+        try:
+            # Nur die Schreibweise YYYY-MM-DD, zusammengeführt wird per Stringvergleich
+            valid = date.fromisoformat(datum).isoformat() == datum
+        except (TypeError, ValueError):
+            valid = False
+        if not valid:
+            return f"Dienst {index} hat kein gültiges Datum (YYYY-MM-DD)"
+        if covered and not covered[0] <= datum <= covered[1]:
+            return f"Dienst {index} liegt außerhalb von 'from'/'to'"
+        for field in ("dienst", "position", "dienstzeit"):
+            if not isinstance(dienst.get(field, ""), str):
+                return f"Dienst {index}: {field} muss ein String sein"
+    return None
 
 def generate_token():
     """Zufälligen Token für anonyme Benutzer generieren"""
@@ -88,10 +685,24 @@ def receive_data():
             data = request_data["dienste"]
             # Vom Client gesendete Haltbarkeitsdauer verwenden oder Standard
             expiry_days = request_data.get("expiry_days", ICAL_EXPIRY_DAYS)
+            # "merge": Upload in die gespeicherte Historie einfügen, "replace": überschreiben
+            mode = request_data.get("mode", "replace")
         else:
             # Für Abwärtskompatibilität
             data = request_data
             expiry_days = ICAL_EXPIRY_DAYS
+            mode = "replace"
+        if mode not in ("replace", "merge"):
+            return jsonify({"status": "error", "message": f"Unbekannter Modus: {mode}"}), 400
+        covered = None
+        if mode == "merge":
+            try:
+                covered = merge_range(request_data) if isinstance(request_data, dict) else None
+            except ValueError as e:
+                return jsonify({"status": "error", "message": f"Ungültiger Zeitraum: {e}"}), 400
+            invalid = invalid_merge_entries(data, covered)
+            if invalid:
+                return jsonify({"status": "error", "message": invalid}), 400
         
         username = None
         if isinstance(data, list) and len(data) > 0 and isinstance(data[0], dict):
@@ -107,23 +718,46 @@ def receive_data():
             user_token = generate_user_token(username)
             
         app.logger.info(f"Generiere Token für User: {username} -> {user_token}")
-        
-        # Speichere expiry_days mit in den Daten
-        if isinstance(data, list):
-            # Metadaten für spätere Verwendung
-            encrypted_data = encrypt_data(json.dumps({
-                "dienste": data,
-                "expiry_days": expiry_days,
-                "created_at": time.time()
-            }))
-        else:
-            encrypted_data = encrypt_data(json.dumps(data))
-            
         token_file = os.path.join(DATA_DIR, f"{user_token}.dat")
+        # Neue Tokens (auch alle anonymen) zählen zusätzlich gegen die IP
+        if not username or not os.path.exists(token_file):
+            limited = check_rate_limit(sync_ip_limiter, client_ip(), "ip")
+            if limited:
+                return limited
+        limited = check_rate_limit(sync_token_limiter, user_token, "token")
+        if limited:
+            return limited
         
-        app.logger.info(f"Speichere Daten in Datei: {token_file}")
-        with open(token_file, "wb") as f:
-            f.write(encrypted_data)
+        with store_lock:
+            # Nur benannte Benutzer haben eine Historie, zufällige Tokens sind immer neu
+            merge = mode == "merge" and username and isinstance(data, list)
+            # Bisherigen Stand einmal lesen, für die Historie und/oder den Vergleich für Benachrichtigungen
+            stored = read_stored_dienste(token_file) if merge or load_webhooks() else None
+            previous = schedule_fingerprint(stored) if stored is not None else None
+            if merge:
+                data = merge_with_history(stored, data, covered)
+            
+            # Speichere expiry_days mit in den Daten
+            if isinstance(data, list):
+                # Kompaktes Binärformat mit Metadaten (fällt bei Bedarf auf JSON zurück)
+                encrypted_data = encrypt_bytes(encode_schedule(data, username, expiry_days, time.time()))
+            else:
+                encrypted_data = encrypt_data(json.dumps(data))
+            
+            # Atomar ersetzen, damit parallele Abrufe nie eine halb geschriebene Datei lesen
+            app.logger.info(f"Speichere Daten in Datei: {token_file}")
+            tmp_file = token_file + ".tmp"
+            with open(tmp_file, "wb") as f:
+                f.write(encrypted_data)
+            os.replace(tmp_file, token_file)
+        missing_tokens.invalidate(user_token)
+        schedule_cache.invalidate(user_token)
+        if PRERENDER_ON_WRITE and isinstance(data, list):
+            prerender_feed(user_token)
+        if load_webhooks() and schedule_fingerprint(data) != previous:
+            notifier.notify(schedule_event(
+                user_token, teams_of(user_token), len(data) if isinstance(data, list) else None
+            ))
             
         ical_url = f"https://vivsync.com/calendar/{user_token}"
         
@@ -142,109 +776,177 @@ def receive_data():
 @app.route('/calendar/<token>')
 def generate_ical(token):
     """iCal-Datei für den gegebenen Token generieren und zurückgeben"""
-    app.logger.info(f"Anfrage für Kalender mit Token: {token}")
+    app.logger.debug("Anfrage für Kalender mit Token: %s", token)
+    window, rejected = check_feed_request(token)
+    if rejected:
+        return rejected
+    window_start, window_end = window
     try:
-        token_file = os.path.join(DATA_DIR, f"{token}.dat")
-        app.logger.info(f"Prüfe Existenz von Datei: {token_file}")
+        # Vorgerenderter Feed, solange er zur aktuellen .dat-Datei und zum Zeitfenster passt
+        default_window = is_default_window(request.args)
+        if PRERENDER_ON_WRITE:
+            prerendered = serve_prerendered(token, window, default_window)
+            if prerendered is not None:
+                return prerendered
         
-        if not os.path.exists(token_file):
-            app.logger.warning(f"Token-Datei nicht gefunden: {token_file}")
+        app.logger.debug("Lese Dienstplan für Token: %s", token)
+        schedule, signature = load_schedule(token)
+        if schedule is None:
+            app.logger.debug("Token-Datei nicht gefunden für Token: %s", token)
             return "Token nicht gefunden oder Zugriff verweigert", 404
-
-        app.logger.info(f"Lese Token-Datei: {token_file}")
-        with open(token_file, "rb") as f:
-            encrypted_data = f.read()
-        
-        app.logger.info(f"Entschlüssele Daten für Token: {token}")
-        decrypted_data = decrypt_data(encrypted_data)
-        
-        app.logger.info(f"Parse JSON für Token: {token}")
-        json_data = json.loads(decrypted_data)
-        
-        app.logger.info(f"Generiere iCal für Token: {token}")
-        
-        # Prüfe und extrahiere Dienste aus dem neuen Format
-        if isinstance(json_data, dict) and "dienste" in json_data:
-            dienste = json_data["dienste"]
-            # Verwende die benutzerdefinierte Haltbarkeitsdauer oder Standard
-            expiry_days = json_data.get("expiry_days", ICAL_EXPIRY_DAYS)
-            created_at = json_data.get("created_at", os.path.getmtime(token_file))
-        else:
-            # Abwärtskompatibilität für altes Datenformat
-            dienste = json_data
-            expiry_days = ICAL_EXPIRY_DAYS
-            created_at = os.path.getmtime(token_file)
         
         # Prüfe, ob der Link abgelaufen ist
-        if (time.time() - created_at) > (expiry_days * 24 * 60 * 60):
-            app.logger.warning(f"Token abgelaufen: {token} (Erstellt: {datetime.fromtimestamp(created_at)})")
+        if is_expired(schedule):
+            app.logger.warning(f"Token abgelaufen: {token} (Erstellt: {datetime.fromtimestamp(schedule['created_at'])})")
             return "Dieser Link ist abgelaufen. Bitte synchronisieren Sie Ihren Dienstplan erneut.", 410
         
         # Stellen Sie sicher, dass dienste eine Liste ist
+        dienste = schedule["dienste"]
         if not isinstance(dienste, list):
             app.logger.error(f"Datenformatfehler: Dienste ist keine Liste für Token {token}, Typ: {type(dienste)}")
             return "Fehler bei der Datenverarbeitung: Ungültiges Dienstplanformat", 500
         
-        # iCal-Kalender erstellen
-        cal = Calendar()
+        # iCal-Kalender erstellen (Ereignisse aus dem Render-Cache, solange sich die Datei nicht ändert)
+        app.logger.debug("Generiere iCal für Token: %s", token)
+        encoding, body = encoded_body(
+            ("calendar", token, window), signature,
+            lambda: calendar_header() + render_events(token, schedule, signature, window) + calendar_footer()
+        )
         
-        for dienst in dienste:
-            event = Event()
-            
-            # Titel setzen
-            title = dienst.get('dienst', '')
-            position = dienst.get('position', '')
-            if position:
-                title = f"{title} - {position}"
-            event.name = title
-            
-            # Beschreibung
-            description = "Automatisch synchronisiert mit VivSync"
-            dienstzeit = dienst.get('dienstzeit', '')
-            if dienstzeit:
-                description += f"\nDienstzeit: {dienstzeit}"
-            event.description = description
-            
-            # Datum/Zeit setzen
-            try:
-                event_date = datetime.strptime(dienst.get('datum', ''), "%Y-%m-%d")
-                event.begin = event_date
-                
-                # Wenn Dienstzeit vorhanden, Start- und Endzeit setzen
-                if dienstzeit:
-                    try:
-                        start_time, end_time = dienstzeit.split(' - ')
-                        start_hour, start_minute = map(int, start_time.split(':'))
-                        end_hour, end_minute = map(int, end_time.split(':'))
-                        
-                        event.begin = event.begin.replace(hour=start_hour, minute=start_minute)
-                        event.end = event.begin.replace(hour=end_hour, minute=end_minute)
-                        
-                        # Falls Endzeit vor Startzeit (z.B. bei Nachtdienst)
-                        if event.end < event.begin:
-                            event.end = event.end.replace(day=event.end.day + 1)
-                    except Exception as time_err:
-                        app.logger.warning(f"Fehler beim Parsen der Dienstzeit für {dienst.get('datum')}: {time_err}")
-                        event.make_all_day()
-                else:
-                    # Ganztägiger Termin, wenn keine Dienstzeit angegeben
-                    event.make_all_day()
-                
-                cal.events.add(event)
-            except Exception as date_err:
-                app.logger.warning(f"Fehler beim Parsen des Datums {dienst.get('datum')}: {date_err}")
-                continue
+        # Fehlenden oder veralteten Feed ersetzen; das Standardfenster ist erst nach
+        # PRERENDER_MAX_AGE_DAYS zu alt, nicht schon an jedem neuen Tag
+        if PRERENDER_ON_WRITE and default_window:
+            prerender_feed(token)
         
         # iCal-Datei zurückgeben
-        ical_data = cal.serialize()
-        response = Response(ical_data, mimetype='text/calendar')
-        response.headers['Content-Disposition'] = f'attachment; filename=vivsync-{token}.ics'
-        return response
+        return calendar_response(encoding, body, f"vivsync-{token}.ics")
         
     except Exception as e:
         app.logger.error(f"Fehler bei der Kalendergenerierung für Token {token}: {str(e)}", exc_info=True)
         return "Interner Serverfehler bei der Kalendergenerierung", 500
 
+@app.route('/team/<team_id>')
+def generate_team_ical(team_id):
+    """Gemeinsamer Kalender aller Mitglieder eines Teams aus teams.json"""
+    if not TEAM_ID_PATTERN.fullmatch(team_id):
+        return "Team nicht gefunden", 404
+    try:
+        window = feed_window(request.args)
+    except ValueError as e:
+        return f"Ungültiger Zeitraum: {e}", 400
+    try:
+        team = load_teams().get(team_id)
+        if team is None:
+            # Nur Fehlversuche zählen gegen die IP, wie bei /calendar/<token>
+            return check_rate_limit(calendar_ip_limiter, client_ip(), "ip") or ("Team nicht gefunden", 404)
+        limited = check_rate_limit(calendar_token_limiter, f"team:{team_id}", "token")
+        if limited:
+            return limited
+        
+        members = []
+        for token, name in team["members"]:
+            if missing_tokens.contains(token):
+                continue
+            schedule, signature = load_schedule(token)
+            if schedule is None or not isinstance(schedule["dienste"], list) or is_expired(schedule):
+                app.logger.debug("Team %s: Mitglied %s ohne gültigen Dienstplan", team_id, token)
+                continue
+            members.append((token, name, schedule, signature))
+        
+        def build():
+            chunks = [calendar_header(team["name"])]
+            for token, name, schedule, signature in members:
+                chunks.append(render_events(token, schedule, signature, window, label=name))
+            chunks.append(calendar_footer())
+            return "".join(chunks)
+        
+        # Neu zusammengesetzt wird nur, wenn sich ein Mitglied oder die Team-Konfiguration ändert
+        team_signature = (team["name"],) + tuple((token, name, signature) for token, name, _, signature in members)
+        encoding, body = encoded_body(("team", team_id, window), team_signature, build)
+        return calendar_response(encoding, body, f"vivsync-team-{team_id}.ics")
+    except Exception as e:
+        app.logger.error(f"Fehler bei der Team-Kalendergenerierung für {team_id}: {str(e)}", exc_info=True)
+        return "Interner Serverfehler bei der Kalendergenerierung", 500
+
+def load_readable_schedule(token):
+    """
+    Dienstplan für die Lese-APIs
+
+    Returns:
+        Tuple (plan, signatur, None) oder (None, None, (meldung, status))
+    """
+    schedule, signature = load_schedule(token)
+    if schedule is None:
+        return None, None, ("Token nicht gefunden oder Zugriff verweigert", 404)
+    if is_expired(schedule):
+        return None, None, ("Dieser Link ist abgelaufen. Bitte synchronisieren Sie Ihren Dienstplan erneut.", 410)
+    if not isinstance(schedule["dienste"], list):
+        app.logger.error(f"Datenformatfehler: Dienste ist keine Liste für Token {token}")
+        return None, None, ("Fehler bei der Datenverarbeitung: Ungültiges Dienstplanformat", 500)
+    return schedule, signature, None
+
+@app.route('/api/schedule/<token>')
+def schedule_json(token):
+    """Dienste im Zeitfenster als kompaktes JSON (für Dashboards und Tauschbörsen)"""
+    window, rejected = check_feed_request(token)
+    if isinstance(rejected, tuple):
+        message, status = rejected
+        return jsonify({"status": "error", "message": message, "error_code": status}), status
+    if rejected:
+        return rejected
+    try:
+        schedule, signature, error = load_readable_schedule(token)
+        if error:
+            message, status = error
+            return jsonify({"status": "error", "message": message, "error_code": status}), status
+        
+        etag, last_modified = schedule_validators(signature, window, "json")
+        unchanged = not_modified(etag, last_modified)
+        if unchanged:
+            return unchanged
+        
+        dienste = [
+            {field: dienst[field] for field in SCHEDULE_FIELDS if field in dienst}
+            for dienst in select_window(schedule["dienste"], *window)
+            if isinstance(dienst, (dict, Shift))
+        ]
+        response = jsonify({"from": window[0], "to": window[1], "dienste": dienste})
+        return set_validators(response, etag, last_modified)
+    except Exception as e:
+        app.logger.error(f"Fehler in /api/schedule für Token {token}: {str(e)}", exc_info=True)
+        return jsonify({"status": "error", "message": "Interner Serverfehler", "error_code": 500}), 500
+
+@app.route('/freebusy/<token>')
+def generate_freebusy(token):
+    """Belegte Zeiten als VFREEBUSY, ohne Dienstbezeichnungen"""
+    window, rejected = check_feed_request(token)
+    if rejected:
+        return rejected
+    try:
+        schedule, signature, error = load_readable_schedule(token)
+        if error:
+            return error
+        
+        etag, last_modified = schedule_validators(signature, window, "freebusy")
+        unchanged = not_modified(etag, last_modified)
+        if unchanged:
+            return unchanged
+        
+        def build():
+            with timed_step("render"):
+                return render_freebusy(
+                    select_window(schedule["dienste"], *window), SCHEDULE_TIMEZONE, token,
+                    date.fromisoformat(window[0]) if window[0] else None,
+                    date.fromisoformat(window[1]) if window[1] else None
+                )
+        
+        encoding, body = encoded_body(("freebusy", token, window), signature, build)
+        response = calendar_response(encoding, body, f"vivsync-freebusy-{token}.ics")
+        return set_validators(response, etag, last_modified)
+    except Exception as e:
+        app.logger.error(f"Fehler bei Free/Busy für Token {token}: {str(e)}", exc_info=True)
+        return "Interner Serverfehler bei der Kalendergenerierung", 500
+
 @app.route('/')
 def index():
     """Einfache Homepage"""
@@ -267,6 +969,23 @@ def index():
     </html>
     """
 
+def read_metrics_token():
+    """Token aus METRICS_TOKEN_FILE, None wenn die Datei fehlt oder leer ist"""
+    try:
+        with open(METRICS_TOKEN_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+@app.route('/metrics')
+def metrics():
+    """Metriken im Prometheus-Textformat, nur mit Authorization: Bearer <Inhalt von METRICS_TOKEN_FILE>"""
+    expected = read_metrics_token()
+    supplied = request.headers.get("Authorization", "")
+    if not expected or not hmac.compare_digest(supplied.encode(), f"Bearer {expected}".encode()):
+        return "Zugriff verweigert", 403
+    return Response(server_metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.errorhandler(404)
 def not_found(e):
     """Handler für 404-Fehler"""
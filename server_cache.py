@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict
+
+import server_metrics
+
+# Caches für den Server; Treffer und Fehlzugriffe landen in /metrics
+
+NEGATIVE_CACHE_TTL = 300  # Sekunden, die ein unbekannter Token als unbekannt gilt
+NEGATIVE_CACHE_SIZE = 50000
+
+class NegativeCache:
+    """
+    Merkt sich Tokens ohne Datei, damit wiederholte Anfragen kein Dateisystemzugriff kosten
+
+    Einträge verfallen nach ttl Sekunden und werden beim Schreiben eines
+    Tokens sofort entfernt (invalidate).
+    """
+
+    def __init__(self, ttl=NEGATIVE_CACHE_TTL, max_size=NEGATIVE_CACHE_SIZE, name="negative"):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def contains(self, key):
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                expires = None
+        server_metrics.record_cache_lookup(self.name, expires is not None)
+        return expires is not None
+
+    def add(self, key):
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+class SignatureCache:
+    """
+    LRU-Cache für aus Dateien abgeleitete Werte (dekodierte Pläne, gerenderte Feeds)
+
+    Jeder Eintrag speichert die Signatur der Quelldatei (mtime, Größe); ändert
+    sich die Datei, gilt der Eintrag als veraltet und wird neu berechnet.
+    """
+
+    def __init__(self, max_entries, name):
+        self.max_entries = max_entries
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, signature):
+        with self._lock:
+            entry = self._entries.get(key)
+            hit = entry is not None and entry[0] == signature
+            if hit:
+                self._entries.move_to_end(key)
+        server_metrics.record_cache_lookup(self.name, hit)
+        return entry[1] if hit else None
+
+    def put(self, key, signature, value):
+        with self._lock:
+            self._entries[key] = (signature, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+class SizedCache:
+    """
+    LRU-Cache wie SignatureCache, aber begrenzt durch den Speicherbedarf der Einträge
+
+    Die Größe eines Eintrags gibt der Aufrufer beim Einfügen an (Schätzung in
+    Bytes). Übersteigt die Summe max_bytes, werden die am längsten nicht
+    benutzten Einträge verdrängt; veraltete Einträge werden beim Zugriff
+    sofort freigegeben.
+    """
+
+    def __init__(self, max_bytes, name):
+        self.max_bytes = max_bytes
+        self.name = name
+        self._entries = OrderedDict()  # key -> (signatur, wert, größe)
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "rejected": 0}
+        self._lock = threading.Lock()
+
+    def get(self, key, signature):
+        with self._lock:
+            entry = self._entries.get(key)
+            hit = entry is not None and entry[0] == signature
+            if hit:
+                self._entries.move_to_end(key)
+            elif entry is not None:
+                self._remove(key)
+            self._stats["hits" if hit else "misses"] += 1
+        server_metrics.record_cache_lookup(self.name, hit)
+        return entry[1] if hit else None
+
+    def put(self, key, signature, value, size):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                # Passt nie hinein, würde nur den übrigen Cache leeren
+                self._stats["rejected"] += 1
+                return
+            self._entries[key] = (signature, value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[2]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+        return stats
+
+    def __len__(self):
+        return len(self._entries)
+
+def file_signature(stat_result):
+    """Signatur einer Datei für SignatureCache aus os.stat"""
+    return (stat_result.st_mtime_ns, stat_result.st_size)
@@ -0,0 +1,279 @@
+import os
+import sys
+import threading
+import time
+import logging
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+
+from rate_limit import TokenBucket
+from server_lock import StoreLock
+
+# Schlüsselverwaltung für die gespeicherten Dienstpläne.
+#
+# Jeder Schlüssel liegt als <key_id>.key im Schlüsselverzeichnis, die Datei
+# "active" enthält die ID des Schlüssels für neue Daten. Gespeicherte Blobs
+# beginnen mit "#<key_id>#", damit beim Lesen direkt der richtige Schlüssel
+# gewählt wird. Blobs ohne Präfix (vor der Rotation geschrieben) werden mit
+# allen bekannten Schlüsseln versucht.
+
+KEY_SUFFIX = ".key"
+ACTIVE_FILE = "active"
+KEY_ID_MARKER = b"#"
+REENCRYPT_FILES_PER_SECOND = 20
+REENCRYPT_LOG_EVERY = 500
+
+logger = logging.getLogger(__name__)
+
+def new_key_id():
+    return os.urandom(4).hex()
+
+class KeyRing:
+    """Alle bekannten Schlüssel, der aktive wird für neue Daten verwendet"""
+
+    def __init__(self, keys, active_id, keys_dir=None):
+        if active_id not in keys:
+            raise ValueError(f"Aktiver Schlüssel {active_id} nicht vorhanden")
+        self.keys_dir = keys_dir
+        self.active_id = active_id
+        self._fernets = {key_id: Fernet(key) for key_id, key in keys.items()}
+        # Aktiver Schlüssel zuerst, damit aktuelle Daten ohne Fehlversuch entschlüsselt werden
+        ordered = [self._fernets[active_id]] + [f for k, f in self._fernets.items() if k != active_id]
+        self._multi = MultiFernet(ordered)
+
+    @classmethod
+    def load(cls, keys_dir, legacy_key_file=None, create=True):
+        """
+        Lädt den Schlüsselbund aus keys_dir
+
+        Beim ersten Start wird der bisherige Einzelschlüssel (secret.key)
+        übernommen bzw. ein neuer Schlüssel erzeugt. Mit create=False werden
+        keine Dateien angelegt (z.B. für Werkzeuge, die nur lesen).
+        """
+        keys = {}
+        if os.path.isdir(keys_dir):
+            for name in os.listdir(keys_dir):
+                if name.endswith(KEY_SUFFIX):
+                    with open(os.path.join(keys_dir, name), "rb") as f:
+                        keys[name[:-len(KEY_SUFFIX)]] = f.read().strip()
+
+        active_file = os.path.join(keys_dir, ACTIVE_FILE)
+        if not keys and not create:
+            if legacy_key_file and os.path.exists(legacy_key_file):
+                with open(legacy_key_file, "rb") as f:
+                    return cls({"legacy": f.read().strip()}, "legacy", None)
+            raise ValueError(f"Keine Schlüssel in {keys_dir} gefunden")
+        if not keys:
+            os.makedirs(keys_dir, exist_ok=True)
+            if legacy_key_file and os.path.exists(legacy_key_file):
+                with open(legacy_key_file, "rb") as f:
+                    key = f.read().strip()
+            else:
+                key = Fernet.generate_key()
+            key_id = new_key_id()
+            _write_key(keys_dir, key_id, key)
+            _write_active(keys_dir, key_id)
+            keys[key_id] = key
+
+        try:
+            with open(active_file, "r", encoding="ascii") as f:
+                active_id = f.read().strip()
+        except OSError:
+            active_id = ""
+        if active_id not in keys:
+            raise ValueError(f"Aktiver Schlüssel '{active_id}' fehlt in {keys_dir}")
+        return cls(keys, active_id, keys_dir)
+
+    @property
+    def key_ids(self):
+        return list(self._fernets)
+
+    def encrypt(self, data):
+        """Verschlüsselt Bytes mit dem aktiven Schlüssel und stellt die Schlüssel-ID voran"""
+        token = self._fernets[self.active_id].encrypt(data)
+        return KEY_ID_MARKER + self.active_id.encode() + KEY_ID_MARKER + token
+
+    def decrypt(self, blob):
+        """
+        Entschlüsselt einen Blob mit dem passenden Schlüssel
+
+        Raises:
+            InvalidToken: wenn kein Schlüssel passt
+        """
+        key_id, token = split_blob(blob)
+        fernet = self._fernets.get(key_id) if key_id else None
+        if fernet is not None:
+            return fernet.decrypt(token)
+        return self._multi.decrypt(token)
+
+    def needs_reencrypt(self, blob):
+        """True, wenn der Blob nicht mit dem aktiven Schlüssel verschlüsselt ist"""
+        return split_blob(blob)[0] != self.active_id
+
+    def reencrypt(self, blob):
+        return self.encrypt(self.decrypt(blob))
+
+def split_blob(blob):
+    """Trennt Schlüssel-ID und Fernet-Token; ID ist None bei Blobs ohne Präfix"""
+    if blob[:1] == KEY_ID_MARKER:
+        end = blob.find(KEY_ID_MARKER, 1)
+        if end > 0:
+            return blob[1:end].decode("ascii", "replace"), blob[end + 1:]
+    return None, blob
+
+def _write_key(keys_dir, key_id, key):
+    path = os.path.join(keys_dir, key_id + KEY_SUFFIX)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+
+def _write_active(keys_dir, key_id):
+    tmp_file = os.path.join(keys_dir, ACTIVE_FILE + ".tmp")
+    with open(tmp_file, "w", encoding="ascii") as f:
+        f.write(key_id)
+    os.replace(tmp_file, os.path.join(keys_dir, ACTIVE_FILE))
+
+def rotate_key(keys_dir):
+    """
+    Erzeugt einen neuen Schlüssel und macht ihn aktiv
+
+    Alte Schlüssel bleiben zum Lesen erhalten. Der Server verwendet den neuen
+    Schlüssel nach einem Neustart; alte Dateien werden beim nächsten Schreiben
+    oder durch die Hintergrund-Neuverschlüsselung umgestellt.
+    """
+    key_id = new_key_id()
+    _write_key(keys_dir, key_id, Fernet.generate_key())
+    _write_active(keys_dir, key_id)
+    return key_id
+
+class ReencryptionJob:
+    """
+    Verschlüsselt alle Dateien im Hintergrund mit dem aktiven Schlüssel neu
+
+    Die Rate ist über einen Token-Bucket begrenzt, damit der laufende Betrieb
+    keine I/O-Spitzen sieht. Dateien, die während der Bearbeitung neu
+    geschrieben wurden, werden übersprungen (sie haben dann schon den neuen Schlüssel).
+    lock ist die Sperre, unter der auch der Server Dateien schreibt (StoreLock,
+    wirkt auch zwischen Prozessen); Prüfen und Ersetzen geschehen darunter. Zugriffs- und Änderungszeit bleiben erhalten,
+    weil ältere Dateien ihr Erstellungsdatum (und damit den Ablauf) daraus beziehen.
+    """
+
+    def __init__(self, keyring, data_dir, files_per_second=REENCRYPT_FILES_PER_SECOND, suffix=".dat", log=None,
+                 lock=None):
+        self.keyring = keyring
+        self.lock = lock or threading.Lock()
+        self.log = log or logger
+        self.data_dir = data_dir
+        self.suffix = suffix
+        self.rate_limiter = TokenBucket(files_per_second)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._progress = {
+            "running": False, "total": 0, "checked": 0, "reencrypted": 0,
+            "skipped": 0, "failed": 0, "started_at": None, "finished_at": None
+        }
+
+    def progress(self):
+        with self._lock:
+            return dict(self._progress)
+
+    def _count(self, field):
+        with self._lock:
+            self._progress[field] += 1
+            return self._progress[field]
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="reencryption", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        paths = [entry.path for entry in os.scandir(self.data_dir)
+                 if entry.is_file() and entry.name.endswith(self.suffix)]
+        with self._lock:
+            self._progress.update(running=True, total=len(paths), started_at=time.time(), finished_at=None)
+        self.log.info(f"Neuverschlüsselung gestartet: {len(paths)} Dateien, Schlüssel {self.keyring.active_id}")
+        try:
+            for path in paths:
+                if self._stop.is_set():
+                    self.log.info("Neuverschlüsselung abgebrochen")
+                    break
+                self._process(path)
+                checked = self._count("checked")
+                if checked % REENCRYPT_LOG_EVERY == 0:
+                    self.log.info(f"Neuverschlüsselung: {self.format_progress()}")
+        finally:
+            with self._lock:
+                self._progress.update(running=False, finished_at=time.time())
+            self.log.info(f"Neuverschlüsselung beendet: {self.format_progress()}")
+
+    def _process(self, path):
+        try:
+            # Auch reine Prüfungen zählen, damit der Scan großer Bestände gleichmäßig läuft
+            self.rate_limiter.acquire()
+            stat_before = os.stat(path)
+            with open(path, "rb") as f:
+                blob = f.read()
+            if not self.keyring.needs_reencrypt(blob):
+                self._count("skipped")
+                return
+            new_blob = self.keyring.reencrypt(blob)
+            with self.lock:
+                # Nicht überschreiben, wenn die Datei inzwischen neu geschrieben wurde
+                if os.stat(path).st_mtime_ns != stat_before.st_mtime_ns:
+                    self._count("skipped")
+                    return
+                tmp_file = path + ".reenc"
+                with open(tmp_file, "wb") as f:
+                    f.write(new_blob)
+                os.replace(tmp_file, path)
+                os.utime(path, ns=(stat_before.st_atime_ns, stat_before.st_mtime_ns))
+            self._count("reencrypted")
+        except (OSError, InvalidToken) as e:
+            self.log.warning(f"Neuverschlüsselung fehlgeschlagen für {path}: {e!r}")
+            self._count("failed")
+
+    def format_progress(self):
+        p = self.progress()
+        return (f"{p['checked']}/{p['total']} geprüft, {p['reencrypted']} neu verschlüsselt, "
+                f"{p['skipped']} übersprungen, {p['failed']} Fehler")
+
+def main(argv):
+    """Kommandozeile: rotate (neuen Schlüssel aktivieren), reencrypt (Bestand umstellen), status"""
+    import argparse
+    parser = argparse.ArgumentParser(description="VivSync Schlüsselverwaltung")
+    parser.add_argument("command", choices=("rotate", "reencrypt", "status"))
+    parser.add_argument("--keys-dir", default="keys")
+    parser.add_argument("--data-dir", default="user_data")
+    parser.add_argument("--legacy-key", default="secret.key")
+    parser.add_argument("--rate", type=float, default=REENCRYPT_FILES_PER_SECOND, help="Dateien pro Sekunde")
+    args = parser.parse_args(argv)
+
+    keyring = KeyRing.load(args.keys_dir, args.legacy_key)
+    if args.command == "rotate":
+        print(f"Neuer aktiver Schlüssel: {rotate_key(args.keys_dir)} (Server neu starten)")
+    elif args.command == "status":
+        print(f"Aktiver Schlüssel: {keyring.active_id}, bekannt: {', '.join(keyring.key_ids)}")
+    else:
+        # Gleiche Sperre wie der Server, damit ein gleichzeitiger Upload nicht überschrieben wird
+        job = ReencryptionJob(keyring, args.data_dir, args.rate, lock=StoreLock(args.data_dir))
+        job.start()
+        try:
+            while job.progress()["running"] or job.progress()["started_at"] is None:
+                time.sleep(1)
+                print(job.format_progress(), flush=True)
+        except KeyboardInterrupt:
+            job.stop()
+        print(job.format_progress())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
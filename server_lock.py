@@ -0,0 +1,48 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Sperre für das Datenverzeichnis, die auch zwischen Prozessen wirkt: server.py
+# und die Werkzeuge (server_keys.py reencrypt, admin.py purge) lesen, ändern und
+# schreiben dieselben .dat-Dateien. Gesperrt wird per flock auf LOCK_FILE im
+# Datenverzeichnis; ohne fcntl (Windows) nur innerhalb des Prozesses.
+
+LOCK_FILE = ".store.lock"
+
+class StoreLock:
+    """Thread- und Prozesssperre, verwendbar wie threading.Lock (with store_lock: ...)"""
+
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, LOCK_FILE)
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if fcntl is None:
+            return True
+        try:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return True
+
+    def release(self):
+        try:
+            if fcntl is not None and self._fd is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._thread_lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,233 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Einfache Metriken im Prometheus-Textformat, ohne zusätzliche Abhängigkeiten
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monoton steigender Zähler mit optionalen Labels"""
+
+    type_name = "counter"
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, key, value
+
+class Gauge:
+    """Momentanwert, der beim Abruf über eine Funktion berechnet wird"""
+
+    type_name = "gauge"
+
+    def __init__(self, name, description, callback):
+        self.name = name
+        self.description = description
+        self.callback = callback
+
+    def samples(self):
+        result = self.callback()
+        if isinstance(result, dict):
+            # {((label, wert), ...): wert} für Gauges mit Labels
+            for key, value in result.items():
+                yield self.name, key, value
+        else:
+            yield self.name, (), result
+
+class Histogram:
+    """Verteilung von Messwerten (z.B. Latenzen) in festen Buckets"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, description, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series[0]), series[1], series[2]) for key, series in self._series.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", key + (("le", _format_value(float(bound))),), cumulative
+            yield f"{self.name}_sum", key, total
+            yield f"{self.name}_count", key, count
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Alle Metriken im Prometheus-Textformat (Version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "vivsync_http_requests_total", "Anzahl HTTP-Anfragen pro Route, Methode und Status",
+    ("route", "method", "status")
+))
+REQUEST_LATENCY = registry.register(Histogram(
+    "vivsync_http_request_duration_seconds", "Bearbeitungszeit der HTTP-Anfragen pro Route",
+    ("route", "method")
+))
+ICAL_STEPS = registry.register(Histogram(
+    "vivsync_ical_step_duration_seconds",
+    "Dauer der Einzelschritte in generate_ical (read, decrypt, parse, render)",
+    ("step",)
+))
+CACHE_LOOKUPS = registry.register(Counter(
+    "vivsync_cache_lookups_total", "Cache-Zugriffe pro Cache und Ergebnis (hit/miss)",
+    ("cache", "result")
+))
+
+def record_cache_lookup(cache, hit):
+    """Von Caches aufzurufen, um Treffer und Fehlzugriffe zu zählen"""
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+def _cache_hit_ratios():
+    totals = {}
+    for _, labels, value in CACHE_LOOKUPS.samples():
+        labels = dict(labels)
+        hits, lookups = totals.get(labels["cache"], (0, 0))
+        if labels["result"] == "hit":
+            hits += value
+        totals[labels["cache"]] = (hits, lookups + value)
+    return {(("cache", cache),): (hits / lookups if lookups else 0.0) for cache, (hits, lookups) in totals.items()}
+
+registry.register(Gauge(
+    "vivsync_cache_hit_ratio", "Trefferquote pro Cache seit Serverstart", _cache_hit_ratios
+))
+
+class StorageStats:
+    """Anzahl gespeicherter Tokens und belegte Bytes, mit kurzer Zwischenspeicherung des Scans"""
+
+    def __init__(self, data_dir, max_age=30):
+        self.data_dir = data_dir
+        self.max_age = max_age
+        self._scanned_at = 0.0
+        self._tokens = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        with self._lock:
+            if time.monotonic() - self._scanned_at < self.max_age:
+                return
+            tokens = 0
+            total_bytes = 0
+            try:
+                with os.scandir(self.data_dir) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            total_bytes += entry.stat().st_size
+                            if entry.name.endswith(".dat"):
+                                tokens += 1
+            except OSError:
+                pass
+            self._tokens, self._bytes = tokens, total_bytes
+            self._scanned_at = time.monotonic()
+
+    def token_count(self):
+        self._refresh()
+        return self._tokens
+
+    def bytes_on_disk(self):
+        self._refresh()
+        return self._bytes
+
+def register_storage_gauges(data_dir):
+    stats = StorageStats(data_dir)
+    registry.register(Gauge("vivsync_stored_tokens", "Anzahl gespeicherter Tokens", stats.token_count))
+    registry.register(Gauge("vivsync_storage_bytes", "Belegter Speicher im Datenverzeichnis in Bytes", stats.bytes_on_disk))
+    return stats
+
+def register_progress_gauge(name, description, progress, fields):
+    """Gauge mit einem Label 'state' pro Feld aus dem Fortschritts-Dict"""
+    def values():
+        current = progress()
+        return {(("state", field),): current.get(field, 0) for field in fields}
+    return registry.register(Gauge(name, description, values))
+
+RATE_LIMITED = registry.register(Counter(
+    "vivsync_rate_limited_total", "Wegen Ratenbegrenzung abgewiesene Anfragen pro Route und Bereich (ip/token)",
+    ("route", "scope")
+))
+NOTIFICATIONS = registry.register(Counter(
+    "vivsync_notifications_total", "Zustellungen von Änderungsbenachrichtigungen pro Typ und Ergebnis",
+    ("kind", "result")
+))
@@ -0,0 +1,392 @@
+import collections
+import hashlib
+import heapq
+import hmac
+import json
+import logging
+import queue
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+
+import server_metrics
+
+# Benachrichtigungen über geänderte Dienstpläne an Webhooks und WebSub-Hubs.
+#
+# receive_data reiht ein Ereignis pro geändertem Token ein (notify), ein
+# Hintergrund-Thread sammelt Ereignisse für BATCH_WINDOW Sekunden und fasst sie
+# pro Empfänger zusammen. Zugestellt wird pro Empfänger in einem eigenen Thread,
+# ein langsamer oder nicht erreichbarer Empfänger hält die anderen also nicht
+# auf. Fehlgeschlagene Zustellungen werden mit exponentiell wachsendem Abstand
+# wiederholt. Ist die Warteschlange voll, wird das Ereignis verworfen; die
+# Kalender-Apps finden die Änderung dann weiterhin über ihr normales Polling.
+#
+# Tokens und Team-IDs sind zugleich die Zugangsdaten der Feeds und verlassen
+# den Server deshalb nicht im Klartext:
+# Webhook:  POST JSON {"events": [...]} an die URL; statt Token und Team-IDs
+#           enthalten die Ereignisse HMAC-SHA256(secret, Wert) (ohne secret
+#           mit der URL als Schlüssel), mit secret zusätzlich
+#           X-Hub-Signature-256: sha256=<HMAC des Bodys>
+# WebSub:   POST hub.mode=publish&hub.url=<Feed-URL>... an den Hub; die
+#           Feed-URLs enthalten die Tokens, daher nur mit publish_feed_urls
+
+BATCH_WINDOW = 2.0  # Sekunden, die Ereignisse vor dem Versand gesammelt werden
+MAX_BATCH = 100  # Ereignisse pro Zustellung
+QUEUE_SIZE = 10000
+MAX_ATTEMPTS = 6
+RETRY_BASE = 5.0  # Sekunden bis zum ersten Wiederholungsversuch, danach verdoppelt
+RETRY_MAX = 600.0
+REQUEST_TIMEOUT = 10
+WORKER_IDLE = 60.0  # Sekunden ohne Zustellung, nach denen der Thread eines Empfängers endet
+USER_AGENT = "VivSync-Notify/1.0"
+EVENT_SCHEDULE_CHANGED = "schedule.changed"
+
+logger = logging.getLogger(__name__)
+
+class Subscriber:
+    """
+    Ein Empfänger aus der Konfiguration
+
+    Ohne tokens/teams erhält er alle Ereignisse, sonst nur die passenden.
+    WebSub-Hubs bekommen die Feed-URLs samt Token und müssen das mit
+    publish_feed_urls ausdrücklich erlauben.
+    """
+
+    def __init__(self, url, kind="webhook", secret=None, tokens=(), teams=(), base_url=None,
+                 publish_feed_urls=False):
+        if kind not in ("webhook", "websub"):
+            raise ValueError(f"Unbekannter Typ: {kind}")
+        if urllib.parse.urlsplit(url).scheme not in ("http", "https"):
+            raise ValueError(f"Ungültige URL: {url}")
+        if kind == "websub" and not base_url:
+            raise ValueError("WebSub benötigt base_url für die Feed-URLs")
+        if kind == "websub" and publish_feed_urls is not True:
+            raise ValueError("WebSub überträgt Feed-URLs mit Token an den Hub, dafür publish_feed_urls: true setzen")
+        self.url = url
+        self.kind = kind
+        self.secret = secret
+        self.tokens = frozenset(tokens)
+        self.teams = frozenset(teams)
+        self.base_url = base_url.rstrip("/") if base_url else None
+
+    @classmethod
+    def from_config(cls, entry):
+        return cls(
+            entry["url"], entry.get("type", "webhook"), entry.get("secret"),
+            entry.get("tokens", ()), entry.get("teams", ()), entry.get("base_url"),
+            entry.get("publish_feed_urls", False)
+        )
+
+    @property
+    def key(self):
+        return (self.kind, self.url)
+
+    def matches(self, event):
+        if not self.tokens and not self.teams:
+            return True
+        return event["token"] in self.tokens or not self.teams.isdisjoint(event.get("teams", ()))
+
+    def opaque_id(self, value):
+        """Nicht umkehrbare Kennung eines Tokens oder einer Team-ID, pro Empfänger verschieden"""
+        key = (self.secret or self.url).encode()
+        return hmac.new(key, value.encode(), hashlib.sha256).hexdigest()
+
+    def public_event(self, event):
+        """Ereignis, wie es der Webhook erhält: ohne Token und Team-IDs im Klartext"""
+        return {
+            "event": event["event"],
+            "id": self.opaque_id(event["token"]),
+            "teams": [self.opaque_id(team_id) for team_id in event["teams"]],
+            "entries": event["entries"],
+            "changed_at": event["changed_at"],
+        }
+
+    def build_request(self, events, attempt):
+        """HTTP-Anfrage für eine Zustellung (urllib.request.Request)"""
+        headers = {"User-Agent": USER_AGENT}
+        if self.kind == "websub":
+            topics = []
+            for event in events:
+                feeds = [f"/calendar/{event['token']}"] + [f"/team/{team_id}" for team_id in event["teams"]]
+                for feed in feeds:
+                    if self.base_url + feed not in topics:
+                        topics.append(self.base_url + feed)
+            body = urllib.parse.urlencode([("hub.mode", "publish")] + [("hub.url", t) for t in topics]).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        else:
+            body = json.dumps({
+                "events": [self.public_event(event) for event in events], "attempt": attempt,
+                "sent_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            }).encode()
+            headers["Content-Type"] = "application/json"
+            headers["X-VivSync-Event"] = EVENT_SCHEDULE_CHANGED
+            if self.secret:
+                digest = hmac.new(self.secret.encode(), body, hashlib.sha256).hexdigest()
+                headers["X-Hub-Signature-256"] = f"sha256={digest}"
+        return urllib.request.Request(self.url, data=body, headers=headers, method="POST")
+
+def load_subscribers(raw, log=None):
+    """Empfänger aus der JSON-Konfiguration ({"subscribers": [...]}), fehlerhafte werden ignoriert"""
+    log = log or logger
+    subscribers = []
+    for entry in raw.get("subscribers", []):
+        try:
+            subscribers.append(Subscriber.from_config(entry))
+        except (KeyError, TypeError, ValueError) as e:
+            log.warning(f"Benachrichtigung: Empfänger {entry!r} ignoriert: {e}")
+    return subscribers
+
+def schedule_event(token, teams=(), entries=None):
+    """Ereignis für einen geänderten Dienstplan (nur intern, siehe Subscriber.build_request)"""
+    return {
+        "event": EVENT_SCHEDULE_CHANGED,
+        "token": token,
+        "teams": list(teams),
+        "entries": entries,
+        "changed_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+def retry_delay(attempt, retry_after=None, base=RETRY_BASE, maximum=RETRY_MAX):
+    """Wartezeit vor dem nächsten Versuch: Retry-After des Empfängers, sonst exponentiell ab base"""
+    if retry_after is not None:
+        return min(maximum, max(retry_after, base))
+    return min(maximum, base * 2 ** (attempt - 1))
+
+def _retry_after(headers):
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+def send_request(req, timeout=REQUEST_TIMEOUT):
+    """
+    Führt eine Zustellung aus
+
+    Returns:
+        Tuple (Ergebnis, Retry-After in Sekunden oder None), Ergebnis ist
+        "ok", "retry" (Netzwerkfehler, 5xx, 429) oder "failed" (übrige 4xx)
+    """
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+        return "ok", None
+    except urllib.error.HTTPError as e:
+        if e.code == 429 or e.code >= 500:
+            return "retry", _retry_after(e.headers)
+        return "failed", None
+    except (urllib.error.URLError, OSError) as e:
+        logger.debug(f"Benachrichtigung an {req.full_url} fehlgeschlagen: {e!r}")
+        return "retry", None
+
+class SubscriberWorker:
+    """
+    Zustellungen an einen Empfänger in einem eigenen Thread, mit eigenen Wiederholungen
+
+    Gehört zu einem NotificationDispatcher und teilt dessen Lock; endet nach
+    WORKER_IDLE Sekunden ohne Arbeit und wird bei Bedarf neu angelegt.
+    """
+
+    def __init__(self, dispatcher, key):
+        self.dispatcher = dispatcher
+        self.key = key
+        self.jobs = collections.deque()  # (Empfänger, Ereignisse, final)
+        self.retries = []  # Heap (fällig, Nr., Empfänger, Ereignisse, Versuch)
+        self._retry_seq = 0
+        self._wakeup = threading.Condition(dispatcher._lock)
+        self.thread = threading.Thread(target=self.run, name=f"notifications-{key[0]}", daemon=True)
+
+    def submit(self, subscriber, events, final):
+        """Nur mit gehaltenem Lock des Dispatchers aufzurufen"""
+        self.jobs.append((subscriber, events, final))
+        self._wakeup.notify()
+
+    def schedule_retry(self, delay, subscriber, events, attempt):
+        with self._wakeup:
+            self._retry_seq += 1
+            heapq.heappush(self.retries, (time.monotonic() + delay, self._retry_seq, subscriber, events, attempt))
+
+    def _next_job(self):
+        """Nächste Zustellung (Empfänger, Ereignisse, Versuch, final) oder None, wenn der Thread enden soll"""
+        dispatcher = self.dispatcher
+        with self._wakeup:
+            while True:
+                if self.jobs:
+                    subscriber, events, final = self.jobs.popleft()
+                    return subscriber, events, 1, final or dispatcher._stop.is_set()
+                # Beim Beenden werden offene Wiederholungen nicht mehr abgewartet
+                if dispatcher._stop.is_set():
+                    break
+                if self.retries:
+                    delay = self.retries[0][0] - time.monotonic()
+                    if delay <= 0:
+                        _, _, subscriber, events, attempt = heapq.heappop(self.retries)
+                        return subscriber, events, attempt, False
+                    self._wakeup.wait(delay)
+                elif not self._wakeup.wait(WORKER_IDLE) and not self.jobs:
+                    break
+            # Unter dem Lock austragen, damit submit keinen beendeten Worker mehr erwischt
+            if dispatcher._workers.get(self.key) is self:
+                del dispatcher._workers[self.key]
+            return None
+
+    def run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self.dispatcher._deliver(self, *job)
+
+class NotificationDispatcher:
+    """
+    Asynchrone Zustellung mit Sammeln, Zusammenfassen und Wiederholungen
+
+    subscribers ist eine Funktion, die die aktuell konfigurierten Empfänger
+    liefert (wird bei jedem Versand aufgerufen, Änderungen wirken sofort).
+    """
+
+    def __init__(self, subscribers, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH, queue_size=QUEUE_SIZE,
+                 max_attempts=MAX_ATTEMPTS, retry_base=RETRY_BASE, retry_max=RETRY_MAX, send=send_request, log=None):
+        self.subscribers = subscribers
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.send = send
+        self.log = log or logger
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._workers = {}  # Empfänger-Schlüssel -> SubscriberWorker
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"queued": 0, "dropped": 0, "delivered": 0, "retried": 0, "failed": 0}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            workers = list(self._workers.values())
+            stats["pending"] = self._queue.qsize() + sum(len(worker.jobs) for worker in workers)
+            stats["retrying"] = sum(len(worker.retries) for worker in workers)
+        return stats
+
+    def _count(self, field, amount=1):
+        with self._lock:
+            self._stats[field] += amount
+
+    def notify(self, event):
+        """Reiht ein Ereignis ein, ohne zu blockieren; False, wenn die Warteschlange voll ist"""
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._count("dropped")
+            server_metrics.NOTIFICATIONS.inc(kind="event", result="dropped")
+            return False
+        self._count("queued")
+        return True
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="notifications", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Beendet die Threads; bereits gesammelte Ereignisse werden noch einmal versucht"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._lock:
+            workers = list(self._workers.values())
+            for worker in workers:
+                worker._wakeup.notify()
+        for worker in workers:
+            worker.thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                self._dispatch(batch)
+        # Restliche Ereignisse ein letztes Mal zustellen, ohne Wiederholungen
+        batch = self._drain()
+        if batch:
+            self._dispatch(batch, final=True)
+
+    def _collect(self):
+        """Wartet auf das erste Ereignis und sammelt dann bis zu batch_window Sekunden weiter"""
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _dispatch(self, batch, final=False):
+        # Mehrere Änderungen desselben Tokens innerhalb eines Blocks nur einmal melden
+        latest = {}
+        for event in batch:
+            latest[event["token"]] = event
+        events = list(latest.values())
+        try:
+            subscribers = self.subscribers()
+        except Exception as e:
+            self.log.error(f"Benachrichtigung: Empfänger nicht lesbar: {e!r}")
+            return
+        for subscriber in subscribers:
+            matching = [event for event in events if subscriber.matches(event)]
+            for start in range(0, len(matching), self.max_batch):
+                self._submit(subscriber, matching[start:start + self.max_batch], final)
+
+    def _submit(self, subscriber, events, final):
+        """Übergibt eine Zustellung an den Thread des Empfängers"""
+        with self._lock:
+            worker = self._workers.get(subscriber.key)
+            if worker is None:
+                worker = self._workers[subscriber.key] = SubscriberWorker(self, subscriber.key)
+                worker.thread.start()
+            worker.submit(subscriber, events, final)
+
+    def _deliver(self, worker, subscriber, events, attempt, final=False):
+        try:
+            result, retry_after = self.send(subscriber.build_request(events, attempt))
+        except Exception as e:
+            self.log.error(f"Benachrichtigung an {subscriber.url} fehlgeschlagen: {e!r}")
+            result, retry_after = "failed", None
+        if result == "retry" and (final or attempt >= self.max_attempts):
+            result = "failed"
+        server_metrics.NOTIFICATIONS.inc(kind=subscriber.kind, result=result)
+        if result == "ok":
+            self._count("delivered")
+        elif result == "retry":
+            self._count("retried")
+            delay = retry_delay(attempt, retry_after, self.retry_base, self.retry_max)
+            worker.schedule_retry(delay, subscriber, events, attempt + 1)
+            self.log.info(f"Benachrichtigung an {subscriber.url}: Versuch {attempt} fehlgeschlagen, "
+                          f"nächster in {delay:.0f}s")
+        else:
+            self._count("failed")
+            self.log.warning(f"Benachrichtigung an {subscriber.url} aufgegeben nach {attempt} Versuch(en), "
+                             f"{len(events)} Ereignis(se)")
@@ -0,0 +1,241 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+# Gemeinsame Umwandlung von Diensten in Kalendereinträge für Client und Server.
+# Zeiten werden als "floating time" (ohne Zeitzone) geschrieben, damit der Dienst
+# in der lokalen Zeit des Kalenders erscheint.
+
+PRODID = "-//VivSync//VivSync Dienstplan//DE"
+DESCRIPTION_PREFIX = "Automatisch synchronisiert mit VivSync"
+UID_DOMAIN = "vivsync.com"
+MAX_LINE_OCTETS = 75
+
+# Fehler beim Lesen eines einzelnen Dienstes (falsches Format oder falscher Typ,
+# z.B. Zahl statt String); der Dienst wird dann übersprungen bzw. ganztägig
+PARSE_ERRORS = (TypeError, AttributeError, ValueError)
+
+def shift_title(dienst):
+    """Titel aus Dienstcode und (optionaler) Position"""
+    title = str(dienst.get('dienst', '') or '')
+    position = str(dienst.get('position', '') or '')
+    if position:
+        title = f"{title} - {position}" if title else position
+    return title
+
+def shift_description(dienst):
+    description = DESCRIPTION_PREFIX
+    dienstzeit = dienst.get('dienstzeit', '')
+    if dienstzeit:
+        description += f"\nDienstzeit: {dienstzeit}"
+    return description
+
+def parse_dienstzeit(dienstzeit):
+    """
+    Zerlegt 'HH:MM - HH:MM' in Minuten seit Mitternacht
+
+    Returns:
+        Tuple (start_minuten, end_minuten)
+
+    Raises:
+        ValueError, TypeError, AttributeError: bei ungültigem Format oder Typ
+    """
+    start_time, end_time = dienstzeit.split(' - ')
+    start_hour, start_minute = map(int, start_time.split(':'))
+    end_hour, end_minute = map(int, end_time.split(':'))
+    if not (0 <= start_hour < 24 and 0 <= end_hour < 24 and 0 <= start_minute < 60 and 0 <= end_minute < 60):
+        raise ValueError(f"Ungültige Uhrzeit in Dienstzeit '{dienstzeit}'")
+    return start_hour * 60 + start_minute, end_hour * 60 + end_minute
+
+def shift_times(dienst):
+    """
+    Berechnet Beginn und Ende eines Dienstes
+
+    Endet ein Dienst vor (oder zur) Startzeit, endet er am Folgetag; das gilt
+    auch über Monats- und Jahresgrenzen. Ohne (gültige) Dienstzeit ist der
+    Dienst ganztägig, das Ende ist dann exklusiv der Folgetag.
+
+    Returns:
+        Tuple (beginn, ende, ganztaegig, zeitfehler); zeitfehler ist None oder
+        die Fehlermeldung einer nicht lesbaren Dienstzeit
+
+    Raises:
+        ValueError, TypeError: bei ungültigem Datum
+    """
+    day = datetime.strptime(dienst.get('datum', ''), "%Y-%m-%d")
+    dienstzeit = dienst.get('dienstzeit', '')
+    if dienstzeit:
+        try:
+            start_minutes, end_minutes = parse_dienstzeit(dienstzeit)
+        except PARSE_ERRORS as time_err:
+            return day, day + timedelta(days=1), True, str(time_err)
+        begin = day + timedelta(minutes=start_minutes)
+        end = day + timedelta(minutes=end_minutes)
+        if end <= begin:
+            end += timedelta(days=1)
+        return begin, end, False, None
+    return day, day + timedelta(days=1), True, None
+
+def escape_text(value):
+    """Maskiert Sonderzeichen für TEXT-Werte nach RFC 5545"""
+    return (value.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n'))
+
+def fold_line(line):
+    """Faltet eine Inhaltszeile auf maximal 75 Oktette und hängt CRLF an"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= MAX_LINE_OCTETS:
+        return line + "\r\n"
+    parts = []
+    limit = MAX_LINE_OCTETS
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Nicht mitten in einem UTF-8-Zeichen trennen
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = MAX_LINE_OCTETS - 1  # Folgezeilen beginnen mit einem Leerzeichen
+    return "\r\n ".join(parts) + "\r\n"
+
+def event_uid(dienst, namespace):
+    """Stabile UID pro Datum, damit Kalender-Apps Einträge bei Updates wiedererkennen"""
+    ns_hash = hashlib.sha1(namespace.encode()).hexdigest()[:12]
+    return f"{dienst.get('datum', '')}-{ns_hash}@{UID_DOMAIN}"
+
+def format_event(dienst, dtstamp, namespace="vivsync", on_warning=None, label=None):
+    """
+    Erstellt die VEVENT-Zeilen eines Dienstes als String
+
+    label wird dem Titel vorangestellt (z.B. Name im Team-Kalender).
+
+    Returns:
+        String mit CRLF-Zeilen oder None, wenn das Datum ungültig ist
+    """
+    try:
+        begin, end, all_day, time_error = shift_times(dienst)
+    except PARSE_ERRORS as date_err:
+        if on_warning:
+            on_warning(f"Fehler beim Parsen des Datums {dienst.get('datum')}: {date_err}")
+        return None
+    if time_error and on_warning:
+        on_warning(f"Fehler beim Parsen der Dienstzeit für {dienst.get('datum')}: {time_error}")
+
+    if all_day:
+        start_line = f"DTSTART;VALUE=DATE:{begin.strftime('%Y%m%d')}"
+        end_line = f"DTEND;VALUE=DATE:{end.strftime('%Y%m%d')}"
+    else:
+        start_line = f"DTSTART:{begin.strftime('%Y%m%dT%H%M%S')}"
+        end_line = f"DTEND:{end.strftime('%Y%m%dT%H%M%S')}"
+
+    # Versionsnummer aus der Server-Historie, damit Kalender-Apps Änderungen übernehmen
+    version = dienst.get('version')
+    sequence_line = f"SEQUENCE:{version}\r\n" if version else ""
+    title = shift_title(dienst)
+    if label:
+        title = f"{label}: {title}"
+
+    return "".join((
+        "BEGIN:VEVENT\r\n",
+        fold_line(f"UID:{event_uid(dienst, namespace)}"),
+        f"DTSTAMP:{dtstamp}\r\n",
+        sequence_line,
+        start_line + "\r\n",
+        end_line + "\r\n",
+        fold_line(f"SUMMARY:{escape_text(title)}"),
+        fold_line(f"DESCRIPTION:{escape_text(shift_description(dienst))}"),
+        "END:VEVENT\r\n",
+    ))
+
+def calendar_header(name=None):
+    header = f"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:{PRODID}\r\nCALSCALE:GREGORIAN\r\n"
+    if name:
+        header += fold_line(f"X-WR-CALNAME:{escape_text(name)}")
+    return header
+
+def calendar_footer():
+    return "END:VCALENDAR\r\n"
+
+def utc_stamp():
+    return datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+def iter_calendar(dienste, namespace="vivsync", on_warning=None):
+    """Erzeugt den Kalender stückweise (Kopf, ein String pro Dienst, Ende)"""
+    dtstamp = utc_stamp()
+    yield calendar_header()
+    for dienst in dienste:
+        event = format_event(dienst, dtstamp, namespace, on_warning)
+        if event:
+            yield event
+    yield calendar_footer()
+
+def render_calendar(dienste, namespace="vivsync", on_warning=None):
+    """Erzeugt den vollständigen Kalender als String"""
+    return "".join(iter_calendar(dienste, namespace, on_warning))
+
+def write_ics_file(dienste, filepath, namespace="vivsync", on_warning=None):
+    """Schreibt den Kalender direkt in eine Datei, ohne ihn vorher im Speicher aufzubauen"""
+    with open(filepath, 'w', encoding='utf-8', newline='') as f:
+        for chunk in iter_calendar(dienste, namespace, on_warning):
+            f.write(chunk)
+    return True
+
+def busy_periods(dienste, tzinfo):
+    """
+    Belegte Zeiträume der Dienste in UTC, sortiert und zusammengefasst
+
+    tzinfo ist die Zeitzone, in der die (zeitzonenlosen) Dienstzeiten gelten.
+    """
+    periods = []
+    for dienst in dienste:
+        try:
+            begin, end, _, _ = shift_times(dienst)
+        except PARSE_ERRORS:
+            continue
+        periods.append((
+            begin.replace(tzinfo=tzinfo).astimezone(timezone.utc),
+            end.replace(tzinfo=tzinfo).astimezone(timezone.utc)
+        ))
+    periods.sort()
+    merged = []
+    for begin, end in periods:
+        if merged and begin <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((begin, end))
+    return merged
+
+def render_freebusy(dienste, tzinfo, namespace="vivsync", window_start=None, window_end=None):
+    """
+    Erzeugt einen Kalender mit einer VFREEBUSY-Komponente (RFC 5545, Zeiten in UTC)
+
+    window_start/window_end sind date-Objekte (Ende inklusiv) oder None; ohne
+    Angabe gelten Beginn und Ende der belegten Zeiträume.
+    """
+    periods = busy_periods(dienste, tzinfo)
+    utc_format = '%Y%m%dT%H%M%SZ'
+    if window_start is not None:
+        start = datetime.combine(window_start, datetime.min.time(), tzinfo).astimezone(timezone.utc)
+    else:
+        start = periods[0][0] if periods else datetime.now(timezone.utc)
+    if window_end is not None:
+        end = datetime.combine(window_end + timedelta(days=1), datetime.min.time(), tzinfo).astimezone(timezone.utc)
+    else:
+        end = periods[-1][1] if periods else start
+    ns_hash = hashlib.sha1(namespace.encode()).hexdigest()[:12]
+    lines = [
+        calendar_header(),
+        "BEGIN:VFREEBUSY\r\n",
+        f"UID:freebusy-{ns_hash}@{UID_DOMAIN}\r\n",
+        f"DTSTAMP:{utc_stamp()}\r\n",
+        f"DTSTART:{start.strftime(utc_format)}\r\n",
+        f"DTEND:{end.strftime(utc_format)}\r\n",
+    ]
+    for begin, finish in periods:
+        # Nur den Teil im Fenster melden, z.B. bei Nachtdiensten über die Fenstergrenze
+        begin, finish = max(begin, start), min(finish, end)
+        if begin >= finish:
+            continue
+        lines.append(f"FREEBUSY;FBTYPE=BUSY:{begin.strftime(utc_format)}/{finish.strftime(utc_format)}\r\n")
+    lines.append("END:VFREEBUSY\r\n")
+    lines.append(calendar_footer())
+    return "".join(lines)
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+# Module liegen flach im Projektverzeichnis
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """
+    server.py in einem eigenen Arbeitsverzeichnis
+
+    user_data/, keys/ und logs/ liegen relativ zum Arbeitsverzeichnis, deshalb
+    bleibt es für die ganze Sitzung auf das temporäre Verzeichnis gesetzt.
+    """
+    pytest.importorskip("flask")
+    pytest.importorskip("cryptography")
+    previous = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("server"))
+    import server
+    yield server
+    os.chdir(previous)
+
+@pytest.fixture
+def client(server):
+    """Test-Client ohne Ratenbegrenzung und mit leeren Caches"""
+    from rate_limit import KeyedRateLimiter
+    from server_cache import NegativeCache
+    unlimited = (1e6, 1e6)
+    server.calendar_ip_limiter = KeyedRateLimiter(*unlimited)
+    server.calendar_token_limiter = KeyedRateLimiter(*unlimited)
+    server.sync_ip_limiter = KeyedRateLimiter(*unlimited)
+    server.sync_token_limiter = KeyedRateLimiter(*unlimited)
+    server.missing_tokens = NegativeCache()
+    return server.app.test_client()
@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+import admin
+from schedule_store import encode_schedule
+from server_keys import KeyRing
+from server_lock import StoreLock
+
+DAY = 24 * 60 * 60
+
+@pytest.fixture
+def store(tmp_path):
+    """Datenverzeichnis mit je einem gültigen, abgelaufenen und unlesbaren Eintrag"""
+    data_dir, keys_dir = tmp_path / "user_data", tmp_path / "keys"
+    data_dir.mkdir()
+    keyring = KeyRing.load(str(keys_dir))
+    dienste = [{"datum": "2026-10-19", "dienst": "F", "position": "", "dienstzeit": "", "username": "max"}]
+    for token, created_at in (("aaaaaaaaaaaaaaaa", time.time()), ("bbbbbbbbbbbbbbbb", time.time() - 60 * DAY)):
+        (data_dir / f"{token}.dat").write_bytes(keyring.encrypt(encode_schedule(dienste, "max", 30, created_at)))
+    (data_dir / "bbbbbbbbbbbbbbbb.feed").write_bytes(b"vorgerendert")
+    (data_dir / "cccccccccccccccc.dat").write_bytes(b"kein Fernet-Token")
+    args = ["--data-dir", str(data_dir), "--keys-dir", str(keys_dir), "--legacy-key", str(tmp_path / "fehlt.key"),
+            "--workers", "1"]
+    return data_dir, args
+
+def remaining(data_dir):
+    return sorted(name for name in os.listdir(data_dir) if not name.startswith("."))
+
+def test_purge_removes_expired_entries_and_their_feeds(store, capsys):
+    data_dir, args = store
+
+    assert admin.main(["purge"] + args) == 0
+
+    assert remaining(data_dir) == ["aaaaaaaaaaaaaaaa.dat", "cccccccccccccccc.dat"]
+    assert "1 Einträge gelöscht" in capsys.readouterr().out
+
+def test_purge_dry_run_keeps_everything(store, capsys):
+    data_dir, args = store
+    before = remaining(data_dir)
+
+    assert admin.main(["purge", "--dry-run", "--invalid"] + args) == 0
+
+    assert remaining(data_dir) == before
+    assert "2 Einträge würden gelöscht" in capsys.readouterr().out
+
+def test_purge_invalid_also_removes_unreadable_entries(store):
+    data_dir, args = store
+
+    assert admin.main(["purge", "--invalid"] + args) == 0
+
+    assert remaining(data_dir) == ["aaaaaaaaaaaaaaaa.dat"]
+
+def test_purge_waits_for_the_store_lock(store):
+    data_dir, args = store
+    expired = data_dir / "bbbbbbbbbbbbbbbb.dat"
+    purge = threading.Thread(target=admin.main, args=(["purge"] + args,))
+
+    with StoreLock(str(data_dir)):
+        purge.start()
+        time.sleep(0.5)
+        assert expired.exists()
+    purge.join(10)
+
+    assert not expired.exists()
+
+def test_validate_reports_unreadable_entries(store, capsys):
+    _, args = store
+
+    assert admin.main(["validate"] + args) == 1
+
+    out = capsys.readouterr().out
+    assert out.startswith("cccccccccccccccc\t") and "3 geprüft, 1 fehlerhaft" in out
@@ -0,0 +1,93 @@
+import pytest
+
+pytest.importorskip("googleapiclient")
+pytest.importorskip("oauth2client")
+
+import calendar_sync
+
+def dienst(datum, code="D33", position="Oben", dienstzeit="07:00 - 14:00"):
+    return {"datum": datum, "dienst": code, "position": position, "dienstzeit": dienstzeit}
+
+def existing(event_id, source):
+    event = calendar_sync.build_insert_body(source)
+    event["id"] = event_id
+    return event
+
+def test_plan_changes_create_update_delete_and_noop():
+    dienste = [
+        dienst("2025-04-02"),
+        dienst("2025-04-03", code="A102", position="Unten"),
+        dienst("2025-04-04"),
+    ]
+    events = {
+        "same": existing("same", dienst("2025-04-02")),
+        "changed": existing("changed", dienst("2025-04-03")),
+        "gone": existing("gone", dienst("2025-04-05")),
+    }
+
+    plan = calendar_sync.plan_changes(dienste, events)
+    by_action = {change["action"]: change for change in plan}
+
+    assert sorted(change["action"] for change in plan) == ["create", "delete", "update"]
+    assert by_action["create"]["datum"] == "2025-04-04"
+    assert by_action["create"]["body"]["extendedProperties"]["private"][calendar_sync.FINGERPRINT_PROPERTY]
+    assert by_action["update"]["event_id"] == "changed"
+    assert set(by_action["update"]["body"]) == {"summary", "extendedProperties"}
+    assert by_action["delete"]["event_id"] == "gone"
+    assert by_action["delete"]["reason"] == "Nicht mehr im Dienstplan"
+    assert calendar_sync.summarize_plan(plan) == {"created": 1, "updated": 1, "deleted": 1}
+
+def test_plan_changes_without_differences_is_empty():
+    dienste = [dienst("2025-04-02"), dienst("2025-04-03", dienstzeit="")]
+    events = {str(i): existing(str(i), d) for i, d in enumerate(dienste)}
+
+    plan = calendar_sync.plan_changes(dienste, events)
+
+    assert plan == []
+    assert calendar_sync.summarize_plan(plan) == {"created": 0, "updated": 0, "deleted": 0}
+
+def test_plan_changes_deletes_duplicates_for_the_same_date():
+    events = {
+        "first": existing("first", dienst("2025-04-02")),
+        "second": existing("second", dienst("2025-04-02")),
+    }
+
+    plan = calendar_sync.plan_changes([dienst("2025-04-02")], events)
+
+    assert [(change["action"], change["event_id"]) for change in plan] == [("delete", "second")]
+    assert plan[0]["reason"] == "Doppelter Eintrag für dieses Datum"
+
+def test_build_patch_skips_event_with_matching_fingerprint():
+    event = existing("e", dienst("2025-04-02"))
+
+    assert calendar_sync.build_patch(event, dienst("2025-04-02")) is None
+
+def test_build_patch_for_legacy_event_only_adds_fingerprint():
+    event = calendar_sync.build_event_body(dienst("2025-04-02"))
+
+    patch = calendar_sync.build_patch(event, dienst("2025-04-02"))
+
+    assert calendar_sync.changed_fields(event, calendar_sync.build_event_body(dienst("2025-04-02"))) == []
+    assert list(patch) == ["extendedProperties"]
+    assert patch["extendedProperties"]["private"][calendar_sync.FINGERPRINT_PROPERTY] == \
+        calendar_sync.event_fingerprint(event)
+
+def test_changed_fields_ignores_whitespace_case_and_offset_normalization():
+    body = calendar_sync.build_event_body(dienst("2025-04-02"))
+    # So liefert die API den Eintrag zurück
+    event = dict(body)
+    event["summary"] = body["summary"] + "  "
+    event["description"] = body["description"].replace("\n", " \r\n") + "\n"
+    event["transparency"] = "TRANSPARENT"
+    event["start"] = {"dateTime": body["start"]["dateTime"] + "+02:00", "timeZone": "Europe/Berlin"}
+
+    assert calendar_sync.changed_fields(event, body) == []
+    assert list(calendar_sync.build_patch(event, dienst("2025-04-02"))) == ["extendedProperties"]
+
+def test_changed_fields_sends_start_and_end_together():
+    event = calendar_sync.build_event_body(dienst("2025-04-02"))
+    body = calendar_sync.build_event_body(dienst("2025-04-02", dienstzeit=""))
+
+    assert calendar_sync.changed_fields(event, body) == ["description", "start", "end"]
+    patch = calendar_sync.build_patch(event, dienst("2025-04-02", dienstzeit=""))
+    assert patch["start"] == {"date": "2025-04-02"} and patch["end"] == {"date": "2025-04-03"}
@@ -0,0 +1,26 @@
+from rate_limit import KeyedRateLimiter, TokenBucket
+
+def test_bucket_allows_a_burst_up_to_capacity():
+    bucket = TokenBucket(rate=1, capacity=3)
+
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    assert 0 < bucket.retry_after() <= 1
+
+def test_limits_are_kept_per_key():
+    limiter = KeyedRateLimiter(rate=0.01, capacity=2)
+
+    assert limiter.allow("a")[0] and limiter.allow("a")[0]
+    allowed, retry_after = limiter.allow("a")
+    assert not allowed and retry_after > 0
+    assert limiter.allow("b") == (True, 0.0)
+
+def test_least_recently_used_keys_are_dropped():
+    limiter = KeyedRateLimiter(rate=0.01, capacity=1, max_keys=2)
+    limiter.allow("a")
+    limiter.allow("b")
+    limiter.allow("a")
+    limiter.allow("c")  # verdrängt "b"
+
+    assert not limiter.allow("a")[0]
+    # Ein verworfener Bucket beginnt wieder voll
+    assert limiter.allow("b")[0]
@@ -0,0 +1,138 @@
+import json
+import struct
+
+import pytest
+
+import schedule_store
+from schedule_store import (
+    ScheduleFormatError, decode_schedule, encode_schedule, merge_schedules, select_window
+)
+
+def entry(datum, dienst="F", version=0):
+    return {"datum": datum, "dienst": dienst, "position": "", "dienstzeit": "", "version": version}
+
+def upload(datum, dienst="F"):
+    return {"datum": datum, "dienst": dienst, "position": "", "dienstzeit": "", "username": "max"}
+
+def dates(entries):
+    return [item["datum"] for item in entries]
+
+STORED = [entry("2026-09-30"), entry("2026-10-01"), entry("2026-10-15"), entry("2026-10-31"), entry("2026-11-02")]
+
+def test_merge_removes_shifts_at_the_edges_of_the_covered_range():
+    merged, stats = merge_schedules(STORED, [upload("2026-10-15")], covered=("2026-10-01", "2026-10-31"))
+
+    assert dates(merged) == ["2026-09-30", "2026-10-15", "2026-11-02"]
+    assert stats["removed"] == 2
+    assert stats["unchanged"] == 1
+
+def test_merge_with_empty_upload_clears_the_covered_range():
+    merged, stats = merge_schedules(STORED, [], covered=("2026-10-01", "2026-10-31"))
+
+    assert dates(merged) == ["2026-09-30", "2026-11-02"]
+    assert stats["removed"] == 3
+
+def test_merge_without_range_replaces_only_between_first_and_last_upload():
+    merged, stats = merge_schedules(STORED, [upload("2026-10-20"), upload("2026-10-10")])
+
+    assert dates(merged) == ["2026-09-30", "2026-10-01", "2026-10-10", "2026-10-20", "2026-10-31", "2026-11-02"]
+    assert stats == {"added": 2, "changed": 0, "unchanged": 0, "removed": 1, "pruned": 0}
+    assert merge_schedules(STORED, [])[0] == STORED
+
+def test_merge_counts_versions_and_prunes_old_history():
+    stored = [entry("2026-01-05"), entry("2026-10-01", version=2)]
+    merged, stats = merge_schedules(
+        stored, [upload("2026-10-01", dienst="S"), upload("2026-10-01", dienst="N")],
+        retention_start="2026-06-01", covered=("2026-10-01", "2026-10-31")
+    )
+
+    # Bei doppeltem Datum gilt der letzte Eintrag, geänderte Inhalte erhöhen die Version
+    assert merged == [{"datum": "2026-10-01", "dienst": "N", "position": "", "dienstzeit": "", "version": 3}]
+    assert stats["pruned"] == 1
+    assert stats["changed"] == 1
+
+CREATED_AT = 1792368000.0
+
+def stored_entries():
+    return [
+        {"datum": "2026-10-20", "dienst": "N1", "position": "", "dienstzeit": "21:30 - 06:30", "username": "max"},
+        {"datum": "2026-10-19", "dienst": "F", "position": "Station A", "dienstzeit": "06:00 - 14:00",
+         "username": "max", "version": 3},
+        {"datum": "2026-10-21", "dienst": "FR", "position": "", "dienstzeit": "", "username": "max"},
+        {"datum": "2026-10-22", "dienst": "S", "position": "", "dienstzeit": "ab 13 Uhr", "username": "max"},
+    ]
+
+def test_binary_format_round_trip_sorts_by_date_and_drops_username():
+    data = encode_schedule(stored_entries(), "max", 30, CREATED_AT)
+    schedule = decode_schedule(data)
+
+    assert data.startswith(schedule_store.MAGIC + bytes([schedule_store.FORMAT_VERSION]))
+    assert schedule["format"] == schedule_store.FORMAT_VERSION
+    assert schedule["username"] == "max"
+    assert (schedule["expiry_days"], schedule["created_at"]) == (30, CREATED_AT)
+    assert schedule["dienste"] == [
+        {"datum": "2026-10-19", "dienst": "F", "position": "Station A", "dienstzeit": "06:00 - 14:00", "version": 3},
+        {"datum": "2026-10-20", "dienst": "N1", "position": "", "dienstzeit": "21:30 - 06:30", "version": 0},
+        {"datum": "2026-10-21", "dienst": "FR", "position": "", "dienstzeit": "", "version": 0},
+        {"datum": "2026-10-22", "dienst": "S", "position": "", "dienstzeit": "ab 13 Uhr", "version": 0},
+    ]
+
+def test_version_1_files_are_still_read():
+    data = encode_schedule(stored_entries(), "max", 30, CREATED_AT)
+    # Version 1 hatte pro Eintrag keine Versionsnummer (letztes uint16)
+    count_pos = len(data) - 4 * schedule_store.ENTRY.size - schedule_store.COUNT.size
+    entries = [
+        schedule_store.ENTRY_V1.pack(*values[:-1])
+        for values in schedule_store.ENTRY.iter_unpack(data[count_pos + schedule_store.COUNT.size:])
+    ]
+    v1 = data[:3] + bytes([1]) + data[4:count_pos + schedule_store.COUNT.size] + b"".join(entries)
+
+    schedule = decode_schedule(v1)
+
+    assert schedule["format"] == 1
+    assert [d["dienstzeit"] for d in schedule["dienste"]] == ["06:00 - 14:00", "21:30 - 06:30", "", "ab 13 Uhr"]
+    assert all(d["version"] == 0 for d in schedule["dienste"])
+
+@pytest.mark.parametrize("entries, username", [
+    ([{"datum": "2026-10-19", "dienst": "F", "position": "", "dienstzeit": "", "extra": 1}], "max"),
+    ([{"datum": "2026-10-19", "dienst": "F", "position": "", "dienstzeit": "", "username": "moritz"}], "max"),
+    ([{"datum": "2026-10-19", "dienst": 1, "position": "", "dienstzeit": ""}], "max"),
+])
+def test_schedules_that_do_not_fit_fall_back_to_json(entries, username):
+    data = encode_schedule(entries, username, 30, CREATED_AT)
+    schedule = decode_schedule(data)
+
+    assert json.loads(data)["dienste"] == entries
+    assert schedule["format"] == 0
+    assert schedule["dienste"] == entries
+
+def test_legacy_json_list_is_read_sorted_without_metadata():
+    schedule = decode_schedule(json.dumps([{"datum": "2026-10-20"}, {"datum": "2026-10-19"}]))
+
+    assert dates(schedule["dienste"]) == ["2026-10-19", "2026-10-20"]
+    assert schedule["expiry_days"] is None and schedule["created_at"] is None
+
+@pytest.mark.parametrize("mangle", [
+    lambda data: data[:-1],
+    lambda data: data + b"\0",
+    lambda data: data[:3] + bytes([99]) + data[4:],
+    lambda data: data[:20],
+    lambda data: b"kein Dienstplan",
+])
+def test_corrupt_data_raises_schedule_format_error(mangle):
+    data = encode_schedule(stored_entries(), "max", 30, CREATED_AT)
+
+    with pytest.raises(ScheduleFormatError):
+        decode_schedule(mangle(data))
+
+@pytest.mark.parametrize("start, end, expected", [
+    (None, None, ["2026-10-19", "2026-10-20", "2026-10-21", "2026-10-22"]),
+    ("2026-10-20", None, ["2026-10-20", "2026-10-21", "2026-10-22"]),
+    (None, "2026-10-20", ["2026-10-19", "2026-10-20"]),
+    ("2026-10-20", "2026-10-21", ["2026-10-20", "2026-10-21"]),
+    ("2026-10-23", None, []),
+])
+def test_select_window_includes_both_bounds(start, end, expected):
+    dienste = decode_schedule(encode_schedule(stored_entries(), "max", 30, CREATED_AT))["dienste"]
+
+    assert dates(select_window(dienste, start, end)) == expected
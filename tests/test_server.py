@@ -0,0 +1,128 @@
+import os
+from datetime import date, timedelta
+
+import pytest
+
+from rate_limit import KeyedRateLimiter
+
+TODAY = date(2026, 10, 19)
+
+def shifts(username, first, days):
+    return [{"datum": (first + timedelta(days=i)).isoformat(), "dienst": "F", "position": "",
+             "dienstzeit": "06:00 - 14:00", "username": username} for i in range(days)]
+
+def sync(client, username, dienste, **extra):
+    response = client.post("/api/sync", json={"dienste": dienste, "expiry_days": 30, **extra})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["ical_url"].rsplit("/", 1)[1]
+
+def event_count(response):
+    assert response.status_code == 200
+    return response.data.count(b"BEGIN:VEVENT")
+
+@pytest.mark.parametrize("args, expected", [
+    ({"from": "2026-10-01", "to": "2026-10-31"}, ("2026-10-01", "2026-10-31")),
+    ({"from": "20261001", "to": "20261031"}, ("2026-10-01", "2026-10-31")),
+    ({"past_days": "7"}, ("2026-10-12", None)),
+    ({"past_days": "all", "to": "20261031"}, (None, "2026-10-31")),
+])
+def test_feed_window_returns_normalized_iso_dates(server, args, expected):
+    assert server.feed_window(args, today=TODAY) == expected
+
+@pytest.mark.parametrize("args", [
+    {"from": "2026-10-31", "to": "2026-10-01"},
+    {"from": "gestern"},
+    {"past_days": "-1"},
+])
+def test_feed_window_rejects_invalid_parameters(server, args):
+    with pytest.raises(ValueError):
+        server.feed_window(args, today=TODAY)
+
+def test_calendar_window_accepts_basic_date_format(client):
+    token = sync(client, "fenster", shifts("fenster", date.today() - timedelta(days=3), 8))
+    start = (date.today() + timedelta(days=1)).isoformat()
+
+    extended = event_count(client.get(f"/calendar/{token}?from={start}"))
+    basic = event_count(client.get(f"/calendar/{token}?from={start.replace('-', '')}"))
+
+    assert extended == basic == 4
+
+def stored_dates(client, token):
+    response = client.get(f"/api/schedule/{token}?past_days=all")
+    assert response.status_code == 200
+    return [item["datum"] for item in response.get_json()["dienste"]]
+
+def test_merge_upload_replaces_the_sent_range(client):
+    october = shifts("bereich", date(2026, 10, 1), 31)
+    token = sync(client, "bereich", october + shifts("bereich", date(2026, 11, 1), 3))
+
+    # Dienste am 1. und 31. Oktober gestrichen, der Client meldet den ganzen Monat als gelesen
+    sync(client, "bereich", october[1:-1], mode="merge", **{"from": "2026-10-01", "to": "2026-10-31"})
+    remaining = stored_dates(client, token)
+
+    assert "2026-10-01" not in remaining and "2026-10-31" not in remaining
+    assert len(remaining) == 29 + 3
+
+    # Ohne Dienste im Zeitraum wird er geleert, der Rest bleibt
+    client.post("/api/sync", json={"dienste": [], "mode": "merge", "from": "2026-10-01", "to": "2026-10-31"},
+                headers={"X-Username": "bereich"})
+    assert stored_dates(client, token) == ["2026-11-01", "2026-11-02", "2026-11-03"]
+
+@pytest.mark.parametrize("payload", [
+    {"dienste": "kaputt"},
+    {"dienste": [{"datum": "2026-10-20", "dienst": 1, "dienstzeit": 5}]},
+    {"dienste": [{"datum": "20261020", "dienst": "F"}]},
+    {"dienste": [{"datum": "2026-12-01", "dienst": "F"}], "from": "2026-10-01", "to": "2026-10-31"},
+    {"dienste": [], "from": "2026-10-01"},
+    {"dienste": [], "from": "2026-10-31", "to": "2026-10-01"},
+])
+def test_invalid_merge_upload_is_rejected(client, payload):
+    response = client.post("/api/sync", json={**payload, "mode": "merge"}, headers={"X-Username": "ungueltig"})
+
+    assert response.status_code == 400
+    assert response.get_json()["status"] == "error"
+
+@pytest.mark.parametrize("rendered, window, default_window, expected", [
+    (("2026-07-21", None), ("2026-07-21", None), False, True),
+    (("2026-07-20", None), ("2026-07-21", None), True, True),
+    (("2026-07-20", None), ("2026-07-21", None), False, False),
+    (("2026-07-10", None), ("2026-07-21", None), True, False),
+    (("2026-07-22", None), ("2026-07-21", None), True, False),
+])
+def test_prerendered_window_matches(server, rendered, window, default_window, expected):
+    assert server.prerendered_window_matches(rendered, window, default_window) is expected
+
+def test_prerendered_feed_survives_a_moving_default_window(client, server, monkeypatch):
+    token = sync(client, "vorrender", shifts("vorrender", date.today() - timedelta(days=100), 110))
+    feed_file = server.feed_path(token)
+    rendered_at = os.stat(feed_file).st_mtime_ns
+
+    # Ein Tag später: das Standardfenster beginnt einen Tag später, der Feed bleibt gültig
+    monkeypatch.setattr(server, "FEED_PAST_DAYS", server.FEED_PAST_DAYS - 1)
+    assert event_count(client.get(f"/calendar/{token}")) == server.FEED_PAST_DAYS + 11
+    assert os.stat(feed_file).st_mtime_ns == rendered_at
+
+    # Nach mehr als PRERENDER_MAX_AGE_DAYS wird er beim Abruf neu gerendert
+    monkeypatch.setattr(server, "FEED_PAST_DAYS", server.FEED_PAST_DAYS - server.PRERENDER_MAX_AGE_DAYS)
+    assert event_count(client.get(f"/calendar/{token}")) == server.FEED_PAST_DAYS + 10
+    assert os.stat(feed_file).st_mtime_ns != rendered_at
+
+def test_known_tokens_are_limited_per_token(client, server):
+    token = sync(client, "grenze", shifts("grenze", date.today(), 3))
+    other = sync(client, "andere", shifts("andere", date.today(), 3))
+    server.calendar_token_limiter = KeyedRateLimiter(0.01, 2)
+
+    statuses = [client.get(f"/calendar/{token}").status_code for _ in range(3)]
+
+    assert statuses == [200, 200, 429]
+    assert int(client.get(f"/calendar/{token}").headers["Retry-After"]) >= 1
+    # Dieselbe IP, aber ein anderer Token hat sein eigenes Kontingent
+    assert client.get(f"/calendar/{other}").status_code == 200
+
+def test_unknown_tokens_are_limited_per_ip(client, server):
+    server.calendar_ip_limiter = KeyedRateLimiter(0.01, 2)
+    unknown = ["00000000000000%02x" % i for i in range(3)]
+
+    statuses = [client.get(f"/calendar/{token}").status_code for token in unknown]
+
+    assert statuses == [404, 404, 429]
@@ -0,0 +1,47 @@
+from schedule_store import Shift, compact_dienste, schedule_size, select_window
+from server_cache import SizedCache
+
+def test_sized_cache_evicts_least_recently_used_entries_by_size():
+    cache = SizedCache(100, "test")
+    cache.put("a", 1, "A", 40)
+    cache.put("b", 1, "B", 40)
+    assert cache.get("a", 1) == "A"
+
+    cache.put("c", 1, "C", 40)  # verdrängt "b", "a" wurde zuletzt benutzt
+
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == "A" and cache.get("c", 1) == "C"
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (2, 80, 1)
+
+def test_sized_cache_drops_stale_and_oversized_entries():
+    cache = SizedCache(100, "test")
+    cache.put("a", 1, "A", 60)
+
+    assert cache.get("a", 2) is None
+    assert cache.stats()["bytes"] == 0
+
+    cache.put("b", 1, "B", 60)
+    cache.put("groß", 1, "X", 101)
+    assert cache.get("b", 1) == "B" and cache.get("groß", 1) is None
+    assert cache.stats()["rejected"] == 1
+
+def dienste(days):
+    return [{"datum": f"2026-10-{day:02d}", "dienst": "F", "position": "", "dienstzeit": "06:00 - 14:00",
+             "version": 0} for day in range(1, days + 1)]
+
+def test_compact_dienste_behave_like_dicts_and_need_less_memory():
+    plain = dienste(28)
+    compact = compact_dienste(plain)
+
+    assert [shift.to_dict() for shift in compact] == plain
+    assert compact[0]["dienst"] == compact[0].get("dienst") == "F" and "datum" in compact[0]
+    assert [s.datum for s in select_window(compact, "2026-10-27")] == ["2026-10-27", "2026-10-28"]
+    assert schedule_size({"dienste": compact}) < schedule_size({"dienste": plain})
+
+def test_compact_dienste_keeps_dicts_with_extra_fields():
+    assert compact_dienste([{**dienste(1)[0], "username": "max"}]) is None
+    assert isinstance(compact_dienste(dienste(1))[0], Shift)
+
+def test_schedule_size_grows_with_the_number_of_shifts():
+    assert schedule_size({"dienste": dienste(20)}) > schedule_size({"dienste": dienste(10)}) > 0
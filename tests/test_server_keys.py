@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from server_keys import KeyRing, ReencryptionJob, rotate_key, split_blob
+
+def test_first_start_takes_over_the_legacy_key(tmp_path):
+    legacy_key = Fernet.generate_key()
+    (tmp_path / "secret.key").write_bytes(legacy_key)
+    old_blob = Fernet(legacy_key).encrypt(b"alter Stand")
+
+    keyring = KeyRing.load(str(tmp_path / "keys"), str(tmp_path / "secret.key"))
+
+    assert keyring.decrypt(old_blob) == b"alter Stand"
+    assert (tmp_path / "keys" / f"{keyring.active_id}.key").read_bytes() == legacy_key
+    assert (tmp_path / "keys" / "active").read_text() == keyring.active_id
+    assert keyring.needs_reencrypt(old_blob)
+
+def test_read_only_load_needs_existing_keys(tmp_path):
+    with pytest.raises(ValueError):
+        KeyRing.load(str(tmp_path / "keys"), str(tmp_path / "secret.key"), create=False)
+    assert not (tmp_path / "keys").exists()
+
+    (tmp_path / "secret.key").write_bytes(Fernet.generate_key())
+    assert KeyRing.load(str(tmp_path / "keys"), str(tmp_path / "secret.key"), create=False).active_id == "legacy"
+
+def test_rotation_keeps_old_blobs_readable(tmp_path):
+    keys_dir = str(tmp_path / "keys")
+    old = KeyRing.load(keys_dir)
+    old_blob = old.encrypt(b"vor der Rotation")
+
+    new_id = rotate_key(keys_dir)
+    keyring = KeyRing.load(keys_dir)
+    new_blob = keyring.encrypt(b"nach der Rotation")
+
+    assert keyring.active_id == new_id != old.active_id
+    assert split_blob(old_blob)[0] == old.active_id and split_blob(new_blob)[0] == new_id
+    assert keyring.decrypt(old_blob) == b"vor der Rotation"
+    assert keyring.needs_reencrypt(old_blob) and not keyring.needs_reencrypt(new_blob)
+    with pytest.raises(InvalidToken):
+        old.decrypt(new_blob)
+
+def test_reencryption_switches_files_to_the_active_key_and_keeps_times(tmp_path):
+    keys_dir, data_dir = str(tmp_path / "keys"), tmp_path / "user_data"
+    data_dir.mkdir()
+    old = KeyRing.load(keys_dir)
+    path = data_dir / "0123456789abcdef.dat"
+    path.write_bytes(old.encrypt(b"Dienstplan"))
+    os.utime(path, ns=(1_700_000_000_000_000_000, 1_700_000_000_000_000_000))
+    rotate_key(keys_dir)
+    keyring = KeyRing.load(keys_dir)
+
+    job = ReencryptionJob(keyring, str(data_dir), files_per_second=1000)
+    job.run()
+
+    blob = path.read_bytes()
+    assert not keyring.needs_reencrypt(blob)
+    assert keyring.decrypt(blob) == b"Dienstplan"
+    assert os.stat(path).st_mtime_ns == 1_700_000_000_000_000_000
+    assert job.progress()["reencrypted"] == 1 and job.progress()["failed"] == 0
@@ -0,0 +1,134 @@
+import hashlib
+import hmac
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from server_notify import NotificationDispatcher, Subscriber, schedule_event
+
+@pytest.fixture
+def receiver():
+    """Lokaler HTTP-Empfänger; antwortet der Reihe nach mit den Status aus statuses, danach 204"""
+    received = []
+    statuses = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            received.append((self.path, self.headers, body))
+            status = statuses.pop(0) if statuses else 204
+            self.send_response(status)
+            if status == 503:
+                self.send_header("Retry-After", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}", received, statuses
+    httpd.shutdown()
+    httpd.server_close()
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+def dispatcher_for(subscribers):
+    return NotificationDispatcher(lambda: subscribers, batch_window=0.2, retry_base=0.05).start()
+
+def test_webhook_batches_events_and_signs_body(receiver):
+    url, received, _ = receiver
+    dispatcher = dispatcher_for([Subscriber(url + "/hook", secret="geheim")])
+    for token in ("0123456789abcdef", "fedcba9876543210", "0123456789abcdef"):
+        dispatcher.notify(schedule_event(token))
+
+    assert wait_for(lambda: received)
+    dispatcher.stop(5)
+
+    assert len(received) == 1
+    _, headers, body = received[0]
+    payload = json.loads(body)
+    # Mehrfache Änderungen desselben Tokens werden zu einem Ereignis zusammengefasst, ohne Token im Klartext
+    assert sorted(event["id"] for event in payload["events"]) == sorted(
+        hmac.new(b"geheim", token.encode(), hashlib.sha256).hexdigest()
+        for token in ("0123456789abcdef", "fedcba9876543210")
+    )
+    assert b"0123456789abcdef" not in body and b"/calendar/" not in body
+    expected = "sha256=" + hmac.new(b"geheim", body, hashlib.sha256).hexdigest()
+    assert headers["X-Hub-Signature-256"] == expected
+    assert headers["X-VivSync-Event"] == "schedule.changed"
+
+def test_webhook_is_retried_after_server_error(receiver):
+    url, received, statuses = receiver
+    statuses.append(503)
+    dispatcher = dispatcher_for([Subscriber(url + "/hook")])
+    dispatcher.notify(schedule_event("0123456789abcdef"))
+
+    assert wait_for(lambda: len(received) >= 2)
+    dispatcher.stop(5)
+
+    assert [json.loads(body)["attempt"] for _, _, body in received] == [1, 2]
+    assert received[0][2] != received[1][2] and json.loads(received[1][2])["events"] == json.loads(received[0][2])["events"]
+    stats = dispatcher.stats()
+    assert stats["retried"] == 1 and stats["delivered"] == 1 and stats["failed"] == 0
+
+def test_client_errors_are_not_retried(receiver):
+    url, received, statuses = receiver
+    statuses.append(404)
+    dispatcher = dispatcher_for([Subscriber(url + "/hook")])
+    dispatcher.notify(schedule_event("0123456789abcdef"))
+
+    assert wait_for(lambda: dispatcher.stats()["failed"] == 1)
+    time.sleep(0.2)
+    dispatcher.stop(5)
+
+    assert len(received) == 1
+
+def test_websub_publishes_only_matching_feeds(receiver):
+    url, received, _ = receiver
+    hub = Subscriber(url + "/hub", kind="websub", base_url="https://vivsync.com", teams=["station-a"],
+                     publish_feed_urls=True)
+    dispatcher = dispatcher_for([hub])
+    dispatcher.notify(schedule_event("0123456789abcdef", teams=["station-a"]))
+    dispatcher.notify(schedule_event("fedcba9876543210"))
+
+    assert wait_for(lambda: received)
+    dispatcher.stop(5)
+
+    assert len(received) == 1
+    body = received[0][2].decode()
+    assert body.startswith("hub.mode=publish")
+    assert "calendar%2F0123456789abcdef" in body and "team%2Fstation-a" in body
+    assert "fedcba9876543210" not in body
+
+def test_websub_requires_opt_in_for_feed_urls():
+    with pytest.raises(ValueError):
+        Subscriber("https://hub.example.org/", kind="websub", base_url="https://vivsync.com")
+
+def test_slow_subscriber_does_not_delay_the_others():
+    release = threading.Event()
+    delivered = []
+
+    def send(req):
+        if req.full_url == "http://slow.example/hook":
+            release.wait(5)
+        delivered.append(req.full_url)
+        return "ok", None
+
+    subscribers = [Subscriber("http://slow.example/hook"), Subscriber("http://fast.example/hook")]
+    dispatcher = NotificationDispatcher(lambda: subscribers, batch_window=0.05, send=send).start()
+    dispatcher.notify(schedule_event("0123456789abcdef"))
+
+    assert wait_for(lambda: "http://fast.example/hook" in delivered)
+    assert "http://slow.example/hook" not in delivered
+    release.set()
+    assert wait_for(lambda: len(delivered) == 2)
+    dispatcher.stop(5)
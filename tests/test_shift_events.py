@@ -0,0 +1,43 @@
+from datetime import date, timezone
+
+import shift_events
+
+DTSTAMP = "20261019T000000Z"
+
+def test_format_event_with_wrong_types_falls_back_instead_of_raising():
+    warnings = []
+    event = shift_events.format_event(
+        {"datum": "2026-10-20", "dienst": 1, "position": 2, "dienstzeit": 5}, DTSTAMP, on_warning=warnings.append
+    )
+
+    assert "DTSTART;VALUE=DATE:20261020" in event
+    assert "SUMMARY:1 - 2" in event
+    assert len(warnings) == 1
+
+def test_format_event_skips_entries_without_usable_date():
+    warnings = []
+    assert shift_events.format_event({"datum": 20261020, "dienst": "F"}, DTSTAMP, on_warning=warnings.append) is None
+    assert shift_events.format_event({"datum": "2026-13-01", "dienst": "F"}, DTSTAMP) is None
+    assert len(warnings) == 1
+
+def test_render_calendar_keeps_valid_events_next_to_broken_ones():
+    calendar = shift_events.render_calendar([
+        {"datum": None, "dienst": "F"},
+        {"datum": "2026-10-21", "dienst": "N1", "position": "", "dienstzeit": "22:00 - 06:00"},
+    ])
+
+    assert calendar.count("BEGIN:VEVENT") == 1
+    assert "DTEND:20261022T060000" in calendar
+
+def test_render_freebusy_clips_periods_to_the_window():
+    calendar = shift_events.render_freebusy([
+        {"datum": "2026-10-19", "dienst": "N1", "dienstzeit": "22:00 - 06:00"},
+        {"datum": "2026-10-21", "dienst": "N1", "dienstzeit": "22:00 - 06:00"},
+        {"datum": "2026-10-23", "dienst": "F", "dienstzeit": "06:00 - 14:00"},
+    ], timezone.utc, window_start=date(2026, 10, 20), window_end=date(2026, 10, 21))
+
+    busy = [line for line in calendar.split("\r\n") if line.startswith("FREEBUSY")]
+    assert busy == [
+        "FREEBUSY;FBTYPE=BUSY:20261020T000000Z/20261020T060000Z",
+        "FREEBUSY;FBTYPE=BUSY:20261021T220000Z/20261022T000000Z",
+    ]
@@ -16,20 +16,259 @@ import re
 import traceback
 import json
 import locale
+import os
+
+from cancellation import ExtractionCancelled, CancelToken, shutdown_driver
 
 # Config Import
 try:
-    from config import VIVENDI_USERNAME, VIVENDI_PASSWORD, VIVENDI_URL
+    from config import VIVENDI_USERNAME, VIVENDI_PASSWORD, VIVENDI_URL, APP_DATA_DIR
 except ImportError:
     print("WARNUNG: config.py nicht gefunden oder Variablen fehlen.")
     VIVENDI_USERNAME = ""
     VIVENDI_PASSWORD = ""
     VIVENDI_URL = ""
+    APP_DATA_DIR = os.path.join(os.path.expanduser("~"), ".vivsync")
+
+# Phasen der Extraktion mit typischer Dauer in Sekunden (Startwerte für die Fortschrittsanzeige,
+# werden nach jeder erfolgreichen Extraktion durch gemessene Zeiten ersetzt)
+DEFAULT_PHASE_SECONDS = {
+    "driver_start": 4.0,
+    "page_load": 3.0,
+    "login": 6.0,
+    "month_current": 8.0,
+    "month_next": 14.0,
+    "merge": 0.5,
+}
+PHASE_TIMINGS_FILE = os.path.join(APP_DATA_DIR, "phase_timings.json")
+PHASE_SMOOTHING = 0.3  # Gewicht einer neuen Messung im gleitenden Mittel
+METRICS_FILE_MAX_BYTES = 1024 * 1024  # Danach wird die Messwert-Datei nach <datei>.1 rotiert
+
+def load_phase_seconds():
+    """Lädt die gemessenen Phasendauern, fehlende Phasen mit Standardwerten"""
+    seconds = dict(DEFAULT_PHASE_SECONDS)
+    try:
+        with open(PHASE_TIMINGS_FILE, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        for phase, value in stored.items():
+            if phase in seconds and isinstance(value, (int, float)) and value > 0:
+                seconds[phase] = float(value)
+    except (OSError, ValueError):
+        pass
+    return seconds
+
+def save_phase_seconds(measured):
+    """Übernimmt gemessene Phasendauern als gleitendes Mittel"""
+    seconds = load_phase_seconds()
+    for phase, value in measured.items():
+        seconds[phase] = (1 - PHASE_SMOOTHING) * seconds[phase] + PHASE_SMOOTHING * value
+    try:
+        os.makedirs(APP_DATA_DIR, exist_ok=True)
+        with open(PHASE_TIMINGS_FILE, "w", encoding="utf-8") as f:
+            json.dump(seconds, f, indent=2)
+    except OSError:
+        pass
+
+class ExtractionMetrics:
+    """
+    Strukturierte Zeitmessung einer Extraktion: pro Phase Start und Ende,
+    gefundene Elemente, extrahierte Einträge und Anzahl der WebDriver-Aufrufe.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.finished_at = None
+        self.status = "running"
+        self.result_count = 0
+        self.webdriver_calls = 0
+        self.phases = []
+        self.covered_months = []  # Gelesene Monate (YYYY-MM), bestimmen den Zeitraum des Uploads
+        self._current = None
+
+    def begin_phase(self, name):
+        self.end_phase()
+        self._current = {
+            "phase": name,
+            "start": time.time(),
+            "end": None,
+            "duration": None,
+            "elements": 0,
+            "entries": 0,
+            "webdriver_calls": 0,
+            "skipped": False,
+        }
+        self.phases.append(self._current)
+
+    def end_phase(self):
+        if self._current:
+            self._current["end"] = time.time()
+            self._current["duration"] = round(self._current["end"] - self._current["start"], 3)
+            self._current = None
+
+    def skip_phase(self, name):
+        self.end_phase()
+        now = time.time()
+        self.phases.append({
+            "phase": name, "start": now, "end": now, "duration": 0.0,
+            "elements": 0, "entries": 0, "webdriver_calls": 0, "skipped": True,
+        })
+
+    def count_elements(self, count):
+        if self._current:
+            self._current["elements"] += count
+
+    def count_entries(self, count):
+        if self._current:
+            self._current["entries"] += count
+
+    def count_webdriver_call(self):
+        self.webdriver_calls += 1
+        if self._current:
+            self._current["webdriver_calls"] += 1
+
+    def finish(self, status, result_count=0):
+        self.end_phase()
+        self.finished_at = time.time()
+        self.status = status
+        self.result_count = result_count
+
+    def to_dict(self):
+        return {
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration": round((self.finished_at or time.time()) - self.started_at, 3),
+            "status": self.status,
+            "result_count": self.result_count,
+            "webdriver_calls": self.webdriver_calls,
+            "covered_months": self.covered_months,
+            "phases": self.phases,
+        }
+
+    def covered_range(self):
+        """Erster und letzter Tag der gelesenen Monate als ISO-Daten, None wenn keiner gelesen wurde"""
+        if not self.covered_months:
+            return None
+        first = datetime.strptime(min(self.covered_months), "%Y-%m")
+        last_month = datetime.strptime(max(self.covered_months), "%Y-%m")
+        last = (last_month + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        return first.date().isoformat(), last.date().isoformat()
+
+    def summary(self):
+        """Kurze Zusammenfassung für die Statusanzeige"""
+        parts = [f"{p['phase']} {p['duration']:.1f}s" for p in self.phases if not p["skipped"] and p["duration"] is not None]
+        return f"Zeiten: {', '.join(parts)} | WebDriver-Aufrufe: {self.webdriver_calls}"
+
+    def append_jsonl(self, path):
+        """Hängt die Messung als eine JSON-Zeile an die Datei an (rotiert ab METRICS_FILE_MAX_BYTES)"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path) and os.path.getsize(path) >= METRICS_FILE_MAX_BYTES:
+            # Nur eine ältere Datei behalten, damit der Daemon die Platte nicht füllt
+            os.replace(path, path + ".1")
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.to_dict(), ensure_ascii=False) + "\n")
+
+def instrument_driver(driver, metrics):
+    """
+    Zählt alle WebDriver-Kommandos (auch die über WebElements) in metrics.
 
-def extract_dienste(username=None, password=None, use_windows_login=True, status_callback=None, progress_callback=None):
+    Returns:
+        Funktion, die die ursprüngliche execute-Methode wiederherstellt
+    """
+    original_execute = driver.execute
+
+    def counting_execute(driver_command, params=None):
+        metrics.count_webdriver_call()
+        return original_execute(driver_command, params)
+
+    driver.execute = counting_execute
+    return lambda: setattr(driver, "execute", original_execute)
+
+class PhaseProgress:
+    """Fortschritt in Prozent, gewichtet nach der erwarteten Dauer jeder Phase"""
+
+    def __init__(self, progress_callback, phase_seconds=None, metrics=None):
+        self.callback = progress_callback
+        self.metrics = metrics
+        self.weights = phase_seconds or load_phase_seconds()
+        self.total = sum(self.weights.values())
+        self.durations = {}
+        self.done_weight = 0.0
+        self.current = None
+        self.started = None
+        self.last_value = -1
+
+    def _emit(self, value):
+        value = max(0, min(100, int(value)))
+        if value > self.last_value and self.callback:
+            self.last_value = value
+            self.callback(value)
+
+    def start(self, phase):
+        """Beendet die laufende Phase und beginnt die nächste"""
+        self.finish()
+        self.current = phase
+        self.started = time.perf_counter()
+        if self.metrics:
+            self.metrics.begin_phase(phase)
+        self._emit(100 * self.done_weight / self.total)
+
+    def advance(self, fraction):
+        """Fortschritt innerhalb der laufenden Phase (0.0 bis 1.0)"""
+        if self.current:
+            weight = self.weights[self.current] * min(1.0, max(0.0, fraction))
+            self._emit(100 * (self.done_weight + weight) / self.total)
+
+    def skip(self, phase):
+        """Phase wurde nicht benötigt (z.B. Login bei bestehender Sitzung)"""
+        self.finish()
+        self.done_weight += self.weights[phase]
+        if self.metrics:
+            self.metrics.skip_phase(phase)
+
+    def finish(self):
+        if self.current:
+            self.durations[self.current] = time.perf_counter() - self.started
+            self.done_weight += self.weights[self.current]
+            self.current = None
+            if self.metrics:
+                self.metrics.end_phase()
+            self._emit(100 * self.done_weight / self.total)
+
+    def complete(self, save=True):
+        """Schließt die Extraktion ab und merkt sich die gemessenen Dauern"""
+        self.finish()
+        self._emit(100)
+        if save and self.durations:
+            save_phase_seconds(self.durations)
+
+def create_driver():
+    """Startet Chrome mit den für die Extraktion benötigten Optionen"""
+    chrome_options = webdriver.ChromeOptions()
+    chrome_options.add_argument('--disable-extensions')
+    chrome_options.add_argument('--disable-gpu')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    # chrome_options.add_argument('--headless')
+
+    service = Service(ChromeDriverManager().install())
+    return webdriver.Chrome(service=service, options=chrome_options)
+
+def extract_dienste(username=None, password=None, use_windows_login=True, status_callback=None, progress_callback=None, driver=None, cancel_token=None, metrics=None, metrics_file=None):
     """
     Extrahiert Dienste aus Vivendi (aktueller + nächster Monat),
     führt Dienst und Position pro Tag zusammen.
+
+    Wird ein laufender driver übergeben, wird dieser wiederverwendet und nicht
+    beendet; eine noch gültige Anmeldung wird dann übersprungen.
+
+    Mit cancel_token kann die Extraktion abgebrochen werden; geprüft wird
+    zwischen den Phasen und pro Element. Ein Abbruch löst ExtractionCancelled aus.
+
+    Wird ein ExtractionMetrics-Objekt übergeben, wird es mit Zeiten, Element-
+    und WebDriver-Zählern pro Phase gefüllt; mit metrics_file wird die Messung
+    zusätzlich als JSON-Zeile an diese Datei angehängt.
     """
     def update_status(message):
         print(message)
@@ -40,29 +279,39 @@ def extract_dienste(username=None, password=None, use_windows_login=True, status
         if progress_callback:
             progress_callback(value)
 
-    update_status("=== STARTE BROWSER ===")
-    update_progress(10)
+    token = cancel_token or CancelToken()
+    if metrics is None and metrics_file:
+        metrics = ExtractionMetrics()
+    progress = PhaseProgress(update_progress, metrics=metrics)
+    restore_driver = None
+    result_status = "error"
+    result_count = 0
 
-    # Chrome Optionen
-    chrome_options = webdriver.ChromeOptions()
-    chrome_options.add_argument('--disable-extensions')
-    chrome_options.add_argument('--disable-gpu')
-    chrome_options.add_argument('--no-sandbox')
-    chrome_options.add_argument('--disable-dev-shm-usage')
-    # chrome_options.add_argument('--headless')
+    update_status("=== STARTE BROWSER ===")
 
-    driver = None
+    owns_driver = driver is None
 
     try:
         # WebDriver Init
-        try:
-            update_status("Versuche ChromeDriver automatisch zu verwalten...")
-            service = Service(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=chrome_options)
-            update_status("ChromeDriver gestartet.")
-        except Exception as driver_err:
-            update_status(f"FEHLER beim ChromeDriver-Start: {driver_err}")
-            return []
+        if owns_driver:
+            progress.start("driver_start")
+            try:
+                update_status("Versuche ChromeDriver automatisch zu verwalten...")
+                driver = create_driver()
+                token.attach_driver(driver)
+                if metrics:
+                    restore_driver = instrument_driver(driver, metrics)
+                update_status("ChromeDriver gestartet.")
+            except Exception as driver_err:
+                token.check()
+                update_status(f"FEHLER beim ChromeDriver-Start: {driver_err}")
+                return []
+        else:
+            progress.skip("driver_start")
+            if metrics:
+                restore_driver = instrument_driver(driver, metrics)
+            update_status("Verwende laufenden Browser.")
+        token.check()
 
         # Credentials und URL
         vivendi_username = username if username else VIVENDI_USERNAME
@@ -77,73 +326,46 @@ def extract_dienste(username=None, password=None, use_windows_login=True, status
             update_status("WARNUNG: Kein Benutzername!")
 
         # Login Prozess
+        progress.start("page_load")
         update_status(f"\nÖffne Vivendi-Seite: {vivendi_url}")
         driver.get(vivendi_url)
         update_status("Warte auf Seitenaufbau...")
-        update_progress(20)
+        token.check()
 
-        update_status("\n=== BENUTZERFELD ===")
-        username_xpath = "//input[contains(@aria-label, 'Benutzer') or contains(@id, 'Benutzer') or contains(@name, 'user') or @type='text'][1]"
-        try:
-            username_field = WebDriverWait(driver, 30).until(EC.element_to_be_clickable((By.XPATH, username_xpath)))
-            update_status("➔ Benutzerfeld gefunden")
-            username_field.clear()
-            username_field.send_keys(vivendi_username)
-            time.sleep(0.5)
-        except Exception as user_ex:
-            update_status(f"FEHLER Benutzerfeld: {user_ex}")
-            traceback.print_exc()
-            return []
-
-        update_status("\n=== PASSWORTFELD ===")
-        password_xpath = "//input[@type='password' or contains(@aria-label, 'Kennwort') or contains(@id, 'Kennwort') or contains(@name, 'pass')]"
-        try:
-            password_field = WebDriverWait(driver, 20).until(EC.element_to_be_clickable((By.XPATH, password_xpath)))
-            update_status("➔ Passwortfeld gefunden")
-            password_field.clear()
-            password_field.send_keys(vivendi_password)
-            time.sleep(0.5)
-        except Exception as pass_ex:
-            update_status(f"FEHLER Passwortfeld: {pass_ex}")
-            traceback.print_exc()
-            return []
-
-        if use_windows_login:
-            update_status("\n=== WINDOWS LOGIN (TAB) ===")
-            password_field.send_keys(Keys.TAB)
-            time.sleep(0.5)
-            try:
-                driver.switch_to.active_element.send_keys(Keys.TAB)
-                time.sleep(0.5)
-                driver.switch_to.active_element.send_keys(Keys.RETURN)
-            except Exception as tab_err:
-                update_status(f"WARNUNG Tab-Nav: {tab_err}. Fallback: Enter.")
-                password_field.send_keys(Keys.RETURN)
+        if not owns_driver and is_logged_in(driver):
+            progress.skip("login")
+            update_status("Sitzung noch gültig, überspringe Login.")
         else:
-            update_status("Standard-Login (Enter)...")
-            password_field.send_keys(Keys.RETURN)
-
-        update_status("\n=== LOGIN-VERSUCH ===")
-        update_status("Warte auf Login (max 30s)...")
-        update_progress(30)
+            progress.start("login")
+            if not login(driver, vivendi_username, vivendi_password, use_windows_login, update_status):
+                token.check()
+                return []
+        token.check()
 
-        login_success_indicator_xpath = "//pep-calendar | //*[contains(text(),'Dienstplan')] | //*[contains(@class, 'dienstplan-container')]"
-        try:
-            WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.XPATH, login_success_indicator_xpath)))
-            update_status("Login erfolgreich.")
-        except Exception as login_wait_err:
-            update_status(f"WARNUNG Login: {login_wait_err}")
+        # Gelesene Monate zählen nur mit gefundenen Elementen, ein leer geladener
+        # Monat soll beim Zusammenführen auf dem Server keine Dienste entfernen
+        current_month = datetime.now().replace(day=1)
+        next_month = (current_month + timedelta(days=32)).replace(day=1)
 
         # --- Dienste Aktueller Monat ---
+        progress.start("month_current")
         update_status("\n=== DIENSTE AKTUELLER MONAT ===")
-        update_progress(40)
-        time.sleep(5)
+        token.sleep(5)
         dienst_elemente_aktuell = driver.find_elements(By.XPATH, "//pep-dienstliste-dienst")
         update_status(f"Elemente (Aktuell): {len(dienst_elemente_aktuell)}")
-        dienste_aktuell = extract_dienste_from_elements(dienst_elemente_aktuell, driver, update_status)
-        update_progress(60)
+        dienste_aktuell = extract_dienste_from_elements(
+            dienst_elemente_aktuell, driver, update_status,
+            cancel_check=token.check,
+            progress_func=lambda fraction: progress.advance(0.6 + 0.4 * fraction)
+        )
+        if metrics:
+            metrics.count_elements(len(dienst_elemente_aktuell))
+            metrics.count_entries(len(dienste_aktuell))
+            if dienst_elemente_aktuell:
+                metrics.covered_months.append(current_month.strftime("%Y-%m"))
 
         # --- Dienste Nächster Monat ---
+        progress.start("month_next")
         update_status("\n=== NAVIGIERE ZUM FOLGEMONAT ===")
         dienste_naechster = []
         try:
@@ -152,21 +374,34 @@ def extract_dienste(username=None, password=None, use_windows_login=True, status
             update_status("➔ Button Weiter gefunden: " + next_month_xpath)
             next_month_button.click()
             update_status("Warte auf Folgemonat...")
-            time.sleep(5)
-            update_progress(70)
+            token.sleep(5)
+            progress.advance(0.35)
 
             update_status("\n=== DIENSTE FOLGEMONAT ===")
-            time.sleep(5)
+            token.sleep(5)
             dienst_elemente_naechster = driver.find_elements(By.XPATH, "//pep-dienstliste-dienst")
             update_status(f"Elemente (Nächster): {len(dienst_elemente_naechster)}")
-            dienste_naechster = extract_dienste_from_elements(dienst_elemente_naechster, driver, update_status)
-            update_progress(90)
+            dienste_naechster = extract_dienste_from_elements(
+                dienst_elemente_naechster, driver, update_status,
+                cancel_check=token.check,
+                progress_func=lambda fraction: progress.advance(0.7 + 0.3 * fraction)
+            )
+            if metrics:
+                metrics.count_elements(len(dienst_elemente_naechster))
+                metrics.count_entries(len(dienste_naechster))
+                if dienst_elemente_naechster:
+                    metrics.covered_months.append(next_month.strftime("%Y-%m"))
+        except ExtractionCancelled:
+            raise
         except Exception as e:
+            token.check()
             update_status(f"FEHLER Folgemonat: {str(e)}")
             traceback.print_exc()
             update_status("Fahre nur mit akt. Monat fort.")
 
         # --- NEUE LOGIK: Kombinieren und Zusammenführen pro Tag ---
+        token.check()
+        progress.start("merge")
         alle_dienste_roh = dienste_aktuell + dienste_naechster
         update_status("\n=== BEREINIGE UND FÜHRE ZUSAMMEN ===")
         update_status(f"Roh-Anzahl Dienste (aus beiden Monaten): {len(alle_dienste_roh)}")
@@ -238,34 +473,124 @@ def extract_dienste(username=None, password=None, use_windows_login=True, status
             
             update_status(f"\nInsgesamt {len(merged_dienste_final)} finale Diensteinträge extrahiert.")
         
-        update_progress(100)
+        if metrics:
+            metrics.count_entries(len(merged_dienste_final))
+        progress.complete()
+        result_status = "success" if merged_dienste_final else "empty"
+        result_count = len(merged_dienste_final)
         return merged_dienste_final # Gib die zusammengeführte Liste zurück
 
     # Restliche Fehlerbehandlung und finally-Block
+    except ExtractionCancelled:
+        result_status = "cancelled"
+        update_status("\nExtraktion abgebrochen.")
+        raise
     except Exception as e:
+        if token.cancelled:
+            # Fehler durch den beim Abbruch beendeten Browser
+            result_status = "cancelled"
+            update_status("\nExtraktion abgebrochen.")
+            raise ExtractionCancelled() from e
         update_status(f"\n❌ SCHWERER FEHLER im Hauptprozess: {str(e)}")
         traceback.print_exc()
-        update_progress(100)
+        progress.complete(save=False)
         return []
     finally:
-        if driver:
-            try: 
-                driver.quit()
+        if restore_driver:
+            restore_driver()
+        if metrics:
+            metrics.finish(result_status, result_count)
+            update_status(metrics.summary())
+            if metrics_file:
+                try:
+                    metrics.append_jsonl(metrics_file)
+                except OSError as metrics_err:
+                    update_status(f"Messwerte konnten nicht gespeichert werden: {metrics_err}")
+        if driver and owns_driver and not token.release_driver():
+            if shutdown_driver(driver):
                 update_status("Browser geschlossen.")
-            except Exception as quit_err: 
-                update_status(f"Fehler beim Schließen: {quit_err}")
+            else:
+                update_status("Browser reagierte nicht und wurde hart beendet.")
+
+def login(driver, vivendi_username, vivendi_password, use_windows_login, update_status):
+    """Meldet sich auf der geöffneten Vivendi-Seite an. Liefert False bei Fehlern."""
+    update_status("\n=== BENUTZERFELD ===")
+    username_xpath = "//input[contains(@aria-label, 'Benutzer') or contains(@id, 'Benutzer') or contains(@name, 'user') or @type='text'][1]"
+    try:
+        username_field = WebDriverWait(driver, 30).until(EC.element_to_be_clickable((By.XPATH, username_xpath)))
+        update_status("➔ Benutzerfeld gefunden")
+        username_field.clear()
+        username_field.send_keys(vivendi_username)
+        time.sleep(0.5)
+    except Exception as user_ex:
+        update_status(f"FEHLER Benutzerfeld: {user_ex}")
+        traceback.print_exc()
+        return False
+
+    update_status("\n=== PASSWORTFELD ===")
+    password_xpath = "//input[@type='password' or contains(@aria-label, 'Kennwort') or contains(@id, 'Kennwort') or contains(@name, 'pass')]"
+    try:
+        password_field = WebDriverWait(driver, 20).until(EC.element_to_be_clickable((By.XPATH, password_xpath)))
+        update_status("➔ Passwortfeld gefunden")
+        password_field.clear()
+        password_field.send_keys(vivendi_password)
+        time.sleep(0.5)
+    except Exception as pass_ex:
+        update_status(f"FEHLER Passwortfeld: {pass_ex}")
+        traceback.print_exc()
+        return False
+
+    if use_windows_login:
+        update_status("\n=== WINDOWS LOGIN (TAB) ===")
+        password_field.send_keys(Keys.TAB)
+        time.sleep(0.5)
+        try:
+            driver.switch_to.active_element.send_keys(Keys.TAB)
+            time.sleep(0.5)
+            driver.switch_to.active_element.send_keys(Keys.RETURN)
+        except Exception as tab_err:
+            update_status(f"WARNUNG Tab-Nav: {tab_err}. Fallback: Enter.")
+            password_field.send_keys(Keys.RETURN)
+    else:
+        update_status("Standard-Login (Enter)...")
+        password_field.send_keys(Keys.RETURN)
+
+    update_status("\n=== LOGIN-VERSUCH ===")
+    update_status("Warte auf Login (max 30s)...")
+
+    login_success_indicator_xpath = "//pep-calendar | //*[contains(text(),'Dienstplan')] | //*[contains(@class, 'dienstplan-container')]"
+    try:
+        WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.XPATH, login_success_indicator_xpath)))
+        update_status("Login erfolgreich.")
+    except Exception as login_wait_err:
+        update_status(f"WARNUNG Login: {login_wait_err}")
+
+    return True
+
+def is_logged_in(driver, timeout=5):
+    """Prüft, ob der Dienstplan ohne erneute Anmeldung angezeigt wird"""
+    try:
+        WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.XPATH, "//pep-calendar")))
+        return True
+    except Exception:
+        return False
 
 # --- Funktion extract_dienste_from_elements (mit StaleElement-Handling und korrekter Syntax) ---
-def extract_dienste_from_elements(dienst_elemente, driver, status_log_func):
+def extract_dienste_from_elements(dienst_elemente, driver, status_log_func, cancel_check=None, progress_func=None):
     """
     Extrahiert Dienste aus den gefundenen Selenium-Elementen.
     Liefert eine Liste von Dictionaries, die *entweder* 'dienst' *oder* 'position' enthalten können.
+    cancel_check wird vor jedem Element aufgerufen, progress_func danach mit dem Anteil (0.0 bis 1.0).
     """
     dienste = []
     valid_positions = ["Oben", "Unten", "Angebot", "Ingebo"]
     status_log_func(f"--- Starte Extraktion aus {len(dienst_elemente)} Elementen ---")
     
     for i, elem in enumerate(dienst_elemente):
+        if cancel_check:
+            cancel_check()
+        if progress_func and i:
+            progress_func(i / len(dienst_elemente))
         status_log_func(f"\n--- Verarbeite Element {i+1}/{len(dienst_elemente)} ---")
         try: # --- try-Block für StaleElement ---
             # --- Datum extrahieren ---